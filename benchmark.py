@@ -0,0 +1,585 @@
+"""
+Benchmarks for bashbot's hot paths, run against local stand-in services.
+
+Usage:
+    python benchmark.py turn [--turns N] [--embed-latency S] [--chat-latency S]
+    python benchmark.py history [--sizes N,N,...]
+    python benchmark.py prefix [--turns N] [--prompt-eval-latency S]
+    python benchmark.py vectors [--rows N] [--queries N] [--k K]
+    python benchmark.py shards [--months N] [--rows-per-month N]
+    python benchmark.py startup [--runs N]
+    python benchmark.py daemon [--runs N] [--clients N] [--chat-latency S]
+    python benchmark.py sessions [--processes N] [--turns N]
+    python benchmark.py commits [--turns N] [--sync-latency S]
+    python benchmark.py search [--searches N] [--distinct N] [--clients N] [--latency S]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from stand_ins import StandInOllama, StandInSearXNG
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _configure_environment(ollama_url: str, db_path: str):
+    """Points bashbot's config at the stand-ins. Must run before bashbot modules are imported."""
+    os.environ["OLLAMA_HOST"] = ollama_url
+    os.environ["DB_PATH"] = db_path
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+
+def bench_turn(args):
+    """Wall-clock time per agentic turn, sequential vs. overlapped."""
+    tool_call = {"function": {"name": "memory_query", "arguments": {"query": "earlier notes {reply}"}}}
+    with StandInOllama(embed_latency=args.embed_latency, chat_latency=args.chat_latency, tool_call=tool_call) as ollama, \
+            tempfile.TemporaryDirectory() as tmp:
+        _configure_environment(ollama.url, os.path.join(tmp, "unused.db"))
+
+        import asyncio
+        from database import DatabaseManager
+        from embedding import get_cache
+        from run import load_tool_manifests, run_agentic_turn_async
+        from config import TOOLS_DIR
+
+        tool_manifests = load_tool_manifests(TOOLS_DIR)
+        print(f"--- Agentic turn: {args.turns} turns, embed latency {args.embed_latency * 1000:.0f} ms, "
+              f"chat latency {args.chat_latency * 1000:.0f} ms ---")
+
+        results = {}
+        for label, overlap in (("sequential", False), ("overlapped", True)):
+            get_cache().clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                db = DatabaseManager(os.path.join(tmp, f"{label}.db"))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.turns):
+                    asyncio.run(run_agentic_turn_async(f"Benchmark question {label} #{i}", db, tool_manifests, overlap=overlap))
+            results[label] = (time.perf_counter() - start) / args.turns
+            db.close()
+            print(f"  {label:<11} {results[label] * 1000:8.1f} ms/turn")
+
+        speedup = results["sequential"] / results["overlapped"]
+        print(f"  speedup     {speedup:8.2f}x")
+
+
+def bench_prefix(args):
+    """Prompt tokens evaluated per turn with each prompt layout, against a stand-in with a KV cache."""
+    tool_call = {"function": {"name": "memory_query", "arguments": {"query": "reply {reply}"}}}
+    with StandInOllama(tool_call=tool_call, prompt_eval_latency=args.prompt_eval_latency) as ollama, \
+            tempfile.TemporaryDirectory() as tmp:
+        _configure_environment(ollama.url, os.path.join(tmp, "unused.db"))
+
+        import asyncio
+        from database import DatabaseManager
+        from run import load_tool_manifests, run_agentic_turn_async
+        from config import TOOLS_DIR
+
+        tool_manifests = load_tool_manifests(TOOLS_DIR)
+        print(f"--- Prompt layout: {args.turns} turns, {args.prompt_eval_latency * 1000:.2f} ms per evaluated token ---")
+        print(f"  {'layout':<14} {'evaluated/turn':>15} {'ms/turn':>9}")
+        for layout in ("rag_first", "stable_prefix"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                db = DatabaseManager(os.path.join(tmp, f"{layout}.db"))
+            ollama.prompt_evals.clear()
+            ollama.last_messages = []
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.turns):
+                    asyncio.run(run_agentic_turn_async(f"Question {i} about reply {i}", db, tool_manifests, layout=layout))
+            elapsed = (time.perf_counter() - start) / args.turns
+            db.close()
+            print(f"  {layout:<14} {sum(ollama.prompt_evals) / args.turns:>15.1f} {elapsed * 1000:>9.1f}")
+
+
+def _clustered_vectors(rng, count: int, dimension: int, clusters: int):
+    """Unit vectors scattered around random centres, closer to real embeddings than uniform noise."""
+    import numpy as np
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=count)] + 0.8 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_vectors(args):
+    """Size, KNN latency and recall@k of each vector index mode and backend against exact float search."""
+    import sqlite3
+    import numpy as np
+    import sqlite_vec
+    from vector_index import Vec0Index, NumpyIndex, VECTOR_INDEX_MODES
+
+    rng = np.random.default_rng(0)
+    dimension = 768
+    vectors = _clustered_vectors(rng, args.rows + args.queries, dimension, clusters=max(args.rows // 50, 1))
+    data, queries = vectors[:args.rows], vectors[args.rows:]
+
+    print(f"--- Vector index: {args.rows} rows, {args.queries} queries, recall@{args.k} vs. exact float search ---")
+    print(f"  {'mode':<16} {'bytes/row':>10} {'ms/query':>9} {'batched':>9} {'recall@k':>9}")
+    exact = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("float+blob",) + VECTOR_INDEX_MODES:
+            path = os.path.join(tmp, f"{mode}.db")
+            conn = sqlite3.connect(path)
+            conn.enable_load_extension(True)
+            sqlite_vec.load(conn)
+            index = Vec0Index(mode.split("+")[0], dimension=dimension)
+            cursor = conn.cursor()
+            index.create(cursor)
+            if mode == "float+blob":
+                # The layout before schema v5, which also kept every vector in conversations.embedding.
+                cursor.execute("CREATE TABLE embeddings (id INTEGER PRIMARY KEY, embedding BLOB)")
+            for row_id, vector in enumerate(data, 1):
+                index.insert(cursor, row_id, vector)
+                if mode == "float+blob":
+                    cursor.execute("INSERT INTO embeddings VALUES (?, ?)", (row_id, vector.tobytes()))
+            conn.commit()
+            conn.execute("VACUUM")
+
+            results = []
+            start = time.perf_counter()
+            for query in queries:
+                results.append([row_id for row_id, _ in index.search(cursor, query, args.k)])
+            per_query = (time.perf_counter() - start) / len(queries) * 1000
+            conn.close()
+
+            if exact is None:
+                exact = results
+            recall = np.mean([len(set(got) & set(want)) / args.k for got, want in zip(results, exact)])
+            print(f"  {mode:<16} {os.path.getsize(path) / args.rows:>10.0f} {per_query:>9.2f} {'-':>9} {recall:>9.3f}")
+
+        # The NumPy backend mirrors the float vec0 table built above into a memory-mapped matrix.
+        conn = sqlite3.connect(os.path.join(tmp, "float.db"))
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        for dtype in ("float32", "float16"):
+            index = NumpyIndex(Vec0Index("float", dimension=dimension), os.path.join(tmp, "mirror"), dtype=dtype)
+            index.create(conn.cursor())
+            start = time.perf_counter()
+            results = [[row_id for row_id, _ in index.search(None, query, args.k)] for query in queries]
+            per_query = (time.perf_counter() - start) / len(queries) * 1000
+            start = time.perf_counter()
+            index.search_many(None, queries, args.k)
+            batched = (time.perf_counter() - start) / len(queries) * 1000
+            size = os.path.getsize(index.matrix_path) + os.path.getsize(index.ids_path)
+            recall = np.mean([len(set(got) & set(want)) / args.k for got, want in zip(results, exact)])
+            print(f"  {'numpy ' + dtype:<16} {size / args.rows:>10.0f} {per_query:>9.2f} {batched:>9.2f} {recall:>9.3f}")
+        conn.close()
+
+
+def bench_shards(args):
+    """KNN latency as months of history accumulate, one vector table vs. monthly shards."""
+    import sqlite3
+    import numpy as np
+    import sqlite_vec
+    from vector_index import Vec0Index, ShardedIndex
+
+    rng = np.random.default_rng(0)
+    dimension = 768
+    print(f"--- Vector shards: {args.rows_per_month} rows per month, top {args.k}, median ms/query ---")
+    print(f"  {'months':>6} {'single':>8} {'monthly':>8}")
+    conn = sqlite3.connect(":memory:")
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE conversations (id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL)")
+    single, sharded = Vec0Index("float", dimension=dimension), ShardedIndex("float", dimension=dimension)
+    single.create(cursor)
+    sharded.create(cursor)
+
+    row_id = 0
+    for month in range(args.months):
+        period = f"{2000 + month // 12}-{month % 12 + 1:02d}"
+        vectors = _clustered_vectors(rng, args.rows_per_month, dimension, clusters=100)
+        for vector in vectors:
+            row_id += 1
+            cursor.execute("INSERT INTO conversations VALUES (?, ?)", (row_id, f"{period}-01T00:00:00+00:00"))
+            single.insert(cursor, row_id, vector)
+            sharded.insert(cursor, row_id, vector)
+        conn.commit()
+        # Queries resemble what was just said, as the agent's usually do.
+        queries = vectors[rng.integers(len(vectors), size=20)]
+        single_ms = _time_call(lambda: [single.search(cursor, query, args.k) for query in queries], repeats=3) / 1000 / len(queries)
+        sharded_ms = _time_call(lambda: [sharded.search(cursor, query, args.k) for query in queries], repeats=3) / 1000 / len(queries)
+        print(f"  {month + 1:>6} {single_ms:>8.2f} {sharded_ms:>8.2f}")
+    conn.close()
+
+
+def _import_times(env: dict, module: str) -> tuple[float, list[tuple[str, float]]]:
+    """Cumulative milliseconds of importing `module`, and of each of its direct imports, from python -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, cwd=PROJECT_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    total, times = 0.0, []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested imports indented by two more spaces.
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name, depth = fields[2].strip(), (len(fields[2]) - len(fields[2].lstrip()) - 1) // 2
+        if depth == 0 and name == module:
+            total = int(fields[1]) / 1000
+        elif depth == 1:
+            times.append((name, int(fields[1]) / 1000))
+    return total, times
+
+
+def _one_shot_runs(ollama: StandInOllama, command: list[str], env: dict, runs: int) -> tuple[list[float], list[float]]:
+    """Launches `command "<prompt>"` runs times; returns the ms to each run's first Ollama request and to its exit."""
+    first_request, total = [], []
+    for i in range(runs):
+        ollama.request_log.clear()
+        start = time.perf_counter()
+        subprocess.run(command + [f"Startup question #{i}"], env=env, stdout=subprocess.DEVNULL, check=True)
+        total.append((time.perf_counter() - start) * 1000)
+        first_request.append((ollama.request_log[0][1] - start) * 1000)
+    return first_request, total
+
+
+def bench_startup(args):
+    """Time from launching a one-shot run to its first Ollama request, through run.py and run.sh, and what the imports cost."""
+    with StandInOllama() as ollama, tempfile.TemporaryDirectory() as tmp:
+        # VIRTUAL_ENV makes run.sh use this interpreter; no daemon, so every run starts from scratch.
+        env = dict(os.environ, OLLAMA_HOST=ollama.url, DB_PATH=os.path.join(tmp, "startup.db"), EMBEDDING_CACHE_PATH="",
+                   VIRTUAL_ENV=sys.prefix, DAEMON_SOCKET="")
+        launchers = {"run.py": [sys.executable, os.path.join(PROJECT_DIR, "run.py")],
+                     "run.sh": ["bash", os.path.join(PROJECT_DIR, "run.sh")]}
+        # The first run creates the database; the measured ones find its schema current, as scripted calls do.
+        subprocess.run(launchers["run.py"] + ["Warm-up question"], env=env, stdout=subprocess.DEVNULL, check=True)
+
+        print(f"--- One-shot startup: {args.runs} runs, median ms ---")
+        print(f"  {'launcher':<10} {'first request':>14} {'whole run':>10}")
+        for label, command in launchers.items():
+            first_request, total = _one_shot_runs(ollama, command, env, args.runs)
+            print(f"  {label:<10} {statistics.median(first_request):>14.1f} {statistics.median(total):>10.1f}")
+
+        import_total, imports = _import_times(env, "run")
+    print(f"  import run: {import_total:.1f} ms, slowest direct imports:")
+    for name, ms in sorted(imports, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"    {name:<24} {ms:8.1f}")
+
+
+def bench_daemon(args):
+    """One-shot latency with and without the daemon, and how concurrent sessions share it."""
+    with StandInOllama(chat_latency=args.chat_latency) as ollama, tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "bashbot.sock")
+        env = dict(os.environ, OLLAMA_HOST=ollama.url, DB_PATH=os.path.join(tmp, "daemon.db"), EMBEDDING_CACHE_PATH="",
+                   DAEMON_SOCKET=socket_path)
+        run_py = [sys.executable, os.path.join(PROJECT_DIR, "run.py")]
+
+        print(f"--- Daemon: {args.runs} one-shot runs, chat latency {args.chat_latency * 1000:.0f} ms, median ms ---")
+        print(f"  {'mode':<10} {'first request':>14} {'whole run':>10}")
+        first_request, total = _one_shot_runs(ollama, run_py, dict(env, DAEMON_SOCKET=""), args.runs)
+        print(f"  {'local':<10} {statistics.median(first_request):>14.1f} {statistics.median(total):>10.1f}")
+
+        daemon = subprocess.Popen([sys.executable, os.path.join(PROJECT_DIR, "daemon.py")], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(socket_path):
+                if daemon.poll() is not None:
+                    raise RuntimeError("the daemon exited during startup")
+                time.sleep(0.01)
+            first_request, total = _one_shot_runs(ollama, run_py, env, args.runs)
+            print(f"  {'daemon':<10} {statistics.median(first_request):>14.1f} {statistics.median(total):>10.1f}")
+
+            # Concurrent sessions overlap their waits on Ollama instead of queueing behind each other.
+            start = time.perf_counter()
+            clients = [subprocess.Popen(run_py + [f"Concurrent question #{i}"], env=env, stdout=subprocess.DEVNULL)
+                       for i in range(args.clients)]
+            for client in clients:
+                client.wait()
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {args.clients} concurrent clients: {elapsed:.1f} ms in all, {elapsed / args.clients:.1f} ms per turn")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+# One agent session: a turn id, a retrieval, the history fetch and two saved messages per turn.
+_SESSION_SCRIPT = """
+import json, sqlite3, sys, time
+import numpy as np
+from database import DatabaseManager
+db_path, turns, start_at = sys.argv[1], int(sys.argv[2]), float(sys.argv[3])
+db = DatabaseManager(db_path)
+vector = np.random.default_rng().standard_normal(768).astype(np.float32)
+vector /= np.linalg.norm(vector)
+errors = 0
+time.sleep(max(start_at - time.time(), 0))
+for i in range(turns):
+    try:
+        turn_id = db.get_new_turn_id()
+        db.add_message(turn_id, "user", f"Session question {i}", embedding=vector.tolist())
+        db.find_similar_memories(vector, top_k=8, query_text=f"session question {i}")
+        db.get_long_term_history(turn_id, limit=64)
+        db.add_message(turn_id, "assistant", f"Session answer {i}", embedding=vector.tolist())
+    except sqlite3.OperationalError:
+        errors += 1
+finished_at = time.time()
+db.close()
+print(json.dumps({"errors": errors, "finished_at": finished_at}))
+"""
+
+
+def bench_sessions(args):
+    """Throughput of several agent processes sharing one database, rollback journal vs. WAL with a reader pool."""
+    print(f"--- Shared database: {args.processes} processes x {args.turns} turns ---")
+    print(f"  {'journal':<8} {'readers':>8} {'messages/s':>11} {'errors':>7}")
+    for journal_mode, readers in (("delete", 0), ("wal", 4)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "shared.db")
+            env = dict(os.environ, SQLITE_JOURNAL_MODE=journal_mode, SQLITE_READ_POOL_SIZE=str(readers), EMBEDDING_CACHE_PATH="")
+            # Create the schema first so the sessions only contend on their own work.
+            subprocess.run([sys.executable, "-c", f"from database import DatabaseManager; DatabaseManager({db_path!r}).close()"],
+                           env=env, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, check=True)
+            start_at = time.time() + 1.0
+            sessions = [subprocess.Popen([sys.executable, "-c", _SESSION_SCRIPT, db_path, str(args.turns), str(start_at)],
+                                         env=env, cwd=PROJECT_DIR, stdout=subprocess.PIPE, text=True)
+                        for _ in range(args.processes)]
+            results = [json.loads(session.communicate()[0]) for session in sessions]
+        elapsed = max(result['finished_at'] for result in results) - start_at
+        messages = 2 * args.processes * args.turns
+        print(f"  {journal_mode:<8} {readers:>8} {messages / elapsed:>11.1f} {sum(r['errors'] for r in results):>7}")
+
+
+def bench_commits(args):
+    """
+    Messages/sec saving agent turns with a commit per message, a commit per iteration, and a
+    commit per turn at the batch durability, on this disk and on a simulated slow-sync one.
+
+    The database runs WAL with synchronous=FULL, the profile that syncs the WAL on every
+    commit. The slow disk is modelled by sleeping --sync-latency (8 ms: a 7200 rpm disk's
+    rotational delay plus a short seek) inside each commit that syncs, i.e. at FULL or EXTRA;
+    NORMAL and OFF commits don't sync under WAL, and checkpoint syncs are left out.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_environment("http://127.0.0.1:9", os.path.join(tmp, "unused.db"))
+        os.environ["SQLITE_SYNCHRONOUS"] = "full"
+        import numpy as np
+        from config import SQLITE_BATCH_DURABILITY, SQLITE_SYNCHRONOUS
+        from database import DatabaseManager
+
+        class SlowSyncDatabase(DatabaseManager):
+            """Counts commits and adds a disk sync's latency to each one that would sync."""
+            sync_latency = 0.0
+            commits = 0
+
+            @contextlib.contextmanager
+            def _writing(self, durability: str = None):
+                with self._lock:
+                    with super()._writing(durability) as conn:
+                        yield conn
+                    self.commits += 1
+                    if (durability or SQLITE_SYNCHRONOUS) in ("full", "extra"):
+                        time.sleep(self.sync_latency)
+
+        vector = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+        vector = (vector / np.linalg.norm(vector)).tolist()
+        tool_calls = [{"function": {"name": "bash", "arguments": {"command": "df -h"}}}] * args.tools
+
+        def save_step(target, turn_id: int, step: int):
+            # `target` is the DatabaseManager itself or a unit of work; both take the same calls.
+            target.record_turn_usage(turn_id, 1000, 100)
+            final = step == args.iterations
+            target.add_message(turn_id, "assistant", f"Step {step} of turn {turn_id}.", None if final else tool_calls,
+                               thoughts="Checking the disks.", embedding=vector)
+            if not final:
+                for tool in range(args.tools):
+                    target.add_message(turn_id, "tool", f"/dev/sda{tool} {turn_id % 100}% used")
+
+        def per_message(db):
+            turn_id = db.get_new_turn_id()
+            db.add_message(turn_id, "user", f"Question {turn_id}", embedding=vector)
+            for step in range(args.iterations + 1):
+                save_step(db, turn_id, step)
+
+        def per_iteration(db):
+            turn_id = db.get_new_turn_id()
+            db.add_message(turn_id, "user", f"Question {turn_id}", embedding=vector)
+            for step in range(args.iterations + 1):
+                with db.transaction() as unit:
+                    save_step(unit, turn_id, step)
+
+        def per_turn_batch(db):
+            turn_id = db.get_new_turn_id()
+            with db.transaction(durability=SQLITE_BATCH_DURABILITY) as unit:
+                unit.add_message(turn_id, "user", f"Question {turn_id}", embedding=vector)
+                for step in range(args.iterations + 1):
+                    save_step(unit, turn_id, step)
+
+        messages_per_turn = 2 + args.iterations * (1 + args.tools)
+        print(f"--- Commits: {args.turns} turns of {messages_per_turn} messages, WAL + synchronous=FULL ---")
+        print(f"  {'grouping':<32} {'commits/turn':>12} {'msgs/s here':>12} {f'msgs/s {args.sync_latency * 1000:g} ms sync':>18}")
+        groupings = (("per message", per_message), ("per iteration", per_iteration),
+                     (f"per turn, durability={SQLITE_BATCH_DURABILITY}", per_turn_batch))
+        for label, save_turn in groupings:
+            rates = []
+            for latency in (0.0, args.sync_latency):
+                db_path = os.path.join(tmp, f"commits-{len(rates)}-{save_turn.__name__}.db")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    db = SlowSyncDatabase(db_path, write_behind=False)
+                db.sync_latency, db.commits = latency, 0
+                start = time.perf_counter()
+                for _ in range(args.turns):
+                    save_turn(db)
+                rates.append(args.turns * messages_per_turn / (time.perf_counter() - start))
+                commits = db.commits / args.turns
+                db.close()
+            print(f"  {label:<32} {commits:>12.0f} {rates[0]:>12.0f} {rates[1]:>18.0f}")
+
+
+def bench_search(args):
+    """Upstream requests and web_search latency without and with the search cache."""
+    with StandInSearXNG(latency=args.latency) as searxng, tempfile.TemporaryDirectory() as tmp:
+        os.environ["SEARXNG_HOST"] = searxng.url
+        from concurrent.futures import ThreadPoolExecutor
+        from search_cache import SearchCache
+        import tools
+
+        def timed_search(query: str) -> float:
+            start = time.perf_counter()
+            tools.web_search(query)
+            return time.perf_counter() - start
+
+        # A few queries asked over and over, as a model repeats them across loop iterations and turns.
+        workload = [f"how to fix error {i % args.distinct}" for i in range(args.searches)]
+        print(f"--- web_search: {args.searches} searches of {args.distinct} queries, {args.clients} at a time, "
+              f"{args.latency * 1000:.0f} ms upstream ---")
+        print(f"  {'':<9} {'upstream':>9} {'mean ms':>8} {'hits':>6} {'misses':>7} {'coalesced':>10}")
+        # A zero TTL caches nothing, but concurrent identical searches still share a request.
+        for label, ttl in (("no cache", 0.0), ("cache", 3600.0)):
+            tools._search_cache = SearchCache(os.path.join(tmp, f"{label}.db"), ttl=ttl, stale=0.0)
+            before = searxng.counters.get("search", 0)
+            with ThreadPoolExecutor(args.clients) as pool:
+                latencies = list(pool.map(timed_search, workload))
+            counters = tools.get_search_cache().counters()
+            print(f"  {label:<9} {searxng.counters.get('search', 0) - before:>9} {statistics.mean(latencies) * 1000:>8.1f} "
+                  f"{counters['hits']:>6} {counters['misses']:>7} {counters['coalesced']:>10}")
+            tools.get_search_cache().close()
+
+
+def _time_call(func, repeats: int = 50) -> float:
+    """Median wall-clock time of func() in microseconds."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1_000_000
+
+
+def _grow_conversations(db, target_rows: int, messages_per_turn: int = 4):
+    """Bulk-appends synthetic turns (no embeddings) until conversations holds target_rows rows."""
+    cursor = db.conn.cursor()
+    rows = cursor.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    timestamp = datetime.now(timezone.utc).isoformat()
+    roles = ["user", "assistant", "tool", "assistant"]
+    while rows < target_rows:
+        batch_turns = min(10_000, (target_rows - rows + messages_per_turn - 1) // messages_per_turn)
+        messages = []
+        for _ in range(batch_turns):
+            turn_id = cursor.execute("INSERT INTO turns (started_at, message_count) VALUES (?, ?)", (timestamp, messages_per_turn)).lastrowid
+            for m in range(messages_per_turn):
+                messages.append((turn_id, timestamp, roles[m % len(roles)], f"Synthetic message {m} of turn {turn_id} about host-{turn_id % 997}."))
+        cursor.executemany("INSERT INTO conversations (turn_id, timestamp, role, content) VALUES (?, ?, ?, ?)", messages)
+        db.conn.commit()
+        rows += len(messages)
+    return rows
+
+
+def bench_history(args):
+    """Latency of per-turn queries as conversations grows; they should stay flat."""
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_environment("http://127.0.0.1:9", os.path.join(tmp, "unused.db"))
+        from database import DatabaseManager
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = DatabaseManager(os.path.join(tmp, "history.db"))
+
+        sizes = [int(size) for size in args.sizes.split(",")]
+        print("--- Turn metadata queries (median microseconds per call) ---")
+        print(f"  {'rows':>9} {'new_turn_id':>12} {'long_term_history':>18} {'messages_for_turn':>18} {'legacy MAX scan':>16}")
+        for size in sizes:
+            _grow_conversations(db, size)
+            middle_turn = db.conn.execute("SELECT id FROM turns ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM turns)").fetchone()[0]
+            new_turn = _time_call(db.get_new_turn_id, repeats=20)
+            current_turn = db.conn.execute("SELECT MAX(id) FROM turns").fetchone()[0]
+            history = _time_call(lambda: db.get_long_term_history(current_turn_id=current_turn, limit=64))
+            messages = _time_call(lambda: db.get_messages_for_turn(turn_id=middle_turn))
+            legacy = _time_call(lambda: db.conn.execute("SELECT MAX(turn_id) FROM conversations NOT INDEXED").fetchone(), repeats=5)
+            print(f"  {size:>9} {new_turn:>12.1f} {history:>18.1f} {messages:>18.1f} {legacy:>16.1f}")
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bashbot against local stand-in services.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    turn = subparsers.add_parser("turn", help="Agentic turn latency, sequential vs. overlapped.")
+    turn.add_argument("--turns", type=int, default=5)
+    turn.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request.")
+    turn.add_argument("--chat-latency", type=float, default=0.2, help="Seconds before the chat stream starts.")
+    turn.set_defaults(func=bench_turn)
+
+    history = subparsers.add_parser("history", help="Turn-id and history query latency as the table grows.")
+    history.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated row counts to measure at.")
+    history.set_defaults(func=bench_history)
+
+    prefix = subparsers.add_parser("prefix", help="Prompt tokens evaluated per turn, rag_first vs. stable_prefix layout.")
+    prefix.add_argument("--turns", type=int, default=10)
+    prefix.add_argument("--prompt-eval-latency", type=float, default=0.0005, help="Seconds per evaluated prompt token.")
+    prefix.set_defaults(func=bench_prefix)
+
+    vectors = subparsers.add_parser("vectors", help="Size, latency and recall@k of the vector index modes and the NumPy backend.")
+    vectors.add_argument("--rows", type=int, default=50000)
+    vectors.add_argument("--queries", type=int, default=100)
+    vectors.add_argument("--k", type=int, default=8)
+    vectors.set_defaults(func=bench_vectors)
+
+    shards = subparsers.add_parser("shards", help="KNN latency as history grows, single table vs. monthly shards.")
+    shards.add_argument("--months", type=int, default=12)
+    shards.add_argument("--rows-per-month", type=int, default=2000)
+    shards.add_argument("--k", type=int, default=8)
+    shards.set_defaults(func=bench_shards)
+
+    startup = subparsers.add_parser("startup", help="Time to the first Ollama request of a one-shot run, and its import costs.")
+    startup.add_argument("--runs", type=int, default=10)
+    startup.add_argument("--top", type=int, default=8, help="How many of the slowest imports to list.")
+    startup.set_defaults(func=bench_startup)
+
+    daemon = subparsers.add_parser("daemon", help="One-shot latency with and without the daemon, and concurrent sessions.")
+    daemon.add_argument("--runs", type=int, default=10)
+    daemon.add_argument("--clients", type=int, default=4)
+    daemon.add_argument("--chat-latency", type=float, default=0.2)
+    daemon.set_defaults(func=bench_daemon)
+
+    sessions = subparsers.add_parser("sessions", help="Messages/sec of several processes sharing one database.")
+    sessions.add_argument("--processes", type=int, default=4)
+    sessions.add_argument("--turns", type=int, default=100)
+    sessions.set_defaults(func=bench_sessions)
+
+    commits = subparsers.add_parser("commits", help="Messages/sec with per-message vs. grouped commits on a slow-sync disk.")
+    commits.add_argument("--turns", type=int, default=30)
+    commits.add_argument("--iterations", type=int, default=2, help="Tool-calling iterations per turn, before the final answer.")
+    commits.add_argument("--tools", type=int, default=2, help="Tool calls per iteration.")
+    commits.add_argument("--sync-latency", type=float, default=0.008, help="Seconds one disk sync takes on the simulated disk.")
+    commits.set_defaults(func=bench_commits)
+
+    search = subparsers.add_parser("search", help="web_search upstream requests and latency, without and with the result cache.")
+    search.add_argument("--searches", type=int, default=200)
+    search.add_argument("--distinct", type=int, default=20, help="Different queries among the searches.")
+    search.add_argument("--clients", type=int, default=4, help="Searches running at once.")
+    search.add_argument("--latency", type=float, default=0.3, help="Seconds SearXNG takes per search.")
+    search.set_defaults(func=bench_search)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+The client side of daemon.py: forwards a one-shot prompt or an interactive session to a
+running daemon over its Unix socket and prints what it streams back.
+
+Only the standard library and config are imported here, so a forwarded call skips the
+imports and setup run.py would otherwise pay for.
+"""
+import json
+import socket
+import sys
+
+from config import DAEMON_SOCKET
+
+
+def connect(socket_path: str = DAEMON_SOCKET) -> socket.socket | None:
+    """Connects to the daemon, or returns None if none is listening."""
+    if not socket_path:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        # No socket file, or a stale one left by a daemon that has exited.
+        sock.close()
+        return None
+    return sock
+
+
+def send_prompt(stream, prompt: str, out=None, err=None) -> dict:
+    """
+    Sends one prompt and writes the turn's streamed output to out and err as it arrives.
+
+    Args:
+        stream: A text-mode file over the daemon connection, from socket.makefile("rw").
+
+    Returns:
+        The daemon's final message for the turn, e.g. {"done": true, "turn_id": 42}.
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    stream.write(json.dumps({"prompt": prompt}) + "\n")
+    stream.flush()
+    for line in stream:
+        message = json.loads(line)
+        if message.get('done'):
+            return message
+        target = err if 'err' in message else out
+        target.write(message.get('err', message.get('out', '')))
+        target.flush()
+    raise ConnectionError("the daemon closed the connection mid-turn")
+
+
+def run_interactive_session(stream):
+    """The interactive mode of run.py, with every turn run by the daemon in one session."""
+    print("--- Bashbot Interactive Mode ---")
+    print("Type 'exit' or 'quit' to end the session.")
+
+    while True:
+        try:
+            prompt = input("\n> ")
+            if prompt.lower() in ["exit", "quit"]:
+                break
+            if not prompt:
+                continue
+            send_prompt(stream, prompt)
+        except (KeyboardInterrupt, EOFError):
+            print("\nExiting...")
+            break
+
+
+def forward(argv: list[str]) -> int | None:
+    """
+    Runs run.py's command line through the daemon: one argument is a one-shot prompt, none
+    starts an interactive session.
+
+    Returns:
+        The exit status, or None if run.py should handle the call itself, because no daemon
+        is listening or the arguments are flags such as --agent or --help.
+    """
+    if len(argv) > 1 or (argv and argv[0].startswith("-")):
+        return None
+    sock = connect()
+    if sock is None:
+        return None
+    with sock, sock.makefile("rw", encoding="utf-8") as stream:
+        try:
+            if argv:
+                send_prompt(stream, argv[0])
+            else:
+                run_interactive_session(stream)
+        except (OSError, ValueError) as e:
+            print(f"\nError: Lost the connection to the bashbot daemon: {e}", file=sys.stderr)
+            return 1
+    return 0
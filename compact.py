@@ -0,0 +1,281 @@
+"""
+Compacts old conversation turns into summaries, so a long-lived memory stays cheap to search and inject.
+
+Usage:
+    python compact.py [--after-days N] [--keep-turns N] [--source-tokens N] [--retire-vectors] [--dry-run]
+    python compact.py --status
+
+Turns older than COMPACT_AFTER_DAYS, sparing the newest COMPACT_KEEP_TURNS, are packed in order
+into groups of about COMPACT_SOURCE_TOKENS, and COMPACT_MODEL writes one summary per group. The
+summary is embedded into vec_summaries and its turns point at it. Memory search then returns
+the summary in place of those turns' messages; memory_query drills into the messages when it
+needs their exact wording. The messages themselves stay, with their keyword search.
+
+--retire-vectors also removes the messages' vectors once their turns are compacted, shrinking
+the vector index. They are marked 'compacted', so nothing embeds them again; a NumPy mirror
+hides them at once and drops them at the next `maintenance.py vacuum`.
+Each group is committed on its own, so an interrupted run carries on with the next group.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+from config import (DB_PATH, OLLAMA_HOST, COMPACT_MODEL, COMPACT_AFTER_DAYS, COMPACT_KEEP_TURNS, COMPACT_SOURCE_TOKENS,
+                    COMPACT_SUMMARY_WORDS)
+from context import CHARS_PER_TOKEN, estimate_tokens
+from database import DatabaseManager
+from embedding import get_embedding
+from http_client import get_client
+
+SUMMARY_PROMPT = (
+        "You condense an assistant's past conversation turns into a memory note for later retrieval. "
+        "Keep what a future turn may need: facts the user stated, decisions, commands and fixes that worked, "
+        "names, paths, versions, numbers and identifiers. Leave out greetings and reasoning. "
+        "Write plain sentences, at most {words} words, with no preamble."
+        )
+# Characters of each tool output that go into the transcript; the rest is rarely worth keeping.
+TOOL_OUTPUT_CHARS = 1200
+
+# Turns that are due: not yet compacted, outside the newest ones, and with no message since the cutoff.
+# Message timestamps rather than started_at, so imported history ages by when it was written.
+# `previous` is the turn just before, due or not, so groups never span a turn that isn't due.
+DUE_TURNS = """
+            SELECT t.id, SUM(c.token_count) AS tokens, (SELECT MAX(p.id) FROM turns p WHERE p.id < t.id) AS previous
+            FROM turns t JOIN conversations c ON c.turn_id = t.id
+            WHERE t.summary_id IS NULL AND t.id <= (SELECT MAX(id) FROM turns) - ?
+            GROUP BY t.id HAVING MAX(c.timestamp) < ?
+            ORDER BY t.id
+            """
+
+
+def due_groups(db: DatabaseManager, args) -> list[tuple[int, int, int]]:
+    """
+    (first turn, last turn, tokens) per group of adjacent due turns, each about source_tokens.
+    compact_group marks every turn in the range, so a turn that isn't due always ends a group.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=args.after_days)).isoformat()
+    with db._reading() as conn:
+        turns = conn.execute(DUE_TURNS, (args.keep_turns, cutoff)).fetchall()
+    groups = []
+    for turn_id, tokens, previous in turns:
+        if groups and previous == groups[-1][1] and groups[-1][2] + (tokens or 0) <= args.source_tokens:
+            first, _, total = groups[-1]
+            groups[-1] = (first, turn_id, total + (tokens or 0))
+        else:
+            groups.append((turn_id, turn_id, tokens or 0))
+    return groups
+
+
+def transcript(db: DatabaseManager, first: int, last: int) -> str:
+    """The group's messages as "[Turn N] role: text" lines, tool outputs cut short."""
+    with db._reading() as conn:
+        rows = conn.execute(
+                "SELECT turn_id, role, content, tool_calls FROM conversations WHERE turn_id BETWEEN ? AND ? ORDER BY id",
+                (first, last)
+                ).fetchall()
+    lines = []
+    for row in rows:
+        content = row['content']
+        if row['role'] == 'tool' and len(content) > TOOL_OUTPUT_CHARS:
+            content = f"{content[:TOOL_OUTPUT_CHARS]} [...]"
+        if row['tool_calls']:
+            calls = ", ".join(call['function']['name'] for call in json.loads(row['tool_calls']))
+            content = f"{content} (called {calls})".strip()
+        lines.append(f"[Turn {row['turn_id']}] {row['role']}: {content}")
+    return "\n".join(lines)
+
+
+def split_transcript(text: str, max_chars: int) -> list[str]:
+    """Cuts a transcript into pieces of at most max_chars, at line breaks where a line fits."""
+    pieces, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + 1 + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def summarize(text: str, model: str, words: int) -> str:
+    """Asks the model for the summary, reading its streamed reply and ignoring any thinking."""
+    payload = {
+            "model": model,
+            "messages": [{"role": "system", "content": SUMMARY_PROMPT.format(words=words)}, {"role": "user", "content": text}],
+            "stream": True,
+            }
+    parts = []
+    with get_client().stream("POST", f"{OLLAMA_HOST}/api/chat", json=payload) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                parts.append(json.loads(line).get('message', {}).get('content', ''))
+    return "".join(parts).strip()
+
+
+def compact_group(db: DatabaseManager, first: int, last: int, args) -> tuple[int, int] | None:
+    """Summarizes and commits one group. Returns (source tokens, summary tokens), or None if skipped."""
+    # A turn bigger than the budget is summarized a piece at a time, then the pieces' notes together,
+    # so nothing in a range marked compacted went unread.
+    pieces = split_transcript(transcript(db, first, last), args.source_tokens * CHARS_PER_TOKEN)
+    notes = [summarize(piece, args.model, args.summary_words) for piece in pieces]
+    summary = notes[0] if len(notes) == 1 else ""
+    if len(notes) > 1 and all(notes):
+        summary = summarize("\n\n".join(notes), args.model, args.summary_words)
+    model = db.embedding_model
+    vector = get_embedding(summary, model) if summary else None
+    if not vector:
+        print(f"Warning: turns {first}-{last} skipped: no summary or no embedding for it.", file=sys.stderr)
+        return None
+
+    with db._writing() as conn:
+        cursor = conn.cursor()
+        if db.embedding_model != model:
+            print(f"Warning: turns {first}-{last} skipped: reindex.py switched models meanwhile.", file=sys.stderr)
+            return None
+        if cursor.execute("SELECT 1 FROM turns WHERE id BETWEEN ? AND ? AND summary_id IS NOT NULL", (first, last)).fetchone():
+            # Another run got there first.
+            return None
+        messages = cursor.execute("SELECT id, token_count FROM conversations WHERE turn_id BETWEEN ? AND ? ORDER BY id",
+                                  (first, last)).fetchall()
+        tokens = estimate_tokens(summary)
+        cursor.execute(
+                """
+                INSERT INTO summaries (source_conversation_ids, summary_content, created_at, first_turn_id, last_turn_id, token_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (json.dumps([row['id'] for row in messages]), summary, datetime.now(timezone.utc).isoformat(), first, last, tokens)
+                )
+        summary_id = cursor.lastrowid
+        db.summary_index.insert(cursor, summary_id, vector)
+        cursor.execute("UPDATE turns SET summary_id = ? WHERE id BETWEEN ? AND ?", (summary_id, first, last))
+    return sum(row['token_count'] or 0 for row in messages), tokens
+
+
+def retire_vectors(db: DatabaseManager, batch_size: int = 500) -> int:
+    """Removes the vectors of every compacted turn's messages. Returns how many were removed."""
+    retired = 0
+    while True:
+        with db._writing() as conn:
+            cursor = conn.cursor()
+            row_ids = [row[0] for row in cursor.execute(
+                    """
+                    SELECT c.id FROM conversations c JOIN turns t ON t.id = c.turn_id
+                    WHERE t.summary_id IS NOT NULL AND c.embedding_state IN ('indexed', 'pending')
+                    LIMIT ?
+                    """,
+                    (batch_size,)
+                    ).fetchall()]
+            if not row_ids:
+                break
+            db.vector_index.delete(cursor, row_ids)
+            # 'pending' rows too, so the embedding worker leaves them alone.
+            cursor.executemany("UPDATE conversations SET embedding_state = 'compacted' WHERE id = ?", [(row_id,) for row_id in row_ids])
+        retired += len(row_ids)
+    return retired
+
+
+def show_status(db: DatabaseManager, args):
+    with db._reading() as conn:
+        summaries, summary_tokens = conn.execute("SELECT COUNT(*), COALESCE(SUM(token_count), 0) FROM summaries").fetchone()
+        compacted, source_tokens = conn.execute(
+                """
+                SELECT COUNT(DISTINCT t.id), COALESCE(SUM(c.token_count), 0)
+                FROM turns t JOIN conversations c ON c.turn_id = t.id WHERE t.summary_id IS NOT NULL
+                """).fetchone()
+        turns = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        retired = conn.execute("SELECT COUNT(*) FROM conversations WHERE embedding_state = 'compacted'").fetchone()[0]
+    print(f"{summaries} summaries ({summary_tokens} tokens) cover {compacted} of {turns} turns ({source_tokens} tokens).")
+    print(f"{retired} message vectors retired; {len(due_groups(db, args))} groups of turns due for compaction.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize old turns of bashbot's memory.")
+    parser.add_argument("--db", default=DB_PATH, help="Database to compact.")
+    parser.add_argument("--after-days", type=int, default=COMPACT_AFTER_DAYS, help="Only compact turns older than this.")
+    parser.add_argument("--keep-turns", type=int, default=COMPACT_KEEP_TURNS, help="Newest turns never compacted.")
+    parser.add_argument("--source-tokens", type=int, default=COMPACT_SOURCE_TOKENS, help="Message tokens summarized together.")
+    parser.add_argument("--summary-words", type=int, default=COMPACT_SUMMARY_WORDS, help="Longest summary asked for.")
+    parser.add_argument("--model", default=COMPACT_MODEL, help="Chat model that writes the summaries.")
+    parser.add_argument("--retire-vectors", action="store_true", help="Remove the vectors of compacted turns' messages.")
+    parser.add_argument("--dry-run", action="store_true", help="List the groups that would be compacted, and stop.")
+    parser.add_argument("--status", action="store_true", help="Show how much is compacted.")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db, write_behind=False)
+    try:
+        if args.status:
+            return show_status(db, args)
+        groups = due_groups(db, args)
+        if args.dry_run:
+            for first, last, tokens in groups:
+                print(f"turns {first}-{last}: {tokens} tokens")
+            print(f"{len(groups)} groups due.")
+            return
+
+        source_total = summary_total = done = 0
+        try:
+            for first, last, _ in groups:
+                result = compact_group(db, first, last, args)
+                if result is None:
+                    continue
+                source_total += result[0]
+                summary_total += result[1]
+                done += 1
+                print(f"  turns {first}-{last}: {result[0]} tokens -> {result[1]}")
+        except KeyboardInterrupt:
+            print("\nInterrupted; run the same command again to continue.", file=sys.stderr)
+        print(f"Compacted {done} of {len(groups)} groups: {source_total} tokens of messages into {summary_total} tokens of summaries.")
+        if args.retire_vectors:
+            print(f"Retired {retire_vectors(db)} message vectors.")
+    finally:
+        db.close()
+
+
+def _self_test():
+    import os
+    import tempfile
+
+    print("--- Running compact.py Test Suite ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "compact.db"), write_behind=False)
+        try:
+            print("\n1. Groups never span a turn that isn't due...")
+            recent = datetime.now(timezone.utc).isoformat()
+            with db._writing() as conn:
+                for turn_id in range(1, 16):
+                    timestamp = recent if 6 <= turn_id <= 10 else "2023-01-01T00:00:00+00:00"
+                    conn.execute("INSERT INTO turns (id, started_at, message_count) VALUES (?, ?, 1)", (turn_id, recent))
+                    conn.execute("INSERT INTO conversations (turn_id, timestamp, role, content, token_count) VALUES (?, ?, 'user', 'x', 4)",
+                                 (turn_id, timestamp))
+            args = argparse.Namespace(after_days=30, keep_turns=0, source_tokens=3000)
+            groups = due_groups(db, args)
+            assert groups == [(1, 5, 20), (11, 15, 20)], f"Recent turns 6-10 must stay out of every group, got {groups}."
+            print(f"  > PASSED: {groups}")
+
+            print("\n2. An oversized turn is split, not cut off...")
+            text = "\n".join(f"[Turn 1] tool: line {i} " + "x" * 50 for i in range(40)) + "\n[Turn 1] user: " + "y" * 500
+            pieces = split_transcript(text, 200)
+            assert "".join(pieces).replace("\n", "") == text.replace("\n", ""), "Every character should land in a piece."
+            assert max(map(len, pieces)) <= 200 and len(pieces) > 1
+            print(f"  > PASSED: {len(text)} characters became {len(pieces)} pieces of at most 200.")
+        finally:
+            db.close()
+    print("\n--- All Tests Complete ---")
+
+
+# --- Self-contained Test Block ---
+# `python compact.py --self-test` runs it; any other arguments compact as usual.
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--self-test"]:
+        _self_test()
+    else:
+        main()
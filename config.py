@@ -1,9 +1,11 @@
 import os
-from dotenv import load_dotenv
 
 #---Path Config:
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
+# Only pay for python-dotenv when there is a .env to read.
+if os.path.exists(os.path.join(PROJECT_ROOT, '.env')):
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
 
 #---Ollama Config---
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
@@ -12,20 +14,125 @@ BASE_MODEL = os.getenv("BASE_MODEL", "gpt-oss:latest")
 MODEL_CONTEXT_WINDOW = int(os.getenv("MODEL_CONTEXT_WINDOW", 24000))
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text:latest")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 768))
-VECTOR_SIMILARITY_THRESHOLD = float(os.getenv("VECTOR_SIMILARITY_THRESHOLD", 30.0))
+# Embeddings from /api/embed are unit length, so L2 distances fall in [0, 2].
+VECTOR_SIMILARITY_THRESHOLD = float(os.getenv("VECTOR_SIMILARITY_THRESHOLD", 1.0))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+# "float" searches full float32 vectors exactly. "int8" and "binary" store quantized vectors plus a
+# float16 copy, search the quantized ones coarsely, then rerank top_k * VECTOR_RERANK_FACTOR exactly.
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "float")
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 10))
+# "monthly" keeps one vector table per month and searches the newest first, only going further back
+# while fewer than top_k hits are under VECTOR_SIMILARITY_THRESHOLD. Manage shards with shards.py.
+VECTOR_SHARDING = os.getenv("VECTOR_SHARDING", "none")
+# "vec0" searches inside SQLite. "numpy" also mirrors the vectors into a memory-mapped matrix next to
+# the database (<DB_PATH>.vectors.*) and searches that; processes share it through the page cache.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "vec0")
+# float16 halves the mirror, but every search upcasts it, so it pays off mainly for batched queries.
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+# How long Ollama keeps the model loaded after a request, e.g. "30m", or -1 for forever. Unset uses the server default.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE")
+
+#---Retrieval Config---
+# "vector" for KNN only, "hybrid" to fuse KNN with keyword search (reciprocal rank fusion).
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 8))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Embed new messages on a background thread instead of inline in add_message.
+EMBEDDING_WRITE_BEHIND = os.getenv("EMBEDDING_WRITE_BEHIND", "false").lower() == "true"
+
+#---Compaction Config---
+# compact.py summarizes turns older than COMPACT_AFTER_DAYS, sparing the newest COMPACT_KEEP_TURNS,
+# packing consecutive turns into one summary until their messages reach COMPACT_SOURCE_TOKENS.
+COMPACT_MODEL = os.getenv("COMPACT_MODEL", BASE_MODEL)
+COMPACT_AFTER_DAYS = int(os.getenv("COMPACT_AFTER_DAYS", 30))
+COMPACT_KEEP_TURNS = int(os.getenv("COMPACT_KEEP_TURNS", 200))
+COMPACT_SOURCE_TOKENS = int(os.getenv("COMPACT_SOURCE_TOKENS", 3000))
+COMPACT_SUMMARY_WORDS = int(os.getenv("COMPACT_SUMMARY_WORDS", 150))
+
+#---Retention Config---
+# maintenance.py prune deletes whole turns with no message newer than RETENTION_DAYS, and every turn
+# before the newest RETENTION_MAX_TURNS; 0 keeps them. RETENTION_ROLE_DAYS empties older messages of a
+# role, e.g. "tool=14,thoughts=30" drops raw tool outputs after two weeks and reasoning after a month.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 0))
+RETENTION_MAX_TURNS = int(os.getenv("RETENTION_MAX_TURNS", 0))
+RETENTION_ROLE_DAYS = os.getenv("RETENTION_ROLE_DAYS", "")
+
+#---Embedding Cache Config---
+# Set EMBEDDING_CACHE_PATH="" to keep the cache in memory only.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", 2048))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", 100000))
 
 #---Agent Config---
-CONTEXT_WORD_LIMIT = int(os.getenv("CONTEXT_WORD_LIMIT", 1800))
+# Tokens of MODEL_CONTEXT_WINDOW kept free for the model's thinking and response.
+CONTEXT_RESPONSE_RESERVE = int(os.getenv("CONTEXT_RESPONSE_RESERVE", 4096))
+# get_context_messages counts words; about three of them make four tokens of the prompt budget.
+CONTEXT_WORD_LIMIT = max(MODEL_CONTEXT_WINDOW - CONTEXT_RESPONSE_RESERVE, 0) * 3 // 4
+# Fraction of the prompt budget left after the current turn that memories may claim before history.
+CONTEXT_MEMORY_SHARE = float(os.getenv("CONTEXT_MEMORY_SHARE", 0.25))
+# Most earlier-turn messages considered for the prompt; the token budget usually binds first.
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", 64))
+# "rag_first" sends retrieved memories ahead of history. "stable_prefix" sends history first and
+# memories after it, so Ollama can reuse its KV cache for the unchanged prefix on every tool-loop step.
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "rag_first")
 MAX_AGENT_TURNS = int(os.getenv("MAX_AGENT_TURNS", 5))
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT")
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", 4))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 60.0))
+
+#---SQLite Config---
+# WAL lets readers run alongside the one writer, in this process and in others sharing the database.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "wal")
+# NORMAL syncs only at WAL checkpoints: a power cut may lose the latest commits but can't corrupt the file.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "normal")
+# Page cache per connection; negative values are KiB.
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -16000))
+# Bytes of the database file read through mmap instead of read() calls; 0 disables it.
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Seconds a write waits for another connection's write to finish before failing with "database is locked".
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 30.0))
+# Read-only connections queries are spread over; 0 runs them on the writer connection.
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", 4))
+# PRAGMA synchronous for bulk jobs that can simply be rerun after a crash (shard rebuilds, imports).
+# "off" skips every sync, which is fastest but lets a power cut corrupt the file, not just lose the batch.
+SQLITE_BATCH_DURABILITY = os.getenv("SQLITE_BATCH_DURABILITY", "normal")
+# "incremental" lets `maintenance.py vacuum` return freed pages to the filesystem a few at a time.
+# It only takes effect when the file is created; `maintenance.py vacuum --full` converts an older one.
+SQLITE_AUTO_VACUUM = os.getenv("SQLITE_AUTO_VACUUM", "incremental")
+
+#---Daemon Config---
+# The Unix socket daemon.py listens on. run.py forwards to it while a daemon is running; "" disables that.
+DAEMON_SOCKET = os.getenv("DAEMON_SOCKET", "bashbot.sock")
 
 #---Path Config---
 DB_PATH = os.path.join(PROJECT_ROOT, os.getenv("DB_PATH", "memory.db"))
 TOOLS_DIR = os.path.join(PROJECT_ROOT, os.getenv("TOOLS_DIR", "tools"))
+if EMBEDDING_CACHE_PATH:
+    EMBEDDING_CACHE_PATH = os.path.join(PROJECT_ROOT, EMBEDDING_CACHE_PATH)
+if DAEMON_SOCKET:
+    DAEMON_SOCKET = os.path.join(PROJECT_ROOT, DAEMON_SOCKET)
+
+#---HTTP Client Config---
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5.0))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 300.0))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 8))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", 8))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
 
 #---Search Config---
-SEARXNG_HOST = "http://localhost:8080"
+SEARXNG_HOST = os.getenv("SEARXNG_HOST", "http://localhost:8080")
 SEARCH_RESULTS_TO_SHOW = 5
+# web_search answers a repeated query (ignoring case and whitespace) from this cache for SEARCH_CACHE_TTL
+# seconds, then for SEARCH_CACHE_STALE more while one background request refreshes it. Setting both to 0
+# turns caching off; identical searches running at the same time still share one request.
+# Set SEARCH_CACHE_PATH="" to keep the cache in memory only.
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.db")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 3600))
+SEARCH_CACHE_STALE = float(os.getenv("SEARCH_CACHE_STALE", 86400))
+SEARCH_CACHE_MAX_ROWS = int(os.getenv("SEARCH_CACHE_MAX_ROWS", 5000))
+if SEARCH_CACHE_PATH:
+    SEARCH_CACHE_PATH = os.path.join(PROJECT_ROOT, SEARCH_CACHE_PATH)
 
 #---Print Colors---
 class Colors:
@@ -49,6 +156,7 @@ if __name__ == "__main__":
     print(f"  CONTEXT_WORD_LIMIT: {CONTEXT_WORD_LIMIT}")
     print(f"  MAX_AGENT_TURNS: {MAX_AGENT_TURNS}")
     print(f"  VECTOR_SIMILARITY_THRESHOLD: {VECTOR_SIMILARITY_THRESHOLD}")
+    print(f"  EMBEDDING_CACHE_PATH: {EMBEDDING_CACHE_PATH or '(memory only)'}")
 
     # --- 2. Type Verification ---
     print("\n--- Verifying Data Types ---")
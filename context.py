@@ -0,0 +1,269 @@
+"""
+Token-budgeted prompt assembly.
+
+The model's context window is split between a fixed part (the Modelfile system prompt and
+the tool schemas), room reserved for the response, and the prompt itself: retrieved
+memories, earlier turns, and the current turn with its tool outputs. When the prompt does
+not fit, the lowest-value items go first: low-ranked memories, then the oldest history,
+then the oldest tool outputs of the current turn are truncated.
+
+With the "stable_prefix" layout the memories go after the history instead of before it,
+and the history the turn's first request had room for is kept for the rest of the turn
+(see fixed_history): later tool outputs are truncated before it is touched. The prompt
+then starts with the same tokens on every tool-loop step, and Ollama only evaluates what
+follows them.
+"""
+import json
+
+try:
+    from config import MODEL_CONTEXT_WINDOW, CONTEXT_RESPONSE_RESERVE, CONTEXT_MEMORY_SHARE, PROMPT_LAYOUT, SYSTEM_PROMPT
+except ImportError:
+    MODEL_CONTEXT_WINDOW = 24000
+    CONTEXT_RESPONSE_RESERVE = 4096
+    CONTEXT_MEMORY_SHARE = 0.25
+    PROMPT_LAYOUT = "rag_first"
+    SYSTEM_PROMPT = None
+
+# A rough but cheap estimate; English text and JSON average about four characters per token.
+CHARS_PER_TOKEN = 4
+# Role markers and separators the chat template adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# A truncated tool output keeps at least this many tokens of its head.
+MIN_TOOL_OUTPUT_TOKENS = 64
+
+MEMORY_HEADER = "---Relevant Long-Term Memories---"
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Estimates the tokens one message costs: its text parts plus the per-message overhead."""
+    chars = sum(len(text) for text in texts if text)
+    return -(-chars // CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fixed_tokens(tools: list, system_prompt: str = SYSTEM_PROMPT) -> int:
+    """Tokens every request pays before any message: the system prompt and the tool schemas."""
+    return estimate_tokens(system_prompt) + estimate_tokens(json.dumps(tools))
+
+
+def _message_tokens(message: dict) -> int:
+    """Uses the estimate stored with the row, falling back to estimating it here."""
+    tokens = message.get('token_count')
+    if tokens is None:
+        tool_calls = json.dumps(message['tool_calls']) if message.get('tool_calls') else None
+        tokens = estimate_tokens(message.get('content'), tool_calls)
+    return tokens
+
+
+def _api_message(message: dict) -> dict:
+    """Drops bookkeeping keys so only the chat API's fields are sent."""
+    return {key: value for key, value in message.items() if key in ('role', 'content', 'tool_calls')}
+
+
+def _truncate(message: dict, keep_tokens: int) -> dict:
+    """Cuts a message's content down to roughly keep_tokens, noting how much was dropped."""
+    keep_chars = max(keep_tokens - MESSAGE_OVERHEAD_TOKENS, 0) * CHARS_PER_TOKEN
+    dropped = _message_tokens(message) - keep_tokens
+    truncated = dict(message)
+    truncated['content'] = f"{message['content'][:keep_chars]}\n[...truncated about {dropped} tokens to fit the context window]"
+    truncated['token_count'] = keep_tokens
+    return truncated
+
+
+def _memory_line(mem: dict) -> str:
+    """The line a memory takes in the RAG message."""
+    if mem['role'] == 'summary':
+        return f"Summary of Turns {mem['turn_id']}-{mem['last_turn_id']}: {mem['content']}"
+    return f"Memory from Turn {mem['turn_id']} ({mem['role']}): {mem['content']}"
+
+
+def _memory_tokens(mem: dict) -> int:
+    """
+    What a memory adds to the RAG message. Only its line is sent, so the row's stored
+    token_count, which also covers its thoughts and tool calls, would over-count it.
+    """
+    return estimate_tokens(_memory_line(mem) + "\n") - MESSAGE_OVERHEAD_TOKENS
+
+
+def render_memories(memories: list[dict]) -> list[dict]:
+    """Builds the RAG system message for these memories, or nothing if there are none."""
+    if not memories:
+        return []
+    lines = [MEMORY_HEADER] + [_memory_line(mem) for mem in memories]
+    return [{"role": "system", "content": "\n".join(lines)}]
+
+
+def build_context(memories: list[dict], history: list[dict], turn_messages: list[dict], tools: list,
+                  context_window: int = MODEL_CONTEXT_WINDOW, response_reserve: int = CONTEXT_RESPONSE_RESERVE,
+                  memory_share: float = CONTEXT_MEMORY_SHARE, layout: str = PROMPT_LAYOUT,
+                  fixed_history: bool = False) -> tuple[list[dict], dict]:
+    """
+    Assembles the messages for one chat request within the token budget.
+
+    Args:
+        memories: Retrieved memories, best first, already excluding the current turn's messages.
+        history: Messages from earlier turns, oldest first.
+        turn_messages: The current turn so far, oldest first. Always sent; only its
+                       tool outputs are truncated, oldest first, if it alone overflows.
+        tools: The tool schemas sent with the request.
+        memory_share: Fraction of what is left after the current turn that memories may
+                      claim before history. Whatever one section leaves unused the other gets.
+        layout: "rag_first" for memories, history, turn; "stable_prefix" for history, memories, turn.
+        fixed_history: The history was already cut to fit by an earlier request of this turn
+                       (see TurnState.fix_history). It is charged before the turn, whose tool
+                       outputs are truncated first, and loses its oldest rows only if the turn
+                       still doesn't fit.
+
+    Returns:
+        The messages to send, and a usage dict with the tokens spent per section and
+        how many items were dropped or truncated.
+    """
+    budget = context_window - response_reserve - fixed_tokens(tools)
+    usage = {'budget': max(budget, 0), 'memories': 0, 'history': 0, 'turn': 0,
+             'dropped_memories': 0, 'dropped_history': 0, 'truncated_tools': 0}
+
+    #---Current turn: the prompt and everything since---
+    turn = list(turn_messages)
+    history_tokens = sum(_message_tokens(msg) for msg in history) if fixed_history else 0
+    overflow = sum(_message_tokens(msg) for msg in turn) - max(budget - history_tokens, 0)
+    for index, msg in enumerate(turn):
+        if overflow <= 0:
+            break
+        tokens = _message_tokens(msg)
+        if msg['role'] != 'tool' or tokens <= MIN_TOOL_OUTPUT_TOKENS:
+            continue
+        keep = max(tokens - overflow, MIN_TOOL_OUTPUT_TOKENS)
+        turn[index] = _truncate(msg, keep)
+        overflow -= tokens - keep
+        usage['truncated_tools'] += 1
+    usage['turn'] = sum(_message_tokens(msg) for msg in turn)
+    remaining = max(budget - usage['turn'], 0)
+
+    #---History: newest first, leaving memories their share unless it is fixed---
+    history_budget = remaining
+    if not fixed_history:
+        history_budget -= min(sum(_memory_tokens(mem) for mem in memories), int(remaining * memory_share))
+        if memories:
+            history_budget -= estimate_tokens(MEMORY_HEADER)
+    kept_history = []
+    for msg in reversed(history):
+        tokens = _message_tokens(msg)
+        if usage['history'] + tokens > history_budget:
+            break
+        kept_history.append(msg)
+        usage['history'] += tokens
+    kept_history.reverse()
+    usage['dropped_history'] = len(history) - len(kept_history)
+    remaining -= usage['history']
+
+    #---Memories: best first, in whatever room is left---
+    history_content = {msg['content'] for msg in kept_history}
+    kept_memories = []
+    if memories:
+        remaining -= estimate_tokens(MEMORY_HEADER)
+    for mem in memories:
+        if mem['content'] in history_content:
+            continue
+        tokens = _memory_tokens(mem)
+        if usage['memories'] + tokens > remaining:
+            usage['dropped_memories'] += 1
+            continue
+        kept_memories.append(mem)
+        usage['memories'] += tokens
+
+    memory_block = render_memories(kept_memories)
+    history_block = [_api_message(msg) for msg in kept_history]
+    turn_block = [_api_message(msg) for msg in turn]
+    if layout == "stable_prefix":
+        return history_block + memory_block + turn_block, usage
+    return memory_block + history_block + turn_block, usage
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    print("--- Running Context Builder Test Suite ---")
+
+    def message(role: str, words: int, label: str = "") -> dict:
+        content = f"{label} " + " ".join(["word"] * words)
+        return {"role": role, "content": content, "token_count": estimate_tokens(content)}
+
+    tools = [{"type": "function", "function": {"name": "noop", "description": "Does nothing."}}]
+    window = 4000
+    reserve = 500
+
+    print("\n1. Estimating tokens...")
+    assert estimate_tokens("abcd" * 10) == 10 + MESSAGE_OVERHEAD_TOKENS
+    assert estimate_tokens(None, "") == MESSAGE_OVERHEAD_TOKENS
+    assert _message_tokens({"role": "user", "content": "abcd"}) == 1 + MESSAGE_OVERHEAD_TOKENS, "Should estimate rows without a stored count."
+    print("  > PASSED: Estimates follow characters per token plus overhead.")
+
+    print("\n2. Everything fits...")
+    memories = [dict(message("user", 10, "memory"), turn_id=1)]
+    history = [message("user", 10, "old"), message("assistant", 10, "old reply")]
+    turn = [message("user", 10, "prompt")]
+    messages, usage = build_context(memories, history, turn, tools, context_window=window, response_reserve=reserve)
+    assert len(messages) == 4 and messages[0]['role'] == 'system' and messages[-1]['content'].startswith("prompt")
+    assert all('token_count' not in msg for msg in messages), "Bookkeeping keys should not be sent."
+    assert usage['dropped_memories'] == usage['dropped_history'] == usage['truncated_tools'] == 0
+    print("  > PASSED: Memories, history and the turn are all sent, in order.")
+
+    print("\n3. Trimming lowest-value items first...")
+    history = [message("user", 200, f"old {i}") for i in range(20)]
+    memories = [dict(message("assistant", 200, f"memory {i}"), turn_id=i) for i in range(10)]
+    messages, usage = build_context(memories, history, turn, tools, context_window=window, response_reserve=reserve)
+    spent = usage['memories'] + usage['history'] + usage['turn']
+    assert spent <= usage['budget'], f"Spent {spent} of a {usage['budget']} token budget."
+    assert usage['dropped_history'] > 0 and usage['dropped_memories'] > 0
+    assert messages[-2]['content'].startswith("old 19"), "The newest history should be kept."
+    assert "memory 0" in messages[0]['content'] and "memory 9" not in messages[0]['content'], "The best memories should be kept."
+    print(f"  > PASSED: Spent {spent} of {usage['budget']} tokens; dropped {usage['dropped_history']} history rows and {usage['dropped_memories']} memories.")
+
+    print("\n4. Truncating oversized tool outputs...")
+    turn = [message("user", 10, "prompt"), message("tool", 5000, "first tool"), message("tool", 300, "second tool")]
+    messages, usage = build_context([], history, turn, tools, context_window=window, response_reserve=reserve)
+    assert usage['turn'] <= usage['budget'] and usage['truncated_tools'] == 1
+    assert usage['history'] == 0, "History should give way to the current turn."
+    assert "[...truncated" in messages[1]['content'] and messages[2]['content'].startswith("second tool")
+    print("  > PASSED: The oldest tool output was cut to fit; the prompt and newest output are intact.")
+
+    print("\n5. Stable-prefix layout...")
+    history = [message("user", 10, "old"), message("assistant", 10, "old reply")]
+    turn = [message("user", 10, "prompt")]
+    memories = [dict(message("user", 10, "memory"), turn_id=1)]
+    first, _ = build_context([], history, turn, tools, context_window=window, response_reserve=reserve, layout="stable_prefix")
+    second, _ = build_context(memories, history, turn + [message("tool", 10, "output")], tools,
+                              context_window=window, response_reserve=reserve, layout="stable_prefix")
+    assert second[:2] == first[:2], "History should lead the prompt, unchanged by new memories."
+    assert second[2]['role'] == 'system' and "memory" in second[2]['content']
+    print("  > PASSED: New memories land after the unchanged history prefix.")
+
+    print("\n6. A fixed history survives the turn growing past the budget...")
+    history = [message("user", 400, f"old {i}") for i in range(10)]
+    turn = [message("user", 10, "prompt")]
+    first, usage = build_context(memories, history, turn, tools, context_window=window, response_reserve=reserve, layout="stable_prefix")
+    kept = history[usage['dropped_history']:]
+    assert kept and usage['dropped_history'] > 0
+    turn = turn + [message("assistant", 10, "calling"), message("tool", 1500, "big output"), message("assistant", 10, "again")]
+    unfixed, _ = build_context(memories, kept, turn, tools, context_window=window, response_reserve=reserve, layout="stable_prefix")
+    assert unfixed[0] != first[0], "Without fixing it, the grown turn pushes out the oldest history."
+    later, usage = build_context(memories, kept, turn, tools, context_window=window, response_reserve=reserve, layout="stable_prefix",
+                                 fixed_history=True)
+    spent = usage['memories'] + usage['history'] + usage['turn']
+    assert later[:len(kept)] == first[:len(kept)] and usage['dropped_history'] == 0, "The prefix should be unchanged."
+    assert usage['truncated_tools'] == 1 and spent <= usage['budget'], f"Spent {spent} of {usage['budget']}."
+    huge = turn + [message("assistant", 2500, "long reasoning")]
+    _, usage = build_context([], kept, huge, tools, context_window=window, response_reserve=reserve, layout="stable_prefix",
+                             fixed_history=True)
+    assert usage['dropped_history'] > 0 and usage['memories'] + usage['history'] + usage['turn'] <= usage['budget'], \
+           "History should still give way once the tool outputs can't be cut any further."
+    print(f"  > PASSED: The tool output was cut instead of {len(kept)} history rows; the prefix stayed put.")
+
+    print("\n7. Memories cost what is rendered of them...")
+    # Rows from tool-heavy turns: short content, but thoughts and tool calls in their stored count.
+    memories = [dict(message("assistant", 10, f"memory {i}"), turn_id=i, token_count=2000) for i in range(5)]
+    messages, usage = build_context(memories, [], [message("user", 10, "prompt")], tools, context_window=window, response_reserve=reserve)
+    rendered = estimate_tokens(messages[0]['content'])
+    assert usage['dropped_memories'] == 0, "Stored counts covering unsent thoughts shouldn't crowd memories out."
+    assert abs(usage['memories'] + estimate_tokens(MEMORY_HEADER) - rendered) <= len(memories), \
+           f"Budgeted {usage['memories']} tokens for a {rendered}-token block."
+    print(f"  > PASSED: All {len(memories)} memories fit, budgeted at about their rendered {rendered} tokens.")
+
+    print("\n--- All Tests Complete ---")
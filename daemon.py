@@ -0,0 +1,139 @@
+"""
+Keeps bashbot warm between requests: one long-running process holds the DatabaseManager,
+the HTTP pools, the embedding cache and the tool registry, and runs agentic turns for
+clients over a Unix socket.
+
+Usage:
+    python daemon.py [--socket PATH]
+
+While it runs, run.py (and so run.sh) forwards one-shot prompts and interactive sessions to
+it. The protocol is newline-delimited JSON. A client sends {"prompt": ...} per turn; the
+daemon streams {"out": text} and {"err": text} chunks as the turn prints them, then
+{"done": true, "turn_id": N}. Each connection is a session that may send any number of
+prompts, one at a time; sessions run concurrently, each turn under its own turn id.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+
+from config import DAEMON_SOCKET, DB_PATH, TOOLS_DIR
+from database import DatabaseManager
+from run import load_tool_manifests, run_agentic_turn_async
+
+
+class ChunkStream:
+    """A write-only text stream that sends each write to the client as one {key: text} chunk."""
+
+    def __init__(self, writer: asyncio.StreamWriter, key: str):
+        self.writer = writer
+        self.key = key
+
+    def write(self, text: str) -> int:
+        # Turns write from the event loop thread, so the transport can be used directly.
+        if text and not self.writer.is_closing():
+            self.writer.write(json.dumps({self.key: text}).encode() + b"\n")
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Daemon:
+    """Serves agentic turns for concurrent client sessions, sharing one warm DatabaseManager."""
+
+    def __init__(self, db: DatabaseManager, socket_path: str = DAEMON_SOCKET):
+        self.db = db
+        self.socket_path = socket_path
+        self._session_ids = itertools.count(1)
+
+    async def handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Runs the session's prompts in order, streaming each turn's output back as it is printed."""
+        session = next(self._session_ids)
+        print(f"[DAEMON] Session {session} connected.")
+        try:
+            while line := await reader.readline():
+                out, err = ChunkStream(writer, "out"), ChunkStream(writer, "err")
+                turn_id = None
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict) or not isinstance(request.get('prompt'), str):
+                    err.write('\nError: The daemon expects one JSON object with a string "prompt" per line.\n')
+                    print(f"[DAEMON] Session {session} sent a malformed request.", file=sys.stderr)
+                else:
+                    try:
+                        turn_id = await run_agentic_turn_async(request['prompt'], self.db, load_tool_manifests(TOOLS_DIR),
+                                                               out=out, err=err)
+                    except Exception as e:
+                        # One failing turn must not take the other sessions down with it.
+                        err.write(f"\nError: The turn failed in the daemon: {e}\n")
+                    print(f"[DAEMON] Session {session} finished turn {turn_id}.")
+                writer.write(json.dumps({"done": True, "turn_id": turn_id}).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a request line longer than the stream limit.
+            print(f"[DAEMON] Session {session} ended: {e!r}", file=sys.stderr)
+        finally:
+            writer.close()
+            print(f"[DAEMON] Session {session} closed.")
+
+    def _claim_socket(self):
+        """Removes a stale socket file, or exits if another daemon is listening on it."""
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.remove(self.socket_path)
+                return
+        print(f"Error: A bashbot daemon is already listening on '{self.socket_path}'.", file=sys.stderr)
+        sys.exit(1)
+
+    async def serve(self):
+        """Listens until SIGINT or SIGTERM, then removes the socket."""
+        self._claim_socket()
+        # Only this user may connect; the socket is created with these permissions.
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle_session, path=self.socket_path)
+        finally:
+            os.umask(umask)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        print(f"[DAEMON] Listening on {self.socket_path}")
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            print("[DAEMON] Stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve bashbot turns over a Unix socket.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET, help="Path of the Unix socket to listen on.")
+    args = parser.parse_args()
+    if not args.socket:
+        print("Error: No socket path; set DAEMON_SOCKET or pass --socket.", file=sys.stderr)
+        sys.exit(1)
+
+    db = DatabaseManager(DB_PATH)
+    try:
+        asyncio.run(Daemon(db, args.socket).serve())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,369 @@
 import os
+import re
+import sys
+import queue
 import sqlite3
 import json
+import threading
+import functools
+from contextlib import contextmanager
 from datetime import datetime, timezone
 import numpy as np
 import sqlite_vec
-from embedding import get_embedding
-from config import EMBEDDING_DIMENSION, VECTOR_SIMILARITY_THRESHOLD
+from embedding import get_embeddings
+from embedding_worker import EmbeddingWorker
+from context import estimate_tokens
+from vector_index import VECTOR_TABLE, NumpyIndex, UnitLength, Vec0Index, make_index, summary_table
+from config import (EMBEDDING_MODEL, EMBEDDING_DIMENSION, VECTOR_SIMILARITY_THRESHOLD, EMBEDDING_WRITE_BEHIND, RETRIEVAL_MODE, RRF_K,
+                    VECTOR_INDEX, VECTOR_SHARDING, VECTOR_BACKEND, VECTOR_STORE_DTYPE,
+                    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT,
+                    SQLITE_READ_POOL_SIZE, SQLITE_AUTO_VACUUM, CONTEXT_WORD_LIMIT)
+
+# The PRAGMA synchronous levels a unit of work may commit with.
+DURABILITY_LEVELS = ("off", "normal", "full", "extra")
+
+class EmbeddingMismatchError(ValueError):
+    """A query vector from another embedding model or dimension than the stored vectors."""
+
+def count_words(content: str, thoughts: str = None, tool_calls_json: str = None) -> int:
+    """Counts the words a message contributes to the context: content, thoughts and tool call JSON."""
+    return sum(len(text.split()) for text in (content, thoughts, tool_calls_json) if text)
+
+class ReaderPool:
+    """
+    Read-only connections shared by the threads that query the database. Under WAL each query
+    sees the last committed state and never waits for the writer, or makes it wait.
+    Connections are opened on demand, up to `size`; beyond that, callers wait for a free one.
+    """
+
+    def __init__(self, connect, size: int):
+        """
+        Args:
+            connect: A callable returning a new read-only connection.
+            size: Most connections open at once.
+        """
+        self.connect = connect
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of the block."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                self._opened += can_open
+            conn = self.connect() if can_open else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Closes the idle connections; call once no queries are running."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class NewTurn:
+    """A turn staged in a unit of work. Its id is assigned when the unit commits, and stays None if it doesn't."""
+
+    def __init__(self):
+        self.id = None
+
+
+def _turn_id(turn) -> int:
+    """The id of a turn given as an id or a committed NewTurn."""
+    return turn.id if isinstance(turn, NewTurn) else turn
+
+
+class UnitOfWork:
+    """
+    Writes staged in memory and committed together in one transaction, so an agent
+    iteration's token usage and assistant message with its vector cost one commit, and at
+    most one sync, instead of one per row. Nothing is visible to readers until commit().
+    As a context manager it commits when the block succeeds and discards the staged writes
+    if it raises.
+    """
+
+    def __init__(self, db, durability: str = None):
+        """
+        Args:
+            db: The DatabaseManager to commit to.
+            durability: A PRAGMA synchronous level for this commit only, e.g. "off" for a
+                        batch job that can be rerun; None keeps SQLITE_SYNCHRONOUS.
+        """
+        if durability is not None and durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability '{durability}'; expected one of {', '.join(DURABILITY_LEVELS)}.")
+        self.db = db
+        self.durability = durability
+        self._writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._writes.clear()
+
+    def add_message(self, turn_id: int, role: str, content: str, tool_calls: list = None, thoughts: str = None, embedding: list[float] = None,
+                    timestamp: str = None):
+        """
+        Stages a message; takes the same arguments as DatabaseManager.add_message, plus the
+        ISO 8601 UTC `timestamp` it was said at for messages imported from elsewhere.
+        """
+        embeddable = role in ['user', 'assistant'] and bool(content)
+        self._writes.append(('message', {
+                'turn_id': turn_id,
+                'timestamp': timestamp or datetime.now(timezone.utc).isoformat(),
+                'role': role,
+                'content': content,
+                'tool_calls_json': json.dumps(tool_calls) if tool_calls else None,
+                'thoughts': thoughts,
+                'embeddable': embeddable,
+                # None until embedded; an empty list once embedding was tried and failed.
+                'embedding': (embedding or None) if embeddable else None,
+                'model': self.db.embedding_model,
+                }))
+
+    def new_turn(self) -> NewTurn:
+        """
+        Stages a new turn, created only if the unit commits. Pass the returned NewTurn wherever a
+        turn id goes, in this unit or later ones (including execute() parameters); its id is set on commit.
+        """
+        turn = NewTurn()
+        self._writes.append(('turn', turn))
+        return turn
+
+    def unembedded(self) -> int:
+        """How many staged messages that need a vector have none, e.g. because embedding them failed."""
+        return sum(1 for kind, args in self._writes if kind == 'message' and args['embeddable'] and not args['embedding'])
+
+    def record_turn_usage(self, turn_id: int, prompt_tokens: int, completion_tokens: int):
+        """Stages the token counts of one model call; see DatabaseManager.record_turn_usage."""
+        self.execute(
+                "UPDATE turns SET prompt_tokens = prompt_tokens + ?, completion_tokens = completion_tokens + ? WHERE id = ?",
+                (prompt_tokens, completion_tokens, turn_id)
+                )
+
+    def execute(self, sql: str, parameters: tuple = ()):
+        """Stages a statement to run in order with the messages, e.g. bookkeeping that must commit with them."""
+        self._writes.append(('sql', (sql, parameters)))
+
+    def embed(self) -> int:
+        """
+        Embeds the staged messages that still need a vector, in one batched request, and
+        returns how many it embedded. commit() calls this itself; call it earlier to overlap
+        the round-trip with other work. With write-behind enabled the messages are left to
+        the embedding worker instead.
+        """
+        if self.db.embedding_worker is not None:
+            return 0
+        model = self.db.embedding_model
+        # Vectors made before reindex.py switched models are made again with the new one.
+        missing = [args for kind, args in self._writes
+                   if kind == 'message' and args['embeddable'] and (args['embedding'] is None or args['model'] != model)]
+        if not missing:
+            return 0
+        matrix = get_embeddings([message['content'] for message in missing], model=model)
+        for message, vector in zip(missing, matrix):
+            message['embedding'] = [] if np.isnan(vector).any() else vector.tolist()
+            message['model'] = model
+        return sum(bool(message['embedding']) for message in missing)
+
+    def commit(self):
+        """Writes everything staged so far in one transaction. The embedding round-trip stays outside the lock."""
+        self.embed()
+        writes, self._writes = self._writes, []
+        if writes:
+            self.db._apply(writes, self.durability)
 
 class DatabaseManager:
     """A class to manage the agent's SQLite database memory, including vector search."""
 
-    def __init__(self, db_path="memory.db"):
-        """Initializes the database connection and creates the table if it doesn't exist."""
+    def __init__(self, db_path="memory.db", write_behind: bool = EMBEDDING_WRITE_BEHIND, vector_index: str = VECTOR_INDEX,
+                 vector_backend: str = VECTOR_BACKEND, vector_sharding: str = VECTOR_SHARDING,
+                 read_pool_size: int = SQLITE_READ_POOL_SIZE):
+        """
+        Initializes the database connection and creates the table if it doesn't exist.
+
+        Args:
+            db_path: Path to the SQLite database file.
+            write_behind: If True, messages are inserted immediately as 'pending' and
+                          embedded by a background worker instead of inline.
+            vector_index: Storage mode of vec_conversations, "float", "int8" or "binary".
+                          An existing index in another mode is rebuilt on open.
+            vector_backend: "vec0" to search inside SQLite, or "numpy" to search a
+                            memory-mapped mirror of it stored at <db_path>.vectors.*.
+            vector_sharding: "none" for one vector table, or "monthly" for one per month,
+                             searched newest first.
+            read_pool_size: Read-only connections for queries, which then run concurrently
+                            with each other and with writes. 0 queries on the writer.
+        """
         self.db_path = db_path
-        # Use a single connection for the life of the object.
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
-        
-        # Load for sqlite-vec
-        self.conn.enable_load_extension(True)
-        sqlite_vec.load(self.conn)
-        self.conn.enable_load_extension(False)
+        # All writes go through a single connection for the life of the object. It may be shared
+        # with worker threads (async agent loop, tools, embedding worker), so every use goes through self._lock.
+        self._lock = threading.RLock()
+        self.conn = self._connect()
+        # An in-memory database is private to its connection, so it can't have readers.
+        self._readers = None
+        if read_pool_size > 0 and db_path != ":memory:":
+            self._readers = ReaderPool(functools.partial(self._connect, readonly=True), read_pool_size)
+        self._vector_layout = (vector_index, vector_sharding)
+        self._vector_backend = vector_backend
 
         self._create_tables()
+        # The vector table and the model and dimension of its vectors; see reindex.py.
+        self._load_vector_index(self.conn.cursor())
+        self._sync_vector_index()
+        if (self.embedding_model, self.embedding_dimension) != (EMBEDDING_MODEL, EMBEDDING_DIMENSION):
+            print(f"[DB_SETUP] Warning: the stored vectors come from {self.embedding_model} ({self.embedding_dimension} dimensions), "
+                  f"not the configured {EMBEDDING_MODEL} ({EMBEDDING_DIMENSION}). Memory search keeps using "
+                  f"{self.embedding_model} until `python reindex.py` moves it over.", file=sys.stderr)
+
+        self.embedding_worker = None
+        if write_behind:
+            self.embedding_worker = EmbeddingWorker(self._writing, lambda: (self.vector_index, self.embedding_model))
+            self.embedding_worker.start()
+            # Pick up rows left pending by a previous process.
+            for row in self.conn.execute("SELECT id, content FROM conversations WHERE embedding_state = 'pending' ORDER BY id"):
+                self.embedding_worker.enqueue(row['id'], row['content'])
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """
+        Opens a new connection to the database with sqlite-vec loaded and the SQLITE_* pragmas applied.
+        The writer starts its transactions with BEGIN IMMEDIATE, taking the write lock up front: a
+        transaction that read first and then had to upgrade would fail at once instead of waiting.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+
+        # Load for sqlite-vec
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            # Only applies to a new file, and only before the journal mode writes its header; on an older
+            # file it waits for the next VACUUM (see maintenance.py).
+            conn.execute(f"PRAGMA auto_vacuum = {SQLITE_AUTO_VACUUM}")
+            # The journal mode is stored in the database file, so every later connection uses it too.
+            conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+            conn.isolation_level = "IMMEDIATE"
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        return conn
+
+    @contextmanager
+    def _writing(self, durability: str = None):
+        """
+        Holds the writer for the block, committing if it succeeds and rolling back if it raises.
+        `durability` sets PRAGMA synchronous for this commit only.
+        """
+        with self._lock:
+            if durability:
+                self.conn.execute(f"PRAGMA synchronous = {durability}")
+            try:
+                # Begin before anything is read, so the vector table can't be swapped under the block.
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._follow_vector_index(self.conn.cursor())
+                    yield self.conn
+                except BaseException:
+                    self.conn.rollback()
+                    NumpyIndex.rolled_back(self.conn)
+                    raise
+                # A NumPy mirror takes the block's vector changes only once they are committed.
+                with NumpyIndex.committing(self.conn):
+                    self.conn.commit()
+            finally:
+                if durability:
+                    self.conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+
+    @contextmanager
+    def _reading(self):
+        """
+        Lends a pooled read-only connection for the block, or the writer when there is no pool.
+        A pooled connection reads in one transaction, so the whole block sees one snapshot.
+        """
+        if self._readers is None:
+            with self._lock:
+                yield self.conn
+        else:
+            with self._readers.connection() as conn:
+                conn.execute("BEGIN")
+                try:
+                    yield conn
+                finally:
+                    conn.rollback()
+
+    def _mirror_path(self, table: str) -> str:
+        """Path prefix of the NumPy mirror files of a vector table."""
+        return f"{self.db_path}.vectors" if table == VECTOR_TABLE else f"{self.db_path}.{table}"
+
+    def _make_vector_index(self, table: str, dimension: int):
+        """The configured index layout and backend over a vector table."""
+        index = make_index(*self._vector_layout, table=table, dimension=dimension)
+        if self._vector_backend == "numpy":
+            # Each vector table gets its own mirror files, so a re-index never mixes them.
+            index = NumpyIndex(index, self._mirror_path(table), dtype=VECTOR_STORE_DTYPE)
+        return index
+
+    def _load_vector_index(self, cursor: sqlite3.Cursor):
+        """Reads which vector table is live, and the embedding model and dimension of its vectors, from db_meta."""
+        meta = dict(cursor.execute(
+                "SELECT key, value FROM db_meta WHERE key IN ('vector_table', 'embedding_model', 'embedding_dimension')").fetchall())
+        self.vector_index = self._make_vector_index(meta['vector_table'], int(meta['embedding_dimension']))
+        # Summaries are few, so their vectors stay in one full-precision vec0 table.
+        self.summary_index = Vec0Index(dimension=int(meta['embedding_dimension']), table=summary_table(meta['vector_table']))
+        self.vector_table = meta['vector_table']
+        self.embedding_model = meta['embedding_model']
+        self.embedding_dimension = int(meta['embedding_dimension'])
+
+    def _follow_vector_index(self, cursor: sqlite3.Cursor):
+        """Switches to the vector table db_meta names, if reindex.py swapped in a new one since it was loaded."""
+        table = cursor.execute("SELECT value FROM db_meta WHERE key = 'vector_table'").fetchone()[0]
+        if table == self.vector_table:
+            return
+        with self._lock:
+            if table != self.vector_table:
+                self._load_vector_index(cursor)
+                self.vector_index.sync(cursor)
+
+    # Bump this and add a matching _migrate_vN method to change the schema.
+    SCHEMA_VERSION = 9
 
     def _create_tables(self):
-        """Creates the conversations table if it's not present."""
-        cursor = self.conn.cursor()
+        """
+        Creates the tables if they're not present and upgrades older databases in place.
+        The schema version lives in PRAGMA user_version; each missing migration runs once, in order.
+        A current database costs only the version read.
+        """
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        for target in range(version + 1, self.SCHEMA_VERSION + 1):
+            getattr(self, f"_migrate_v{target}")(self.conn.cursor())
+            self.conn.execute(f"PRAGMA user_version = {target}")
+            self.conn.commit()
+        print(f"[DB_SETUP] Upgraded the database schema from version {version} to {self.SCHEMA_VERSION}.")
+
+    def _migrate_v1(self, cursor: sqlite3.Cursor):
+        """
+        Base schema: conversations, vec_conversations and the full-text index.
+        Every step is idempotent, so this also upgrades databases created before versioning.
+        """
         cursor.execute("""
                        CREATE TABLE IF NOT EXISTS conversations (
                            id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,91 +373,493 @@ class DatabaseManager:
                            content TEXT NOT NULL,
                            tool_calls TEXT,
                            thoughts TEXT,
-                           embedding BLOB
+                           embedding BLOB,
+                           embedding_state TEXT
                            );
                        """)
-        self.conn.commit()
+        # Databases created before write-behind embedding lack the state column.
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if 'embedding_state' not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN embedding_state TEXT")
+            cursor.execute("UPDATE conversations SET embedding_state = 'indexed' WHERE embedding IS NOT NULL")
 
         cursor.execute(f"""
                        CREATE VIRTUAL TABLE IF NOT EXISTS vec_conversations
                        USING vec0(embedding float[{EMBEDDING_DIMENSION}]);
                        """)
-        self.conn.commit()
-        print("[DB_SETUP] Tables and vector search virtual table are ready.")
+
+        #---Full-Text Index---
+        # An external-content FTS5 table over conversations.content, kept in sync by triggers.
+        fts_exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'").fetchone()
+        cursor.executescript("""
+                       CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts
+                       USING fts5(content, content='conversations', content_rowid='id');
+
+                       CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+                           INSERT INTO conversations_fts(rowid, content) VALUES (new.id, new.content);
+                       END;
+                       CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+                           INSERT INTO conversations_fts(conversations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                       END;
+                       CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF content ON conversations BEGIN
+                           INSERT INTO conversations_fts(conversations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                           INSERT INTO conversations_fts(rowid, content) VALUES (new.id, new.content);
+                       END;
+                       """)
+        if not fts_exists:
+            # One-time backfill for databases created before the index existed.
+            cursor.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+
+    def _migrate_v2(self, cursor: sqlite3.Cursor):
+        """
+        Turn metadata: a turns table so new turn ids don't need MAX(turn_id) over conversations,
+        and an index so per-turn lookups don't scan the whole table.
+        """
+        cursor.execute("""
+                       CREATE TABLE IF NOT EXISTS turns (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           started_at TEXT NOT NULL,
+                           message_count INTEGER NOT NULL DEFAULT 0,
+                           prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                           completion_tokens INTEGER NOT NULL DEFAULT 0
+                           );
+                       """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_turn_id ON conversations(turn_id, id)")
+        # Backfill from existing conversations; AUTOINCREMENT then continues after the highest turn.
+        cursor.execute("""
+                       INSERT OR IGNORE INTO turns (id, started_at, message_count)
+                       SELECT turn_id, MIN(timestamp), COUNT(*) FROM conversations GROUP BY turn_id
+                       """)
+
+    def _migrate_v3(self, cursor: sqlite3.Cursor):
+        """Per-message word counts, stored at insert time so context assembly never re-splits text."""
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if 'word_count' not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN word_count INTEGER")
+        self.conn.create_function("count_words", 3, count_words, deterministic=True)
+        cursor.execute("UPDATE conversations SET word_count = count_words(content, thoughts, tool_calls) WHERE word_count IS NULL")
+
+    def _migrate_v4(self, cursor: sqlite3.Cursor):
+        """Per-message token estimates, so the context builder can budget without re-reading text."""
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if 'token_count' not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN token_count INTEGER")
+        self.conn.create_function("estimate_tokens", 3, estimate_tokens, deterministic=True)
+        cursor.execute("UPDATE conversations SET token_count = estimate_tokens(content, thoughts, tool_calls) WHERE token_count IS NULL")
+
+    def _migrate_v5(self, cursor: sqlite3.Cursor):
+        """
+        Database metadata, and the vectors kept once: vec_conversations becomes their only copy,
+        so conversations.embedding is copied over where missing and then dropped.
+        """
+        cursor.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('vector_index', 'float')")
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(conversations)")}
+        if 'embedding' in columns:
+            cursor.execute("""
+                           INSERT INTO vec_conversations(rowid, embedding)
+                           SELECT id, embedding FROM conversations
+                           WHERE embedding IS NOT NULL AND id NOT IN (SELECT rowid FROM vec_conversations)
+                           """)
+            cursor.execute("ALTER TABLE conversations DROP COLUMN embedding")
+
+    def _migrate_v6(self, cursor: sqlite3.Cursor):
+        """
+        Bulk-import progress: one row per imported file version, so import_memory.py can skip
+        finished files and resume an interrupted one after its last committed chunk.
+        """
+        cursor.execute("""
+                       CREATE TABLE IF NOT EXISTS imports (
+                           source TEXT NOT NULL,
+                           digest TEXT NOT NULL,
+                           chunks_done INTEGER NOT NULL DEFAULT 0,
+                           turn_key TEXT,
+                           turn_id INTEGER,
+                           started_at TEXT NOT NULL,
+                           finished_at TEXT,
+                           PRIMARY KEY (source, digest)
+                           );
+                       """)
+
+    def _migrate_v7(self, cursor: sqlite3.Cursor):
+        """
+        The embedding model and dimension behind the stored vectors, and the vector table holding
+        them, so a changed EMBEDDING_MODEL is caught instead of mixing vectors (see reindex.py).
+        Existing vectors are taken to come from the configured model.
+        """
+        created = cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE name LIKE 'vec_conversations%' AND sql LIKE '%USING vec0%' LIMIT 1").fetchone()
+        match = re.search(r"\[(\d+)\]", created[0]) if created else None
+        cursor.executemany("INSERT OR IGNORE INTO db_meta (key, value) VALUES (?, ?)", (
+                ('embedding_model', EMBEDDING_MODEL),
+                ('embedding_dimension', match.group(1) if match else str(EMBEDDING_DIMENSION)),
+                ('vector_table', VECTOR_TABLE),
+                ))
+
+    def _migrate_v8(self, cursor: sqlite3.Cursor):
+        """
+        Summaries of compacted turns (see compact.py), in the summaries table db_setup.py laid out,
+        with the turn range each covers. A compacted turn points at its summary. The vectors
+        live in vec_summaries, so summaries.embedding stays empty like conversations' did.
+        """
+        cursor.execute("""
+                       CREATE TABLE IF NOT EXISTS summaries (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           task_id INTEGER,
+                           source_conversation_ids TEXT NOT NULL,
+                           summary_content TEXT NOT NULL,
+                           created_at TEXT NOT NULL,
+                           embedding BLOB
+                           );
+                       """)
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(summaries)")}
+        for column in ('first_turn_id', 'last_turn_id', 'token_count'):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE summaries ADD COLUMN {column} INTEGER")
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(turns)")}
+        if 'summary_id' not in columns:
+            cursor.execute("ALTER TABLE turns ADD COLUMN summary_id INTEGER REFERENCES summaries(id)")
+        meta = dict(cursor.execute("SELECT key, value FROM db_meta WHERE key IN ('vector_table', 'embedding_dimension')").fetchall())
+        Vec0Index(dimension=int(meta['embedding_dimension']), table=summary_table(meta['vector_table'])).create(cursor)
+
+    def _migrate_v9(self, cursor: sqlite3.Cursor):
+        """
+        Message vectors at unit length. Older ones came from /api/embeddings, which doesn't normalize,
+        while queries now come from /api/embed, which does, and VECTOR_SIMILARITY_THRESHOLD is on that
+        scale. Dividing by the norm is all /api/embed does differently, so no re-embedding is needed.
+        """
+        meta = dict(cursor.execute("SELECT key, value FROM db_meta").fetchall())
+        index = make_index(meta['vector_index'], meta.get('vector_sharding', 'none'), table=meta['vector_table'],
+                           dimension=int(meta['embedding_dimension']))
+        index.create(cursor)
+        if all(abs(np.linalg.norm(vector) - 1.0) < 1e-3 for _, vector in index.vectors(self.conn.cursor())):
+            return
+        print("[DB_SETUP] Scaling the stored vectors to unit length...")
+        if self._vector_backend == "numpy":
+            # The mirror files hold the old vectors too; rebuild_from rewrites them.
+            index = NumpyIndex(index, self._mirror_path(meta['vector_table']), dtype=VECTOR_STORE_DTYPE)
+        index.rebuild_from(self.conn, UnitLength(make_index(index.mode, index.sharding, table=meta['vector_table'],
+                                                            dimension=index.dimension)))
+        if VECTOR_SIMILARITY_THRESHOLD >= 2.0:
+            print(f"[DB_SETUP] VECTOR_SIMILARITY_THRESHOLD={VECTOR_SIMILARITY_THRESHOLD} is on the old vectors' scale. "
+                  f"Unit-length vectors are at most 2.0 apart, so it now filters nothing; set it to about 1.0 in .env.")
+
+    def _sync_vector_index(self):
+        """
+        Rebuilds the vector index if it was stored in a different mode or sharding than the one
+        configured, and brings a memory-mapped mirror of it up to date.
+        """
+        stored = dict(self.conn.execute("SELECT key, value FROM db_meta WHERE key IN ('vector_index', 'vector_sharding')").fetchall())
+        stored_layout = (stored['vector_index'], stored.get('vector_sharding', 'none'))
+        layout = (self.vector_index.mode, self.vector_index.sharding)
+        if stored_layout == layout:
+            self.vector_index.sync(self.conn.cursor())
+            return
+        print(f"[DB_SETUP] Rebuilding the vector index from {'/'.join(stored_layout)} to {'/'.join(layout)}...")
+        with self._lock:
+            self.vector_index.rebuild_from(self.conn, make_index(*stored_layout, table=self.vector_table, dimension=self.embedding_dimension))
+            self.conn.executemany("INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)",
+                                  (('vector_index', layout[0]), ('vector_sharding', layout[1])))
+            self.conn.commit()
 
     def get_new_turn_id(self) -> int:
-        """Gets the next available turn_id for a new conversation."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT MAX(turn_id) FROM conversations")
-        result = cursor.fetchone()
-        # If the table is empty start at 1. Otherwise, increment the max.
-        return (result[0] or 0) + 1
+        """Starts a new turn and returns its id."""
+        with self._writing() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO turns (started_at) VALUES (?)", (datetime.now(timezone.utc).isoformat(),))
+            return cursor.lastrowid
+
+    def transaction(self, durability: str = None) -> UnitOfWork:
+        """
+        Starts a unit of work: messages and usage staged on it are written in one transaction
+        when it commits. Use it as `with db.transaction() as unit:`, or keep it across awaits
+        and call unit.commit(); staging is in memory, so it holds no lock until then.
+        """
+        return UnitOfWork(self, durability)
+
+    def record_turn_usage(self, turn_id: int, prompt_tokens: int, completion_tokens: int):
+        """Adds the token counts reported by one model call to the turn's totals."""
+        with self.transaction() as unit:
+            unit.record_turn_usage(turn_id, prompt_tokens, completion_tokens)
 
-    def add_message(self, turn_id: int, role: str, content: str, tool_calls: list = None, thoughts: str = None):
+    def add_message(self, turn_id: int, role: str, content: str, tool_calls: list = None, thoughts: str = None, embedding: list[float] = None):
         """
         Adds a new message to the conversation history, and automatically generates and stores its embedding.
+        With write-behind enabled the row is stored as 'pending' and embedded in the background.
+        Pass `embedding` if the caller already has the vector for `content`.
+        Each call commits on its own; stage related messages on a transaction() to commit them once.
         """
-        timestamp = datetime.now(timezone.utc).isoformat()
-        # Convert the tool_calls list to a JSON string for storage, or None.
-        tool_calls_json = json.dumps(tool_calls) if tool_calls else None
-
-        #---Embedding Pipeline---
-        embedding_vector = None
-        if role in ['user', 'assistant'] and content:
-            embedding_vector = get_embedding(content)
-        embedding_blob = np.array(embedding_vector, dtype=np.float32).tobytes() if embedding_vector else None
-        
-        cursor = self.conn.cursor()
-        cursor.execute(
-                "INSERT INTO conversations (turn_id, timestamp, role, content, tool_calls, thoughts, embedding) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (turn_id, timestamp, role, content, tool_calls_json, thoughts, embedding_blob)
-                )
-        last_id = cursor.lastrowid
-        if embedding_blob:
-            cursor.execute(
-                    "INSERT INTO vec_conversations(rowid, embedding) VALUES (?, ?)",
-                    (last_id, embedding_blob)
-                    )
+        with self.transaction() as unit:
+            unit.add_message(turn_id, role, content, tool_calls, thoughts=thoughts, embedding=embedding)
+
+    def _apply(self, writes: list[tuple], durability: str = None):
+        """Writes a unit of work's staged turns, messages and statements, in order, in one transaction."""
+        pending = []
+        new_turns = [args for kind, args in writes if kind == 'turn']
+        try:
+            with self._writing(durability) as conn:
+                cursor = conn.cursor()
+                for kind, args in writes:
+                    if kind == 'turn':
+                        cursor.execute("INSERT INTO turns (started_at) VALUES (?)", (datetime.now(timezone.utc).isoformat(),))
+                        args.id = cursor.lastrowid
+                        continue
+                    if kind == 'sql':
+                        sql, parameters = args
+                        cursor.execute(sql, tuple(_turn_id(value) for value in parameters))
+                        continue
+
+                    if args['embedding'] and args['model'] != self.embedding_model:
+                        # Embedded just before reindex.py swapped models; the vector can't go in the new table.
+                        args['embedding'] = []
+                    if args['embedding']:
+                        embedding_state = 'indexed'
+                    elif args['embeddable'] and self.embedding_worker is not None:
+                        embedding_state = 'pending'
+                    else:
+                        embedding_state = None
+                    turn_id = _turn_id(args['turn_id'])
+                    content, thoughts, tool_calls_json = args['content'], args['thoughts'], args['tool_calls_json']
+                    cursor.execute(
+                            "INSERT INTO conversations (turn_id, timestamp, role, content, tool_calls, thoughts, embedding_state, word_count, token_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (turn_id, args['timestamp'], args['role'], content, tool_calls_json, thoughts, embedding_state,
+                             count_words(content, thoughts, tool_calls_json), estimate_tokens(content, thoughts, tool_calls_json))
+                            )
+                    last_id = cursor.lastrowid
+                    cursor.execute(
+                            """
+                            INSERT INTO turns (id, started_at, message_count) VALUES (?, ?, 1)
+                            ON CONFLICT(id) DO UPDATE SET message_count = message_count + 1
+                            """,
+                            (turn_id, args['timestamp'])
+                            )
+                    if args['embedding']:
+                        self.vector_index.insert(cursor, last_id, args['embedding'])
+                    if embedding_state == 'pending':
+                        pending.append((last_id, content))
+        except BaseException:
+            # Rolled back, so those ids may be handed out again.
+            for turn in new_turns:
+                turn.id = None
+            raise
 
-        self.conn.commit()
+        # Only enqueue once the rows are committed, so the worker can see them.
+        for row_id, content in pending:
+            self.embedding_worker.enqueue(row_id, content)
 
-    def find_similar_memories(self, query_vector: np.ndarray, top_k: int = 5) -> list[dict]:
+    def flush(self):
+        """Blocks until every pending message has been embedded and indexed."""
+        if self.embedding_worker is not None:
+            self.embedding_worker.drain()
+
+    def delete_turns(self, turn_ids: list[int], durability: str = None) -> int:
+        """
+        Deletes whole turns in one transaction: their messages, with the messages' vectors and keyword
+        index entries, and any summary none of whose turns are left. Returns how many messages went.
+        """
+        if not turn_ids:
+            return 0
+        placeholders = ",".join("?" for _ in turn_ids)
+        with self._writing(durability) as conn:
+            cursor = conn.cursor()
+            message_ids = [row[0] for row in cursor.execute(f"SELECT id FROM conversations WHERE turn_id IN ({placeholders})", turn_ids)]
+            # Before the rows go: a sharded index finds each vector's table from its message's timestamp.
+            self.vector_index.delete(cursor, message_ids)
+            cursor.execute(f"DELETE FROM conversations WHERE turn_id IN ({placeholders})", turn_ids)
+            summary_ids = [row[0] for row in cursor.execute(
+                    f"SELECT DISTINCT summary_id FROM turns WHERE id IN ({placeholders}) AND summary_id IS NOT NULL", turn_ids)]
+            cursor.execute(f"DELETE FROM turns WHERE id IN ({placeholders})", turn_ids)
+            orphaned = [summary_id for summary_id in summary_ids
+                        if not cursor.execute("SELECT 1 FROM turns WHERE summary_id = ?", (summary_id,)).fetchone()]
+            self.summary_index.delete(cursor, orphaned)
+            cursor.executemany("DELETE FROM summaries WHERE id = ?", [(summary_id,) for summary_id in orphaned])
+        return len(message_ids)
+
+    def find_similar_memories(self, query_vector: np.ndarray, top_k: int = 5, query_text: str = None, mode: str = RETRIEVAL_MODE,
+                              model: str = None, drill_down: int = 0) -> list[dict]:
         """
         Finds the top_k most similar messages in the database to a given query vector,
         and returns them in order of similarity.
+        Messages still waiting on the embedding worker are not searchable yet and are skipped.
+        Turns compacted by compact.py are represented by their summary: a summary hit, or a
+        hit on one of its messages, returns the summary (role 'summary') in that place.
+
+        Args:
+            query_text: The text the query vector was made from. Needed for hybrid mode.
+            mode: "vector" for KNN only, or "hybrid" to fuse KNN with a keyword search
+                  over the FTS index using reciprocal rank fusion.
+            model: The embedding model the query vector comes from. Embed queries with
+                   self.embedding_model: a vector from another model, or of another
+                   dimension, raises EmbeddingMismatchError.
+            drill_down: Messages from the summarized turns to return after each summary,
+                        best first, for callers that need the exact wording.
+        """
+        with self._reading() as conn:
+            cursor = conn.cursor()
+            self._follow_vector_index(cursor)
+            if query_vector is not None and query_vector.size and (
+                    query_vector.shape[-1] != self.embedding_dimension or model not in (None, self.embedding_model)):
+                raise EmbeddingMismatchError(
+                        f"The query vector comes from {model or 'an unknown model'} ({query_vector.shape[-1]} dimensions), but the "
+                        f"stored vectors come from {self.embedding_model} ({self.embedding_dimension} dimensions).")
+            if cursor.execute("SELECT 1 FROM summaries LIMIT 1").fetchone():
+                return self._search_compacted(cursor, query_vector, top_k, query_text, mode, drill_down)
+            if mode == "hybrid" and query_text:
+                # Pull a deeper candidate list from each retriever, then keep the best fused top_k.
+                pool_size = max(top_k * 4, 20)
+                vector_ids = self._vector_candidates(cursor, query_vector, pool_size)
+                keyword_ids = self._keyword_candidates(cursor, query_text, pool_size)
+                similar_ids = self._reciprocal_rank_fusion([vector_ids, keyword_ids])[:top_k]
+            else:
+                similar_ids = self._vector_candidates(cursor, query_vector, top_k)
+
+            return self._fetch_memories(cursor, similar_ids)
+
+    def _search_compacted(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int, query_text: str, mode: str,
+                          drill_down: int) -> list[dict]:
+        """
+        find_similar_memories once some turns are compacted. Summaries rank alongside messages,
+        keyed ('summary', id), and messages of compacted turns fold into their summary.
         """
+        # Several message hits can fold into one summary, so every retriever looks deeper.
+        pool_size = max(top_k * 4, 20)
+        summary_hits = self._summary_candidates(cursor, query_vector, pool_size)
+        if mode == "hybrid" and query_text:
+            rankings = [self._vector_candidates(cursor, query_vector, pool_size),
+                        self._keyword_candidates(cursor, query_text, pool_size),
+                        [('summary', summary_id) for summary_id, _ in summary_hits]]
+            ranked = self._reciprocal_rank_fusion(rankings)
+        else:
+            hits = [(distance, row_id) for row_id, distance in self._vector_hits(cursor, query_vector, pool_size)]
+            hits += [(distance, ('summary', summary_id)) for summary_id, distance in summary_hits]
+            ranked = [key for _, key in sorted(hits, key=lambda hit: hit[0])]
+
+        message_ids = [key for key in ranked if not isinstance(key, tuple)]
+        compacted = self._summary_ids(cursor, message_ids)
+        picked = []
+        for key in ranked:
+            key = ('summary', compacted[key]) if key in compacted else key
+            if key not in picked:
+                picked.append(key)
+            if len(picked) == top_k:
+                break
+
+        summaries = {memory['summary_id']: memory for memory in self._fetch_summaries(
+                cursor, [key[1] for key in picked if isinstance(key, tuple)])}
+        ordered = []
+        for key in picked:
+            ordered.append(key)
+            if drill_down and isinstance(key, tuple) and key[1] in summaries:
+                # Drill into the summary: its best message hits, then keyword matches from its turns.
+                found = [row_id for row_id in message_ids if compacted.get(row_id) == key[1]]
+                if len(found) < drill_down and query_text:
+                    turns = (summaries[key[1]]['turn_id'], summaries[key[1]]['last_turn_id'])
+                    found += [row_id for row_id in self._keyword_candidates(cursor, query_text, drill_down, turns) if row_id not in found]
+                ordered.extend(row_id for row_id in found[:drill_down] if row_id not in ordered)
+
+        messages = {memory['id']: memory for memory in self._fetch_memories(cursor, [key for key in ordered if not isinstance(key, tuple)])}
+        results = []
+        for key in ordered:
+            memory = summaries.get(key[1]) if isinstance(key, tuple) else messages.get(key)
+            if memory is not None:
+                results.append(memory)
+        return results
+
+    def _summary_candidates(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Returns (summary id, distance) for the top_k nearest summaries within the similarity threshold."""
         if query_vector is None or query_vector.size == 0:
             return []
+        return [(summary_id, distance) for summary_id, distance in self.summary_index.search(cursor, query_vector, top_k)
+                if distance < VECTOR_SIMILARITY_THRESHOLD]
 
-        cursor = self.conn.cursor()
+    @staticmethod
+    def _summary_ids(cursor: sqlite3.Cursor, message_ids: list[int]) -> dict:
+        """Maps each of these messages that belongs to a compacted turn to its summary's id."""
+        if not message_ids:
+            return {}
+        placeholders = ','.join('?' for _ in message_ids)
+        return dict(cursor.execute(
+                f"""
+                SELECT c.id, t.summary_id FROM conversations c JOIN turns t ON t.id = c.turn_id
+                WHERE c.id IN ({placeholders}) AND t.summary_id IS NOT NULL
+                """,
+                message_ids
+                ).fetchall())
 
-        # Step 1: Query the virtual table to get the top_k nearest neighbors.
-        # The LIMIT clause is essential for the vec0 virtual table.
-        cursor.execute(
-            """
-            SELECT rowid, distance
-            FROM vec_conversations
-            WHERE embedding MATCH ?
-            ORDER BY distance
-            LIMIT ?
-            """,
-            (query_vector.tobytes(), top_k)
-        )
-        similar_ids_and_distances = cursor.fetchall()
+    @staticmethod
+    def _fetch_summaries(cursor: sqlite3.Cursor, summary_ids: list[int]) -> list[dict]:
+        """Fetches summaries shaped like memories, with role 'summary' and the turn range they cover."""
+        if not summary_ids:
+            return []
+        placeholders = ','.join('?' for _ in summary_ids)
+        rows = cursor.execute(
+                f"""
+                SELECT id, first_turn_id, last_turn_id, created_at, summary_content, token_count
+                FROM summaries WHERE id IN ({placeholders})
+                """,
+                summary_ids
+                ).fetchall()
+        return [{'id': f"summary-{row['id']}", 'summary_id': row['id'], 'turn_id': row['first_turn_id'],
+                 'last_turn_id': row['last_turn_id'], 'timestamp': row['created_at'], 'role': 'summary',
+                 'content': row['summary_content'], 'tool_calls': None, 'thoughts': None, 'token_count': row['token_count']}
+                for row in rows]
+
+    def _vector_candidates(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[int]:
+        """Returns the ids of the top_k nearest messages within the similarity threshold, nearest first."""
+        return [row_id for row_id, _ in self._vector_hits(cursor, query_vector, top_k)]
+
+    def _vector_hits(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Returns (id, distance) for the top_k nearest messages within the similarity threshold, nearest first."""
+        if query_vector is None or query_vector.size == 0:
+            return []
+
+        # Step 1: Query the vector index to get the top_k nearest neighbors.
+        # Compact indexes search coarsely and rerank, so distances are exact in every mode.
+        similar_ids_and_distances = self.vector_index.search(cursor, query_vector, top_k)
 
         # Step 2: Filter the results by the similarity threshold.
         # We do this in code to avoid complicating the SQL query for the virtual table.
-        filtered_results = [row for row in similar_ids_and_distances if row['distance'] < VECTOR_SIMILARITY_THRESHOLD]
+        return [(row_id, distance) for row_id, distance in similar_ids_and_distances if distance < VECTOR_SIMILARITY_THRESHOLD]
 
-        if not filtered_results:
+    def _keyword_candidates(self, cursor: sqlite3.Cursor, query_text: str, top_k: int, turns: tuple[int, int] = None) -> list[int]:
+        """
+        Returns the ids of the top_k user/assistant messages matching any query term, best BM25 first.
+        `turns` limits the search to an inclusive (first, last) range of turn ids.
+        """
+        fts_query = self._fts_query(query_text, "OR", max_terms=64)
+        if not fts_query:
             return []
+        first, last = turns or (None, None)
+        cursor.execute(
+                """
+                SELECT c.id
+                FROM conversations_fts
+                JOIN conversations c ON c.id = conversations_fts.rowid
+                WHERE conversations_fts MATCH ? AND c.role IN ('user', 'assistant')
+                  AND (? IS NULL OR c.turn_id BETWEEN ? AND ?)
+                ORDER BY bm25(conversations_fts) LIMIT ?
+                """,
+                (fts_query, first, first, last, top_k)
+                )
+        return [row['id'] for row in cursor.fetchall()]
 
-        # Extract the rowids to fetch the full conversation data.
-        similar_ids = [row['rowid'] for row in filtered_results]
+    @staticmethod
+    def _reciprocal_rank_fusion(rankings: list[list[int]], k: int = RRF_K) -> list[int]:
+        """Merges ranked id lists: each id scores the sum of 1 / (k + rank) over the lists it appears in."""
+        scores = {}
+        for ranking in rankings:
+            for rank, row_id in enumerate(ranking, 1):
+                scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def _fetch_memories(self, cursor: sqlite3.Cursor, similar_ids: list[int]) -> list[dict]:
+        """Fetches the full conversation rows for these ids, preserving their order."""
+        if not similar_ids:
+            return []
 
         # Step 3: Fetch the full conversation data for the filtered rowids.
         placeholders = ','.join('?' for _ in similar_ids)
-        query = f"SELECT id, turn_id, timestamp, role, content, tool_calls, thoughts FROM conversations WHERE id IN ({placeholders})"
+        query = f"SELECT id, turn_id, timestamp, role, content, tool_calls, thoughts, token_count FROM conversations WHERE id IN ({placeholders})"
 
         cursor.execute(query, similar_ids)
         
@@ -130,66 +869,66 @@ class DatabaseManager:
         # Return the results in the order of their original similarity.
         return [results_by_id[id] for id in similar_ids if id in results_by_id]
 
-    def get_context_messages(self, word_limit: int = 1800) -> list[dict]:
+    def get_context_messages(self, word_limit: int = CONTEXT_WORD_LIMIT) -> list[dict]:
         """
-        Fetches the most recent messages up to a specified word limit.
+        Fetches the most recent messages up to a specified word limit, by default the
+        words that fit MODEL_CONTEXT_WINDOW's prompt budget.
+        Walks the table newest-first and stops as soon as the budget is spent, using the
+        word counts stored at insert time, so cost is bounded by the budget, not the table size.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT role, content, tool_calls, thoughts FROM conversations ORDER BY id ASC")
-        all_rows = cursor.fetchall()
+        with self._reading() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT role, content, tool_calls, thoughts, word_count FROM conversations ORDER BY id DESC")
 
-        word_count = 0
-        context_to_return = []
+            word_count = 0
+            context_to_return = []
         
-        # Loop through the messages in reverse (from newest to oldest)
-        for row in reversed(all_rows):
-            message = {"role": row['role'], "content": row['content']}
-            num_words = 0
-            
-            # Add thoughts to content if they exist
-            if row['thoughts']:
-                thoughts = {"thoughts": row['thoughts']}
-                message['content'] = f"{thoughts['thoughts']}\n{message['content']}"
-            num_words += len(message['content'].split())
-
-            # Parse tool calls
-            if row['tool_calls']:
-                message['tool_calls'] = json.loads(row['tool_calls'])
-            num_words += len(message['tool_calls'].split())
+            # Loop through the messages in reverse (from newest to oldest)
+            for row in cursor:
+                num_words = row['word_count']
+                if num_words is None:
+                    num_words = count_words(row['content'], row['thoughts'], row['tool_calls'])
 
-            # Check word count after adding thoughts
+                # Stop if adding the next message would exceed the limit,
+                # but always ensure we include at least one message.
+                if word_count + num_words > word_limit and len(context_to_return) > 0:
+                    break
 
-            # Stop if adding the next message would exceed the limit,
-            # but always ensure we include at least one message.
-            if word_count + num_words > word_limit and len(context_to_return) > 0:
-                break
+                message = {"role": row['role'], "content": row['content']}
+                # Add thoughts to content if they exist
+                if row['thoughts']:
+                    message['content'] = f"{row['thoughts']}\n{message['content']}"
+                # Parse tool calls
+                if row['tool_calls']:
+                    message['tool_calls'] = json.loads(row['tool_calls'])
 
-            # Add the message to the *front* of our context list to keep chronological order
-            context_to_return.insert(0, message)
-            word_count += num_words
+                context_to_return.append(message)
+                word_count += num_words
 
-        # We only need the role and content for the final output
-        return context_to_return
+            # Collected newest-first; flip once to restore chronological order.
+            context_to_return.reverse()
+            return context_to_return
 
     def get_messages_for_turn(self, turn_id: int) -> list[dict]:
         """
         Fetches all messages (user, assistant, tool) for a specific turn_id,
         ensuring they are in chronological order and correctly formatted for the API.
+        Each message carries its stored `token_count` for the context builder, which strips it.
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-                """
-                SELECT role, content, tool_calls, thoughts 
-                FROM conversations
-                WHERE turn_id = ?
-                ORDER BY id ASC
-                """,
-                (turn_id,)
-                )
+        with self._reading() as conn:
+            rows = conn.execute(
+                    """
+                    SELECT role, content, tool_calls, thoughts, token_count
+                    FROM conversations
+                    WHERE turn_id = ?
+                    ORDER BY id ASC
+                    """,
+                    (turn_id,)
+                    ).fetchall()
 
         messages = []
-        for row in cursor.fetchall():
-            message = {"role": row['role'], "content": row['content']}
+        for row in rows:
+            message = {"role": row['role'], "content": row['content'], "token_count": row['token_count']}
 
             if row['thoughts']:
                 message['content'] = f"<think>{row['thoughts']}</think>\n{row['content']}"
@@ -204,23 +943,25 @@ class DatabaseManager:
     def get_long_term_history(self, current_turn_id: int, limit: int = 10) -> list[dict]:
         """
         Gets the long-term history from all PREVIOUS turns.
-        For now, this fetches the last few chronological messages.
+        For now, this fetches the last few chronological messages, each with its `token_count`.
+        The unary + keeps SQLite walking the primary key backwards and stopping at `limit`,
+        rather than range-scanning the turn_id index and sorting every earlier message.
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-                """
-                SELECT role, content, tool_calls, thoughts
-                FROM conversations
-                WHERE turn_id < ?
-                ORDER BY id DESC
-                LIMIT ?
-                """,
-                (current_turn_id, limit)
-                )
+        with self._reading() as conn:
+            rows = conn.execute(
+                    """
+                    SELECT role, content, tool_calls, thoughts, token_count
+                    FROM conversations
+                    WHERE +turn_id < ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                    """,
+                    (current_turn_id, limit)
+                    ).fetchall()
 
         messages = []
-        for row in reversed(cursor.fetchall()):
-            message = {"role": row['role'], "content": row['content']}
+        for row in reversed(rows):
+            message = {"role": row['role'], "content": row['content'], "token_count": row['token_count']}
             if row['thoughts']:
                 message['content'] = f"<think>{row['thoughts']}</think>\n{row['content']}"
             if row['tool_calls']:
@@ -229,22 +970,50 @@ class DatabaseManager:
         return messages
 
 
-    def search_memory(self, search_term: str) -> str:
-        """Searches user and assistant messages for a term and returns a formatted string."""
-        cursor = self.conn.cursor()
-        # The '%' wildcards are added here for the LIKE query.
-        query_param = f"%{search_term}%"
+    @staticmethod
+    def _fts_query(search_term: str, operator: str = "AND", max_terms: int = None) -> str:
+        """
+        Turns a free-text search term into a safe FTS5 query.
+        "Quoted phrases" are kept as phrases, a trailing * makes a term a prefix query, and
+        every other character is quoted so punctuation in identifiers can't break the syntax.
+        """
+        parts = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search_term):
+            text = phrase or word
+            prefix = bool(word) and text.endswith('*')
+            text = text.rstrip('*') if prefix else text
+            if not re.search(r'\w', text):
+                continue
+            part = '"' + text.replace('"', '""') + '"' + ('*' if prefix else '')
+            if part not in parts:
+                parts.append(part)
+            if max_terms and len(parts) >= max_terms:
+                break
+        return f" {operator} ".join(parts)
 
-        cursor.execute(
-                """
-                SELECT turn_id, timestamp, role, content
-                FROM conversations
-                WHERE content LIKE ? AND role IN ('user', 'assistant')
-                ORDER BY id DESC LIMIT 5;
-                """,
-                (query_param,)
-                )
-        results = cursor.fetchall()
+    def search_memory(self, search_term: str) -> str:
+        """
+        Searches user and assistant messages for a term and returns a formatted string.
+        Uses the FTS5 index with BM25 ranking; all terms must match, falling back to any term.
+        """
+        results = []
+        with self._reading() as conn:
+            for operator in ("AND", "OR"):
+                fts_query = self._fts_query(search_term, operator)
+                if not fts_query:
+                    break
+                results = conn.execute(
+                        """
+                        SELECT c.turn_id, c.timestamp, c.role, c.content
+                        FROM conversations_fts
+                        JOIN conversations c ON c.id = conversations_fts.rowid
+                        WHERE conversations_fts MATCH ? AND c.role IN ('user', 'assistant')
+                        ORDER BY bm25(conversations_fts), c.id DESC LIMIT 5;
+                        """,
+                        (fts_query,)
+                        ).fetchall()
+                if results:
+                    break
 
         if not results:
             return f"No memories found matching '{search_term}'."
@@ -257,8 +1026,14 @@ class DatabaseManager:
         return "\n\n".join(formatted_results)
 
     def close(self):
-        """Closes the database connection."""
-        self.conn.close()
+        """Waits for pending embeddings, then closes the database connections."""
+        if self.embedding_worker is not None:
+            self.embedding_worker.stop()
+            self.embedding_worker = None
+        if self._readers is not None:
+            self._readers.close()
+        with self._lock:
+            self.conn.close()
 
 # --- Self-contained Test Block ---
 if __name__ == "__main__":
@@ -269,8 +1044,11 @@ if __name__ == "__main__":
 
     # Use a temporary, file-based database for a realistic and clean test
     TEST_DB_PATH = "test_memory.db"
-    if os.path.exists(TEST_DB_PATH):
-        os.remove(TEST_DB_PATH)
+    # A second database for tests that must not disturb the main conversation.
+    SIDE_DB_PATH = "test_memory_side.db"
+    for path in (TEST_DB_PATH, SIDE_DB_PATH):
+        if os.path.exists(path):
+            os.remove(path)
     
     print("--- Running DatabaseManager Test Suite ---")
     db = DatabaseManager(db_path=TEST_DB_PATH)
@@ -331,6 +1109,8 @@ if __name__ == "__main__":
         assert 'tool_calls' in assistant_message, "tool_calls key is missing."
         assert isinstance(assistant_message['tool_calls'], list), "tool_calls should be a list."
         assert assistant_message['tool_calls'][0]['function']['name'] == 'web_search', "Tool call was not parsed correctly."
+        expected_tokens = estimate_tokens("Let me check that for you.", assistant_thoughts, json.dumps(assistant_tool_calls))
+        assert assistant_message['token_count'] == expected_tokens, "The stored token estimate should cover thoughts and tool calls."
         print("  > PASSED: Correctly reconstructed messages with thoughts and tool calls.")
 
         # --- Test 4: Verify get_long_term_history with debug print ---
@@ -364,8 +1144,61 @@ if __name__ == "__main__":
         
         print("  > PASSED: Correctly retrieved and verified the full history from previous turns.")
 
-        # --- Test 5: Verify get_context_messages ---
-        print("\n5. Testing get_context_messages with a word limit...")
+        # --- Test 5: Verify write-behind embedding ---
+        print("\n5. Testing write-behind embedding...")
+        wb_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=True)
+        try:
+            wb_turn_id = wb_db.get_new_turn_id()
+            wb_db.add_message(wb_turn_id, "user", "My server's hostname is bluefin-07.")
+            wb_db.add_message(wb_turn_id, "tool", "Tool output is never embedded.")
+            wb_db.flush()
+            states = [row['embedding_state'] for row in wb_db.conn.execute(
+                "SELECT embedding_state FROM conversations WHERE turn_id = ? ORDER BY id", (wb_turn_id,))]
+            assert states[1] is None, "Tool rows should not be queued for embedding."
+            if states[0] == 'indexed':
+                indexed = wb_db.conn.execute(
+                    "SELECT COUNT(*) FROM vec_conversations WHERE rowid = (SELECT MIN(id) FROM conversations WHERE turn_id = ?)",
+                    (wb_turn_id,)).fetchone()[0]
+                assert indexed == 1, "Indexed rows should have a vector."
+                print("  > PASSED: Row was inserted immediately and indexed by the worker.")
+            else:
+                assert states[0] == 'pending', "Rows that fail to embed should stay pending."
+                print("  > PASSED: Row stayed pending (no embedding server available).")
+        finally:
+            wb_db.close()
+
+        # --- Test 6: Verify full-text search_memory ---
+        print("\n6. Testing search_memory (FTS5)...")
+        assert "favorite color is blue" in db.search_memory("blue"), "Should find a single term."
+        assert "favorite color is blue" in db.search_memory('"favorite color"'), "Should find a quoted phrase."
+        assert "capital of France" in db.search_memory("capit*"), "Should find a prefix."
+        assert db.search_memory("zebra") == "No memories found matching 'zebra'."
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH)
+        try:
+            assert "bluefin-07" in side_db.search_memory("bluefin-07"), "Should find hyphenated identifiers."
+            assert "Tool output" not in side_db.search_memory("tool output"), "Tool rows should not be searched."
+        finally:
+            side_db.close()
+        print("  > PASSED: Terms, phrases and prefixes are found; tool rows are excluded.")
+
+        # --- Test 7: Verify hybrid retrieval ---
+        print("\n7. Testing hybrid find_similar_memories...")
+        fused = DatabaseManager._reciprocal_rank_fusion([[1, 2, 3], [3, 4]])
+        assert fused[0] == 3, "An id ranked by both retrievers should win."
+        assert set(fused) == {1, 2, 3, 4}
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH)
+        try:
+            # A zero vector matches nothing under the threshold, so any hit here came from the keyword side.
+            no_vector = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
+            hybrid = side_db.find_similar_memories(no_vector, top_k=3, query_text="what was bluefin-07 again?", mode="hybrid")
+            assert hybrid and "bluefin-07" in hybrid[0]['content'], "Hybrid mode should surface exact identifiers."
+            assert all(mem['role'] in ('user', 'assistant') for mem in hybrid)
+        finally:
+            side_db.close()
+        print("  > PASSED: Keyword hits are fused into the ranking.")
+
+        # --- Test 8: Verify get_context_messages ---
+        print("\n8. Testing get_context_messages with a word limit...")
         # The most recent message has 16 words.
         # The one before it has thoughts + content, totaling 19 words.
         # 16 + 19 = 35, so a limit of 30 should only return the most recent message.
@@ -381,12 +1214,313 @@ if __name__ == "__main__":
         # Now, test with a larger limit to get more messages
         context_messages_larger = db.get_context_messages(word_limit=100)
         assert len(context_messages_larger) > 1, "Should retrieve more than one message with a larger word limit."
+        assert context_messages_larger[-1]['content'] == context_messages[0]['content'], "Messages should stay in chronological order."
+        assert any('tool_calls' in m for m in context_messages_larger), "Tool calls should be parsed."
         print("  > PASSED: Correctly retrieved messages based on word limit.")
 
+        # --- Test 9: get_context_messages on a large table ---
+        print("\n9. Testing get_context_messages over 150,000 rows...")
+        import time
+        timestamp = datetime.now(timezone.utc).isoformat()
+        db.conn.executemany(
+            "INSERT INTO conversations (turn_id, timestamp, role, content, word_count) VALUES (?, ?, 'user', ?, 5)",
+            ((1000 + i // 4, timestamp, f"bulk message number {i} here") for i in range(150_000))
+        )
+        db.conn.commit()
+        start = time.perf_counter()
+        bulk_context = db.get_context_messages(word_limit=500)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        assert len(bulk_context) == 100, f"A 500-word budget should hold exactly 100 five-word messages, got {len(bulk_context)}."
+        assert bulk_context[-1]['content'] == "bulk message number 149999 here", "The newest message should come last."
+        assert bulk_context[0]['content'] == "bulk message number 149900 here", "The oldest included message should come first."
+        assert elapsed_ms < 100, f"Should stop early instead of scanning the table (took {elapsed_ms:.1f} ms)."
+        print(f"  > PASSED: Returned the newest 100 messages in {elapsed_ms:.2f} ms.")
+
+        # --- Test 10: Compact vector indexes ---
+        print("\n10. Testing compact vector indexes and the single vector copy...")
+        columns = {row['name'] for row in db.conn.execute("PRAGMA table_info(conversations)")}
+        assert 'embedding' not in columns, "Vectors should only live in vec_conversations."
+        rng = np.random.default_rng(7)
+        vectors = rng.standard_normal((200, EMBEDDING_DIMENSION)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = vectors[42] + 0.02 * rng.standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+        for mode in ("binary", "int8", "float"):
+            # Reopening in another mode rebuilds the index from the vectors already stored.
+            compact_db = DatabaseManager(db_path=SIDE_DB_PATH, vector_index=mode)
+            try:
+                if mode == "binary":
+                    compact_turn = compact_db.get_new_turn_id()
+                    first_id = compact_db.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM conversations").fetchone()[0]
+                    for i, vector in enumerate(vectors):
+                        compact_db.add_message(compact_turn, "user", f"Vector number {i}.", embedding=vector.tolist())
+                nearest = compact_db._vector_candidates(compact_db.conn.cursor(), query, 5)
+                assert nearest and nearest[0] == first_id + 42, f"{mode}: expected row {first_id + 42} first, got {nearest[:1]}."
+                indexed = compact_db.conn.execute("SELECT COUNT(*) FROM vec_conversations").fetchone()[0]
+                assert indexed >= len(vectors), f"{mode}: the rebuild lost vectors."
+            finally:
+                compact_db.close()
+        print("  > PASSED: Binary, int8 and float indexes agree on the nearest neighbour across rebuilds.")
+
+        # --- Test 11: Memory-mapped NumPy backend ---
+        print("\n11. Testing the NumPy vector backend against vec0...")
+        vec0_db = DatabaseManager(db_path=SIDE_DB_PATH)
+        numpy_db = DatabaseManager(db_path=SIDE_DB_PATH, vector_backend="numpy")
+        try:
+            # The mirror was filled from vec0 on open; new rows are appended to both.
+            numpy_db.add_message(numpy_db.get_new_turn_id(), "user", "One more vector.", embedding=(-vectors[42]).tolist())
+            for probe in (query, -vectors[42], vectors[7]):
+                assert numpy_db._vector_candidates(numpy_db.conn.cursor(), probe, 5) == vec0_db._vector_candidates(vec0_db.conn.cursor(), probe, 5), "Backends should agree."
+        finally:
+            numpy_db.close()
+            vec0_db.close()
+        print("  > PASSED: NumPy and vec0 return the same neighbours, including rows added after open.")
+
+        # --- Test 12: Monthly shards, searched newest first ---
+        print("\n12. Testing monthly vector shards...")
+        sharded_db = DatabaseManager(db_path=SIDE_DB_PATH, vector_sharding="monthly")
+        # On the unit scale whatever .env says, so the recent hits count as close.
+        sharded_db.vector_index.threshold = 1.0
+        try:
+            base = rng.standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+            base /= np.linalg.norm(base)
+            sharded_turn = sharded_db.get_new_turn_id()
+            for i in range(3):
+                near = base + 0.01 * rng.standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+                sharded_db.add_message(sharded_turn, "user", f"Recent neighbour {i}.", embedding=near.tolist())
+            # An exact match, but from an old month.
+            old_id = sharded_db.conn.execute(
+                "INSERT INTO conversations (turn_id, timestamp, role, content) VALUES (?, '2024-01-15T12:00:00+00:00', 'user', 'Old exact match.')",
+                (sharded_turn,)).lastrowid
+            sharded_db.vector_index.insert(sharded_db.conn.cursor(), old_id, base)
+            sharded_db.conn.commit()
+            periods = sharded_db.vector_index.periods(sharded_db.conn.cursor())
+            assert len(periods) == 2 and periods[-1] == "2024-01", f"Expected the current month and 2024-01, got {periods}."
+            assert old_id not in sharded_db._vector_candidates(sharded_db.conn.cursor(), base, 3), "Three recent hits should stop the search early."
+            assert sharded_db._vector_candidates(sharded_db.conn.cursor(), base, 5)[0] == old_id, "Older shards should be searched when top_k isn't filled."
+        finally:
+            sharded_db.close()
+        print("  > PASSED: Recent shards answer first; older ones are searched only to fill top_k.")
+
+        # --- Test 13: Several processes sharing one database ---
+        print("\n13. Testing concurrent writers in separate processes...")
+        import subprocess
+        import sys
+        for path in (SIDE_DB_PATH, f"{SIDE_DB_PATH}-wal", f"{SIDE_DB_PATH}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        DatabaseManager(db_path=SIDE_DB_PATH).close()
+        writer_script = f"""
+import json, numpy as np
+from database import DatabaseManager
+db = DatabaseManager(db_path={SIDE_DB_PATH!r})
+vector = np.ones({EMBEDDING_DIMENSION}, dtype=np.float32) / np.sqrt({EMBEDDING_DIMENSION})
+turn_ids = []
+for i in range(25):
+    turn_id = db.get_new_turn_id()
+    db.add_message(turn_id, "user", f"Question {{i}}", embedding=vector.tolist())
+    db.find_similar_memories(vector, top_k=3, query_text="question")
+    db.add_message(turn_id, "assistant", f"Answer {{i}}", embedding=vector.tolist())
+    turn_ids.append(turn_id)
+db.close()
+print(json.dumps(turn_ids))
+"""
+        writers = [subprocess.Popen([sys.executable, "-c", writer_script], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                   for _ in range(4)]
+        turn_ids = []
+        for writer in writers:
+            stdout, stderr = writer.communicate()
+            assert writer.returncode == 0, f"A writer failed: {stderr.strip().splitlines()[-1]}"
+            turn_ids.extend(json.loads(stdout))
+        assert len(set(turn_ids)) == len(turn_ids) == 100, "Every turn id should be handed out once."
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH)
+        try:
+            assert side_db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            counts = side_db.conn.execute("SELECT COUNT(*), COUNT(DISTINCT turn_id) FROM conversations").fetchone()
+            assert tuple(counts) == (200, 100), f"Expected 200 messages in 100 turns, got {tuple(counts)}."
+        finally:
+            side_db.close()
+        print("  > PASSED: Four processes wrote 100 turns with unique ids and no lock errors.")
+
+        # --- Test 14: Units of work ---
+        print("\n14. Testing units of work...")
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False)
+        try:
+            statements = []
+            side_db.conn.set_trace_callback(statements.append)
+            def stored() -> int:
+                with side_db._reading() as conn:
+                    return conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            before = stored()
+            turn_id = side_db.get_new_turn_id()
+            statements.clear()
+            with side_db.transaction() as unit:
+                unit.record_turn_usage(turn_id, 100, 20)
+                unit.add_message(turn_id, "assistant", "Running the check.", [{"function": {"name": "noop", "arguments": {}}}],
+                                 embedding=base.tolist())
+                unit.add_message(turn_id, "tool", "All clear.")
+                assert stored() == before, "Staged messages should not be visible before the commit."
+            assert statements.count("COMMIT") == 1, f"Expected one commit, got {statements.count('COMMIT')}."
+            assert stored() == before + 2
+            assert [msg['role'] for msg in side_db.get_messages_for_turn(turn_id)] == ["assistant", "tool"]
+            usage = side_db.conn.execute("SELECT prompt_tokens, message_count FROM turns WHERE id = ?", (turn_id,)).fetchone()
+            assert tuple(usage) == (100, 2)
+
+            try:
+                with side_db.transaction() as unit:
+                    unit.add_message(turn_id, "tool", "Never stored.")
+                    raise RuntimeError("the tool loop failed")
+            except RuntimeError:
+                pass
+            assert stored() == before + 2, "A unit that raised should write nothing."
+
+            with side_db.transaction(durability="off") as unit:
+                unit.add_message(turn_id, "tool", "Batch row.")
+            assert "PRAGMA synchronous = off" in statements and statements[-1] == f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}"
+            side_db.conn.set_trace_callback(None)
+        finally:
+            side_db.close()
+        print("  > PASSED: Staged writes landed in one commit, in order, and were discarded on error.")
+
+        print("\n15. Testing the stored embedding model and a swapped vector table...")
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False)
+        swapper = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False)
+        try:
+            assert (side_db.embedding_model, side_db.embedding_dimension, side_db.vector_table) == \
+                   (EMBEDDING_MODEL, EMBEDDING_DIMENSION, "vec_conversations")
+            for vector, model in ((np.ones(8, dtype=np.float32), None), (base, "another-model")):
+                try:
+                    side_db.find_similar_memories(vector, top_k=3, model=model)
+                    raise AssertionError("A query from another model or dimension should be refused.")
+                except EmbeddingMismatchError:
+                    pass
+
+            # What reindex.py does once the new table is filled, from another connection.
+            target = side_db.conn.execute("SELECT id FROM conversations WHERE role = 'user' ORDER BY id LIMIT 1").fetchone()[0]
+            small = swapper._make_vector_index("vec_conversations_g2", 8)
+            with swapper._writing() as conn:
+                small.create(conn.cursor())
+                small.insert(conn.cursor(), target, np.ones(8, dtype=np.float32))
+                conn.executemany("UPDATE db_meta SET value = ? WHERE key = ?",
+                                 (("vec_conversations_g2", "vector_table"), ("tiny", "embedding_model"), ("8", "embedding_dimension")))
+            results = side_db.find_similar_memories(np.ones(8, dtype=np.float32), top_k=3, model="tiny")
+            assert side_db.embedding_model == "tiny" and [memory['id'] for memory in results] == [target]
+        finally:
+            swapper.close()
+            side_db.close()
+        print("  > PASSED: Queries from another model were refused, and an open manager followed the swap.")
+
+        print("\n16. Testing summary-first search over compacted turns...")
+        for path in (SIDE_DB_PATH, f"{SIDE_DB_PATH}-wal", f"{SIDE_DB_PATH}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False)
+        try:
+            rng = np.random.default_rng(16)
+            topic = rng.standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+            topic /= np.linalg.norm(topic)
+            def near() -> list[float]:
+                vector = topic + 0.01 * rng.standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+                return (vector / np.linalg.norm(vector)).tolist()
+            old_turn, new_turn = side_db.get_new_turn_id(), side_db.get_new_turn_id()
+            side_db.add_message(old_turn, "user", "The staging database password rotates every Monday.", embedding=near())
+            side_db.add_message(old_turn, "assistant", "Noted, staging rotates on Mondays.", embedding=near())
+            side_db.add_message(new_turn, "user", "Does the rotation cover production too?", embedding=near())
+
+            # What compact.py commits for the old turn.
+            with side_db._writing() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                        """
+                        INSERT INTO summaries (source_conversation_ids, summary_content, created_at, first_turn_id, last_turn_id, token_count)
+                        VALUES ('[]', 'The staging password rotates weekly, on Mondays.', '2024-01-01T00:00:00+00:00', ?, ?, 12)
+                        """,
+                        (old_turn, old_turn)
+                        )
+                summary_id = cursor.lastrowid
+                side_db.summary_index.insert(cursor, summary_id, near())
+                cursor.execute("UPDATE turns SET summary_id = ? WHERE id = ?", (summary_id, old_turn))
+
+            memories = side_db.find_similar_memories(topic, top_k=3, mode="vector")
+            assert sorted((memory['role'], memory['turn_id']) for memory in memories) == [("summary", old_turn), ("user", new_turn)], \
+                   "The old turn's messages should fold into its summary."
+            drilled = side_db.find_similar_memories(topic, top_k=3, mode="vector", drill_down=1)
+            at = [memory['role'] for memory in drilled].index("summary")
+            assert drilled[at + 1]['turn_id'] == old_turn and len(drilled) == 3, "Drilling down should add a message under the summary."
+
+            # With the raw vectors retired, drilling falls back to keyword matches inside the summarized turns.
+            with side_db._writing() as conn:
+                old_ids = [row[0] for row in conn.execute("SELECT id FROM conversations WHERE turn_id = ?", (old_turn,))]
+                side_db.vector_index.delete(conn.cursor(), old_ids)
+            assert set(old_ids).isdisjoint(side_db._vector_candidates(side_db.conn.cursor(), topic, 5))
+            drilled = side_db.find_similar_memories(topic, top_k=3, query_text="staging password", mode="hybrid", drill_down=1)
+            at = [memory['role'] for memory in drilled].index("summary")
+            assert "password" in drilled[at + 1]['content']
+        finally:
+            side_db.close()
+        print("  > PASSED: Summaries stood in for their turns, and drilling down reached the messages with or without their vectors.")
+
+        print("\n17. Testing turn deletion and incremental vacuum...")
+        for path in (SIDE_DB_PATH, f"{SIDE_DB_PATH}-wal", f"{SIDE_DB_PATH}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False, vector_backend="numpy")
+        try:
+            assert side_db.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2, "New databases should use incremental auto-vacuum."
+            old_turn, new_turn = side_db.get_new_turn_id(), side_db.get_new_turn_id()
+            for i in range(40):
+                side_db.add_message(old_turn, "user", f"Disposable note {i} about the quarterly archive. " + "filler " * 200,
+                                    embedding=near())
+            side_db.add_message(new_turn, "user", "The archive moved to cold storage.", embedding=near())
+            with side_db._writing() as conn:
+                cursor = conn.cursor()
+                cursor.execute("INSERT INTO summaries (source_conversation_ids, summary_content, created_at, first_turn_id, last_turn_id) "
+                               "VALUES ('[]', 'Archive notes.', '2024-01-01T00:00:00+00:00', ?, ?)", (old_turn, old_turn))
+                side_db.summary_index.insert(cursor, cursor.lastrowid, near())
+                cursor.execute("UPDATE turns SET summary_id = ? WHERE id = ?", (cursor.lastrowid, old_turn))
+
+            assert side_db.delete_turns([old_turn]) == 40
+            cursor = side_db.conn.cursor()
+            assert [memory['turn_id'] for memory in side_db.find_similar_memories(topic, top_k=5, mode="vector")] == [new_turn], \
+                   "Deleted messages should leave vector search, and their summary with them."
+            assert side_db.vector_index.primary.occupancy(cursor)[0] == 1 and side_db.summary_index.occupancy(cursor)[0] == 0
+            assert "Disposable" not in side_db.search_memory("quarterly archive"), "Deleted messages should leave keyword search."
+            freed = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            with side_db._writing() as conn:
+                for _ in range(freed):
+                    conn.execute("PRAGMA incremental_vacuum(1)")
+            assert freed and side_db.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        finally:
+            side_db.close()
+        print(f"  > PASSED: Deleting a turn removed its vectors, keyword entries and summary; {freed} free pages were returned.")
+
+        # --- Test 18: Vectors stored before embeddings were unit length ---
+        print("\n18. Testing the upgrade of unnormalized vectors...")
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False, vector_backend="numpy")
+        try:
+            legacy_turn = side_db.get_new_turn_id()
+            # /api/embeddings vectors of nomic-embed-text have norms in the tens.
+            side_db.add_message(legacy_turn, "user", "An old-style vector.", embedding=(25.0 * np.asarray(near())).tolist())
+            legacy_id = side_db.conn.execute("SELECT MAX(id) FROM conversations").fetchone()[0]
+            side_db.conn.execute("PRAGMA user_version = 8")
+        finally:
+            side_db.close()
+        side_db = DatabaseManager(db_path=SIDE_DB_PATH, write_behind=False, vector_backend="numpy")
+        try:
+            stored = dict(side_db.vector_index.vectors(side_db.conn.cursor()))
+            assert all(abs(np.linalg.norm(vector) - 1.0) < 1e-3 for vector in stored.values()), "Every stored vector should be unit length."
+            hits = side_db.vector_index.search(side_db.conn.cursor(), stored[legacy_id], 1)
+            assert hits[0][0] == legacy_id and hits[0][1] < 1e-3, "The NumPy mirror should hold the scaled vectors too."
+        finally:
+            side_db.close()
+        print(f"  > PASSED: {len(stored)} stored vectors are unit length after the upgrade, in vec0 and the mirror.")
+
     finally:
         # --- Teardown: Ensure the test database is always cleaned up ---
         print("\n--- Cleaning up test database ---")
         db.close()
-        if os.path.exists(TEST_DB_PATH):
-            os.remove(TEST_DB_PATH)
+        for path in (TEST_DB_PATH, SIDE_DB_PATH, f"{SIDE_DB_PATH}.vectors.float32", f"{SIDE_DB_PATH}.vectors.float32.ids",
+                     f"{SIDE_DB_PATH}.vectors.float32.deleted",
+                     f"{TEST_DB_PATH}-wal", f"{TEST_DB_PATH}-shm", f"{SIDE_DB_PATH}-wal", f"{SIDE_DB_PATH}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         print("--- All Tests Complete ---")
@@ -1,33 +1,122 @@
 import requests
 import json
 import sys
+import numpy as np
+
+from embedding_cache import EmbeddingCache, cache_key
+from http_client import get_client
 
 try:
-    from config import OLLAMA_HOST, EMBEDDING_MODEL
+    from config import OLLAMA_HOST, EMBEDDING_MODEL, EMBEDDING_DIMENSION, EMBEDDING_BATCH_SIZE
+    from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE, EMBEDDING_CACHE_MAX_ROWS
 except ImportError:
     OLLAMA_HOST = "http://localhost:11434"
     EMBEDDING_MODEL = "nomic-embed-text:latest"
+    EMBEDDING_DIMENSION = 768
+    EMBEDDING_BATCH_SIZE = 32
+    EMBEDDING_CACHE_PATH = None
+    EMBEDDING_CACHE_MEMORY_SIZE = 2048
+    EMBEDDING_CACHE_MAX_ROWS = 100000
+
+_cache = None
+
+def get_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE, EMBEDDING_CACHE_MAX_ROWS)
+    return _cache
 
-def get_embedding(text:str) -> list[float]:
+def _embed_batch(inputs: list[str], model: str = EMBEDDING_MODEL) -> list[list[float]] | None:
     """
-    Generates an embedding vector for a given piece of text using the Ollama API.
+    Sends one multi-input request to /api/embed.
+    Returns one vector per input, or None if the request failed.
     """
     try:
         payload = {
-                "model": EMBEDDING_MODEL,
-                "prompt": text
+                "model": model,
+                "input": inputs
                 }
-        response = requests.post(f"{OLLAMA_HOST}/api/embeddings", json=payload)
+        # Embedding the same input twice is harmless, so the call may be retried.
+        response = get_client().post(f"{OLLAMA_HOST}/api/embed", json=payload, idempotent=True)
         response.raise_for_status()
 
-        return response.json().get("embedding", [])
+        embeddings = response.json().get("embeddings", [])
+        if len(embeddings) != len(inputs):
+            print(f"API Error: Expected {len(inputs)} embeddings, got {len(embeddings)}.", file=sys.stderr)
+            return None
+        return embeddings
 
     except requests.exceptions.RequestException as e:
         print(f"API Error: Could not get embedding. Is Ollama running? Details: {e}", file=sys.stderr)
-        return []
+        return None
     except Exception as e:
-        print(f"An unexpected error occurred in get_embedding: {e}", file=sys.stderr)
+        print(f"An unexpected error occurred in get_embeddings: {e}", file=sys.stderr)
+        return None
+
+def get_embeddings(texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Generates embeddings for many texts using Ollama's multi-input /api/embed endpoint.
+
+    Cached texts are not re-sent, duplicates are embedded once, and the rest are sent
+    in batches of `batch_size`. If a batch fails, its inputs are retried one by one so
+    a single bad input can't sink its neighbours.
+
+    `model` defaults to EMBEDDING_MODEL; pass DatabaseManager.embedding_model for vectors
+    that are compared with the stored ones.
+
+    Returns a contiguous float32 matrix with one row per input, in input order.
+    Rows that could not be embedded are filled with NaN.
+    """
+    cache = get_cache()
+    vectors = [None] * len(texts)
+
+    # Group the uncached inputs by content so duplicates share one request slot.
+    pending = {}
+    for i, (text, cached) in enumerate(zip(texts, cache.get_many(model, texts))):
+        if cached is not None:
+            vectors[i] = cached
+        else:
+            pending.setdefault(cache_key(model, text), []).append(i)
+
+    # New vectors reach the cache together at the end, in one transaction.
+    embedded = []
+    groups = list(pending.values())
+    for start in range(0, len(groups), max(1, batch_size)):
+        batch = groups[start:start + batch_size]
+        inputs = [texts[indices[0]] for indices in batch]
+
+        results = _embed_batch(inputs, model)
+        if results is None and len(inputs) > 1:
+            results = [(_embed_batch([text], model) or [None])[0] for text in inputs]
+        if results is None:
+            continue
+
+        for indices, text, vector in zip(batch, inputs, results):
+            if not vector:
+                continue
+            embedded.append((text, vector))
+            for i in indices:
+                vectors[i] = vector
+    cache.put_many(model, embedded)
+
+    dimension = next((len(v) for v in vectors if v), EMBEDDING_DIMENSION)
+    matrix = np.full((len(texts), dimension), np.nan, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector and len(vector) == dimension:
+            matrix[i] = vector
+    return matrix
+
+def get_embedding(text:str, model: str = EMBEDDING_MODEL) -> list[float]:
+    """
+    Generates an embedding vector for a given piece of text using the Ollama API.
+    Repeated text is served from the embedding cache without a round-trip.
+    Returns an empty list if the text could not be embedded.
+    """
+    vector = get_embeddings([text], model=model)[0]
+    if np.isnan(vector).any():
         return []
+    return vector.tolist()
 
 #---Test---
 if __name__ == "__main__":
@@ -59,4 +148,19 @@ if __name__ == "__main__":
         print("     > FAILED to get embedding.")
         sys.exit(1)
 
+    print(f"\nRe-requesting: '{test_text_1}'")
+    hits_before = get_cache().hits
+    assert get_embedding(test_text_1) == embedding_1, "Cached vector should match the original"
+    assert get_cache().hits == hits_before + 1, "Second request should be a cache hit"
+    print("    > Success! Served from the embedding cache.")
+
+    print("\nBatch embedding with a duplicate and a cached input...")
+    batch_texts = [test_text_2, "Bonjour, le monde!", test_text_2, "Hallo, Welt!"]
+    matrix = get_embeddings(batch_texts, batch_size=2)
+    assert matrix.shape == (4, len(embedding_1)), f"Unexpected matrix shape {matrix.shape}"
+    assert matrix.dtype == np.float32 and matrix.flags['C_CONTIGUOUS']
+    assert np.allclose(matrix[0], matrix[2]), "Duplicate inputs should share a vector"
+    assert np.allclose(matrix[0], embedding_2, atol=1e-5), "Rows should stay in input order"
+    print(f"    > Success! Got a {matrix.shape} float32 matrix in input order.")
+
     print("\n---Test Complete---")
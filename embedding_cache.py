@@ -0,0 +1,240 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing so trivially different strings
+    (unicode forms, surrounding or repeated whitespace) share a cache entry.
+    """
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Builds the content-addressed key for an (embedding model, text) pair."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    A two-tier embedding cache: an in-process LRU in front of an on-disk SQLite table.
+    Both tiers are bounded; the least recently used entries are evicted first.
+    get_many and put_many touch the disk tier in one transaction per call, so bulk
+    embedding doesn't pay a commit per vector.
+    """
+
+    def __init__(self, db_path: str = None, memory_size: int = 2048, max_rows: int = 100000):
+        """
+        Args:
+            db_path: Path of the on-disk cache. None or "" disables the disk tier.
+            memory_size: Maximum number of vectors kept in the in-process LRU.
+            max_rows: Maximum number of vectors kept on disk.
+        """
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = None
+        if db_path:
+            # The cache is shared by the agent loop and background workers.
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self._create_table()
+            # Counted once here and kept up to date by put_many, so inserts don't count the table.
+            self._rows = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    # Bump this and extend _create_table to change the cache table.
+    SCHEMA_VERSION = 2
+
+    def _create_table(self):
+        """Creates the cache table and its eviction index, then records the schema version."""
+        self.conn.execute("""
+                          CREATE TABLE IF NOT EXISTS embedding_cache (
+                              key TEXT PRIMARY KEY,
+                              model TEXT NOT NULL,
+                              dimension INTEGER NOT NULL,
+                              vector BLOB NOT NULL,
+                              last_used REAL NOT NULL
+                              );
+                          """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used)")
+        # Version 1 entries came from /api/embeddings and aren't unit length like /api/embed's.
+        self.conn.execute("DELETE FROM embedding_cache")
+        self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        """Returns the cached vector for this text, or None on a miss."""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """
+        Returns the cached vector for each text, None where it misses. Disk hits are read
+        with one query per 500 texts and marked used in a single commit.
+        """
+        keys = [cache_key(model, text) for text in texts]
+        vectors = [None] * len(texts)
+        with self._lock:
+            on_disk = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[i] = vector
+                else:
+                    on_disk.setdefault(key, []).append(i)
+
+            if self.conn is not None and on_disk:
+                found = []
+                missing = list(on_disk)
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    found += self.conn.execute(
+                            f"SELECT key, vector FROM embedding_cache WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                            ).fetchall()
+                if found:
+                    now = time.time()
+                    self.conn.executemany("UPDATE embedding_cache SET last_used = ? WHERE key = ?", ((now, key) for key, _ in found))
+                    self.conn.commit()
+                for key, blob in found:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    for i in on_disk[key]:
+                        vectors[i] = vector
+
+            found_count = sum(vector is not None for vector in vectors)
+            self.hits += found_count
+            self.misses += len(texts) - found_count
+        return vectors
+
+    def put(self, model: str, text: str, vector: list[float]):
+        """Stores a vector in both tiers, evicting old entries if either is full."""
+        self.put_many(model, [(text, vector)])
+
+    def put_many(self, model: str, items: list[tuple[str, list[float]]]):
+        """Stores (text, vector) pairs in both tiers in one commit, skipping empty vectors."""
+        rows = []
+        now = time.time()
+        with self._lock:
+            for text, vector in items:
+                if not vector:
+                    continue
+                key = cache_key(model, text)
+                # Round through float32 so both tiers hand back identical values.
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(key, array.tolist())
+                rows.append((key, model, len(vector), array.tobytes(), now))
+            if self.conn is not None and rows:
+                self.conn.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache (key, model, dimension, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                        rows
+                        )
+                # Replacing an existing key over-counts; _evict_disk recounts before deleting anything.
+                self._rows += len(rows)
+                if self._rows > self.max_rows:
+                    self._evict_disk()
+                self.conn.commit()
+
+    def _remember(self, key: str, vector: list[float]):
+        """Adds a vector to the in-process LRU. Caller must hold the lock."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """
+        Trims the disk tier back under max_rows. Caller must hold the lock.
+        Evicts down to 90% of the limit so we don't pay for a DELETE on every insert.
+        """
+        count = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        self._rows = count
+        if count <= self.max_rows:
+            return
+        keep = int(self.max_rows * 0.9)
+        self.conn.execute(
+                """
+                DELETE FROM embedding_cache WHERE key IN (
+                    SELECT key FROM embedding_cache ORDER BY last_used ASC LIMIT ?
+                )
+                """,
+                (count - keep,)
+                )
+        self._rows = keep
+
+    def clear(self):
+        """Empties both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM embedding_cache")
+                self.conn.commit()
+                self._rows = 0
+
+    def close(self):
+        """Closes the disk tier."""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    import os
+
+    TEST_CACHE_PATH = "test_embedding_cache.db"
+    if os.path.exists(TEST_CACHE_PATH):
+        os.remove(TEST_CACHE_PATH)
+
+    print("--- Running EmbeddingCache Test Suite ---")
+    cache = EmbeddingCache(TEST_CACHE_PATH, memory_size=2, max_rows=10)
+    try:
+        print("\n1. Normalization...")
+        assert cache_key("m", "  ok\n") == cache_key("m", "ok")
+        assert cache_key("m", "ok") != cache_key("other-model", "ok")
+        print("  > PASSED: Whitespace-only differences share a key; models do not.")
+
+        print("\n2. Memory and disk tiers...")
+        cache.put("m", "a", [1.0, 2.0])
+        cache.put("m", "b", [3.0, 4.0])
+        cache.put("m", "c", [5.0, 6.0])
+        assert len(cache._memory) == 2, "LRU should be bounded."
+        assert cache.get("m", "a") == [1.0, 2.0], "Evicted LRU entry should come back from disk."
+        assert cache.get("m", "missing") is None
+        print("  > PASSED: LRU eviction falls back to the disk tier.")
+
+        print("\n3. Disk eviction...")
+        for i in range(25):
+            cache.put("m", f"text {i}", [float(i)])
+        rows = cache.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        assert rows <= 10, f"Disk tier should be bounded, found {rows} rows."
+        assert cache.get("m", "text 24") == [24.0]
+        print("  > PASSED: Disk tier stays under max_rows.")
+
+        print("\n4. Batched lookups and stores...")
+        cache.clear()
+        cache.put_many("m", [(f"batch {i}", [float(i)]) for i in range(8)] + [("empty", [])])
+        cache._memory.clear()
+        hits_before = cache.hits
+        changes_before = cache.conn.total_changes
+        vectors = cache.get_many("m", ["batch 3", "nope", "batch 3", "batch 7", "empty"])
+        assert vectors == [[3.0], None, [3.0], [7.0], None]
+        assert cache.hits == hits_before + 3 and cache.conn.total_changes == changes_before + 2, "One touch per distinct disk hit."
+        assert cache.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] == cache._rows == 8
+        print("  > PASSED: Batches read and write the disk tier in one transaction, duplicates included.")
+    finally:
+        cache.close()
+        if os.path.exists(TEST_CACHE_PATH):
+            os.remove(TEST_CACHE_PATH)
+        print("\n--- All Tests Complete ---")
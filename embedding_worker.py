@@ -0,0 +1,99 @@
+import queue
+import sys
+import threading
+
+import numpy as np
+
+from embedding import get_embeddings
+
+try:
+    from config import EMBEDDING_BATCH_SIZE
+except ImportError:
+    EMBEDDING_BATCH_SIZE = 32
+
+
+class EmbeddingWorker(threading.Thread):
+    """
+    A background thread that embeds 'pending' conversation rows in batches and
+    fills vec_conversations, so inserting a message never waits on the embedder.
+    """
+
+    def __init__(self, writer, target, batch_size: int = EMBEDDING_BATCH_SIZE):
+        """
+        Args:
+            writer: A callable returning a context manager that holds the database's single
+                    writer connection and commits when the block ends (DatabaseManager._writing).
+            target: A callable returning the (index, embedding model) pair vectors are made with
+                    and written to. It is asked again per batch, since reindex.py may swap both.
+            batch_size: Maximum number of rows embedded per request.
+        """
+        super().__init__(name="embedding-worker", daemon=True)
+        self.writer = writer
+        self.target = target
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+
+    def enqueue(self, row_id: int, content: str):
+        """Schedules a conversation row for embedding."""
+        self.queue.put((row_id, content))
+
+    def drain(self):
+        """Blocks until every row enqueued so far has been processed."""
+        self.queue.join()
+
+    def stop(self):
+        """Drains the queue and stops the thread."""
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            batch = [item]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._index(batch)
+            except Exception as e:
+                print(f"[EMBEDDING_WORKER] Failed to index {len(batch)} rows: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            if stopping:
+                self.queue.task_done()
+                break
+
+    def _index(self, batch: list[tuple[int, str]]):
+        """Embeds one batch and writes the vectors. Rows that fail stay 'pending'."""
+        # Embed before taking the writer, so other writes aren't held up by the round-trip.
+        _, model = self.target()
+        matrix = get_embeddings([content for _, content in batch], batch_size=self.batch_size, model=model)
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            index, current = self.target()
+            if current != model:
+                # The index moved to another model meanwhile; reindex.py embeds these rows itself.
+                return
+            for (row_id, _), vector in zip(batch, matrix):
+                if np.isnan(vector).any():
+                    continue
+                cursor.execute(
+                        "UPDATE conversations SET embedding_state = 'indexed' WHERE id = ? AND embedding_state = 'pending'",
+                        (row_id,)
+                        )
+                if cursor.rowcount:
+                    index.insert(cursor, row_id, vector)
@@ -0,0 +1,170 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE, HTTP_MAX_CONCURRENCY, HTTP_RETRIES, HTTP_RETRY_BACKOFF
+except ImportError:
+    HTTP_CONNECT_TIMEOUT = 5.0
+    HTTP_READ_TIMEOUT = 300.0
+    HTTP_POOL_SIZE = 8
+    HTTP_MAX_CONCURRENCY = 8
+    HTTP_RETRIES = 3
+    HTTP_RETRY_BACKOFF = 0.5
+
+# Status codes worth retrying: the server is overloaded or briefly unavailable.
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    A shared HTTP client for Ollama and SearXNG.
+    Keeps one pooled keep-alive session per host, applies default timeouts, bounds the
+    number of in-flight requests, and retries idempotent calls with exponential backoff.
+    """
+
+    def __init__(self, connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT,
+                 pool_size: int = HTTP_POOL_SIZE, max_concurrency: int = HTTP_MAX_CONCURRENCY,
+                 retries: int = HTTP_RETRIES, backoff: float = HTTP_RETRY_BACKOFF):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def session(self, url: str) -> requests.Session:
+        """Returns the pooled session for the host of this URL, creating it on first use."""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def request(self, method: str, url: str, idempotent: bool = None, **kwargs) -> requests.Response:
+        """
+        Sends a request and returns the fully read response.
+
+        Args:
+            idempotent: Whether the call may be retried. Defaults to True for GET/HEAD.
+            **kwargs: Passed through to requests; `timeout` overrides the default.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                with self._slots:
+                    response = self.session(url).request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                response.close()
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs):
+        """
+        Opens a streaming response. The concurrency slot is held until the block exits.
+        Streaming calls are never retried, since part of the body may already be consumed.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        with self._slots:
+            response = self.session(url).request(method, url, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def close(self):
+        """Closes every pooled session."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> HttpClient:
+    """Returns the process-wide HTTP client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class FlakyHandler(BaseHTTPRequestHandler):
+        """Answers 503 to the first two requests, then 200."""
+        protocol_version = "HTTP/1.1"
+        requests_seen = 0
+        ports_seen = set()
+
+        def do_GET(self):
+            FlakyHandler.requests_seen += 1
+            FlakyHandler.ports_seen.add(self.client_address[1])
+            status = 503 if FlakyHandler.requests_seen <= 2 else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print("--- Running HttpClient Test Suite ---")
+    client = HttpClient(retries=3, backoff=0.01)
+    try:
+        print("\n1. Retrying idempotent calls...")
+        response = client.get(url)
+        assert response.status_code == 200, f"Expected 200 after retries, got {response.status_code}"
+        assert FlakyHandler.requests_seen == 3
+        print("  > PASSED: Two 503s were retried with backoff.")
+
+        print("\n2. Non-idempotent calls are not retried...")
+        FlakyHandler.requests_seen = 0
+        response = client.request("GET", url, idempotent=False)
+        assert response.status_code == 503 and FlakyHandler.requests_seen == 1
+        print("  > PASSED: Returned the first response as-is.")
+
+        print("\n3. Keep-alive reuse...")
+        FlakyHandler.ports_seen.clear()
+        for _ in range(5):
+            client.get(url)
+        assert len(FlakyHandler.ports_seen) == 1, f"Expected one pooled connection, saw {len(FlakyHandler.ports_seen)}"
+        print("  > PASSED: Sequential requests shared one connection.")
+    finally:
+        client.close()
+        server.shutdown()
+        print("\n--- All Tests Complete ---")
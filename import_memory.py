@@ -0,0 +1,345 @@
+"""
+Seeds the memory database from files: runbooks, incident transcripts and chat exports.
+
+Usage:
+    python import_memory.py FILE [FILE ...] [--chunk-tokens N] [--batch N] [--durability LEVEL]
+
+Formats, by extension:
+    .jsonl  One message per line: {"content": ..., "role": ..., "conversation": ..., "timestamp": ...}.
+            Only content is required (or "text"); role defaults to "user". Consecutive lines
+            with the same conversation form one turn, and without one the whole file is a turn.
+            Timestamps (ISO 8601 or Unix seconds) are kept, so transcripts land in their month.
+    .md     Split at headings; each chunk starts with the file name and its heading path.
+    other   Plain text, split at blank lines.
+
+Long content is chunked at paragraph, then line boundaries. Documents become one turn of
+'user' messages stamped with the import time, so they rank as current knowledge. Chunks are
+embedded in batches and written in one transaction per batch together with the file's
+progress, so an interrupted import resumes after its last committed batch and a finished
+file is skipped unless its content changed. A batch with chunks that could not be embedded
+is not written; the import stops there, and running it again retries that batch.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from config import DB_PATH, SQLITE_BATCH_DURABILITY
+from context import CHARS_PER_TOKEN
+from database import DURABILITY_LEVELS, DatabaseManager
+
+# Default chunk size; well inside the embedding model's context, and small enough that a
+# retrieved chunk doesn't crowd the prompt.
+CHUNK_TOKENS = 400
+# Chunks embedded and committed together.
+BATCH_SIZE = 256
+
+ROLES = ('user', 'assistant', 'tool')
+
+
+def chunk_text(text: str, max_chars: int) -> list[str]:
+    """Packs paragraphs into chunks of at most max_chars, splitting oversized ones at lines, then anywhere."""
+    # (separator, text) pairs: paragraphs rejoin with a blank line, lines of a split paragraph with a newline.
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            pieces.append(("\n\n", paragraph))
+            continue
+        separator = "\n\n"
+        for line in paragraph.splitlines():
+            for start in range(0, len(line), max_chars):
+                pieces.append((separator, line[start:start + max_chars]))
+                separator = "\n"
+
+    chunks, current = [], ""
+    for separator, piece in pieces:
+        if not piece:
+            continue
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _timestamp(value) -> str:
+    """Normalizes an ISO 8601 string or Unix seconds to the UTC ISO form conversations uses."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value, timezone.utc)
+    else:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def read_jsonl(path: str, max_chars: int):
+    """Yields (turn_key, role, content, timestamp) per chunk of each valid line."""
+    with open(path, encoding="utf-8") as lines:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                content = record.get('content', record.get('text'))
+                role = record.get('role', 'user')
+                if not isinstance(content, str) or role not in ROLES:
+                    raise ValueError("needs string content and a user, assistant or tool role")
+                timestamp = _timestamp(record.get('timestamp'))
+            except (ValueError, AttributeError, TypeError, OverflowError) as e:
+                print(f"Warning: {path}:{number} skipped: {e}", file=sys.stderr)
+                continue
+            turn_key = json.dumps(record.get('conversation'))
+            for chunk in chunk_text(content, max_chars):
+                yield turn_key, role, chunk, timestamp
+
+
+def read_document(path: str, max_chars: int, markdown: bool):
+    """Yields (turn_key, role, content, timestamp) per chunk, one section at a time."""
+    name = os.path.basename(path)
+    headings, section, fenced = [], [], False
+
+    def flush():
+        title = " > ".join([name] + [text for _, text in headings])
+        # The title rides along in every chunk, so leave it room.
+        for chunk in chunk_text("".join(section), max(max_chars - len(title) - 2, CHARS_PER_TOKEN)):
+            yield None, 'user', f"{title}\n\n{chunk}", None
+        section.clear()
+
+    with open(path, encoding="utf-8", errors="replace") as lines:
+        for line in lines:
+            if markdown and line.lstrip().startswith("```"):
+                fenced = not fenced
+            level = len(line) - len(line.lstrip("#"))
+            if markdown and not fenced and 0 < level <= 6 and line[level:level + 1] in (" ", "\n"):
+                yield from flush()
+                headings = [(depth, text) for depth, text in headings if depth < level] + [(level, line[level:].strip())]
+                continue
+            section.append(line)
+    yield from flush()
+
+
+def read_chunks(path: str, chunk_tokens: int):
+    """The chunks of one file, in a stable order so a resumed import can skip what it already wrote."""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".jsonl":
+        return read_jsonl(path, max_chars)
+    return read_document(path, max_chars, markdown=extension in (".md", ".markdown"))
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as data:
+        while block := data.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImportStats:
+    """Totals across files, with the time spent embedding and writing kept apart."""
+
+    def __init__(self):
+        self.rows = 0
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (f"Imported {self.rows} rows in {elapsed:.1f} s ({self.rows / elapsed:.1f} rows/s). "
+                f"Embedded {self.embedded} chunks at {self.embedded / self.embed_seconds if self.embed_seconds else 0:.1f} embeddings/s; "
+                f"wrote at {self.rows / self.write_seconds if self.write_seconds else 0:.1f} rows/s.")
+
+
+def import_file(db: DatabaseManager, path: str, args, stats: ImportStats):
+    """Imports one file in batches, picking up after the last batch a previous run committed."""
+    source, digest = os.path.abspath(path), file_digest(path)
+    progress = db.conn.execute("SELECT * FROM imports WHERE source = ? AND digest = ?", (source, digest)).fetchone()
+    if progress and progress['finished_at']:
+        print(f"{path}: already imported, skipping.")
+        return
+    done = progress['chunks_done'] if progress else 0
+    # The current turn, as an id or a NewTurn staged in a batch; see UnitOfWork.new_turn.
+    turn_key, turn = (progress['turn_key'], progress['turn_id']) if progress else (None, None)
+    if done:
+        print(f"{path}: resuming after {done} chunks.")
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    rows = 0
+    chunks = itertools.islice(read_chunks(path, args.chunk_tokens), done, None)
+    while batch := list(itertools.islice(chunks, args.batch)):
+        unit = db.transaction(durability=args.durability)
+        batch_turn_key, batch_turn = turn_key, turn
+        for key, role, content, timestamp in batch:
+            if batch_turn is None or key != batch_turn_key:
+                # Created with the batch, so an abandoned batch leaves no empty turn behind.
+                batch_turn, batch_turn_key = unit.new_turn(), key
+            unit.add_message(batch_turn, role, content, timestamp=timestamp)
+        unit.execute(
+                """
+                INSERT INTO imports (source, digest, chunks_done, turn_key, turn_id, started_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source, digest) DO UPDATE SET chunks_done = excluded.chunks_done, turn_key = excluded.turn_key, turn_id = excluded.turn_id
+                """,
+                (source, digest, done + len(batch), batch_turn_key, batch_turn, started_at)
+                )
+
+        start = time.perf_counter()
+        stats.embedded += unit.embed()
+        stats.embed_seconds += time.perf_counter() - start
+        if unit.unembedded():
+            # Committed without vectors, these chunks would never be found by memory search.
+            print(f"Error: {path}: {unit.unembedded()} chunks after chunk {done} could not be embedded, so the batch "
+                  f"was not written. Is Ollama up? Run the same command again to retry.", file=sys.stderr)
+            sys.exit(1)
+        start = time.perf_counter()
+        unit.commit()
+        stats.write_seconds += time.perf_counter() - start
+        turn_key, turn = batch_turn_key, batch_turn
+        done += len(batch)
+        rows += len(batch)
+        stats.rows += len(batch)
+
+    with db.transaction() as unit:
+        unit.execute(
+                """
+                INSERT INTO imports (source, digest, chunks_done, started_at, finished_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source, digest) DO UPDATE SET finished_at = excluded.finished_at
+                """,
+                (source, digest, done, started_at, datetime.now(timezone.utc).isoformat())
+                )
+    print(f"{path}: imported {rows} chunks ({done} in total).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import files into bashbot's long-term memory.")
+    parser.add_argument("files", nargs="+", help="JSONL, Markdown or plain-text files to import.")
+    parser.add_argument("--db", default=DB_PATH, help="Database to import into.")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="Largest chunk, in estimated tokens.")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Chunks embedded and committed together.")
+    parser.add_argument("--durability", choices=DURABILITY_LEVELS, default=SQLITE_BATCH_DURABILITY,
+                        help="PRAGMA synchronous for the import's commits.")
+    args = parser.parse_args()
+
+    missing = [path for path in args.files if not os.path.isfile(path)]
+    if missing:
+        print(f"Error: No such file: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+    db = DatabaseManager(args.db, write_behind=False)
+    stats = ImportStats()
+    try:
+        for path in args.files:
+            import_file(db, path, args, stats)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume.", file=sys.stderr)
+    finally:
+        db.close()
+        print(stats.report())
+
+
+def _self_test():
+    import contextlib
+    import io
+    import tempfile
+
+    import embedding
+    from embedding_cache import EmbeddingCache
+    from stand_ins import StandInOllama, fake_embedding
+
+    print("--- Running import_memory.py Test Suite ---")
+
+    print("\n1. Chunking at paragraphs, then lines, then anywhere...")
+    text = "First paragraph.\n\nSecond one, a little longer.\n\n" + "\n".join(f"line {i} " * 5 for i in range(20)) + "\n\n" + "x" * 250
+    chunks = chunk_text(text, 100)
+    assert all(len(chunk) <= 100 for chunk in chunks), "Every chunk should fit."
+    assert chunks[0].startswith("First paragraph.\n\nSecond one, a little longer.\n\nline 0"), "Small pieces should share a chunk."
+    assert "".join("".join(chunks).split()) == "".join(text.split()), "Nothing but whitespace should be lost."
+    print(f"  > PASSED: {len(text)} characters became {len(chunks)} chunks of at most 100.")
+
+    with StandInOllama() as ollama, tempfile.TemporaryDirectory() as tmp:
+        # config was read at import, so point the embedder at the stand-in and keep its cache off disk.
+        embedding.OLLAMA_HOST = ollama.url
+        embedding._cache = EmbeddingCache()
+        db = DatabaseManager(os.path.join(tmp, "import.db"), write_behind=False)
+        args = argparse.Namespace(chunk_tokens=CHUNK_TOKENS, batch=BATCH_SIZE, durability="off")
+        quiet = lambda: contextlib.redirect_stdout(io.StringIO())
+        try:
+            print("\n2. Markdown heading paths...")
+            runbook = os.path.join(tmp, "disks.md")
+            with open(runbook, "w") as f:
+                f.write("# Storage\n\nIntro.\n\n## Replacing a disk\n\nPull it.\n```\n# not a heading\n```\n\n# Network\n\nCheck links.\n")
+            sections = [content for _, _, content, _ in read_chunks(runbook, CHUNK_TOKENS)]
+            assert [section.split("\n")[0] for section in sections] == \
+                   ["disks.md > Storage", "disks.md > Storage > Replacing a disk", "disks.md > Network"], sections
+            assert "# not a heading" in sections[1], "Lines in a code fence aren't headings."
+            print("  > PASSED: Each chunk starts with its file and heading path; fenced lines stay in the text.")
+
+            print("\n3. JSONL conversations become turns...")
+            export = os.path.join(tmp, "chat.jsonl")
+            with open(export, "w") as f:
+                for conversation, role, content in (("a", "user", "Is host-1 up?"), ("a", "assistant", "Yes."), ("b", "user", "And host-2?"),
+                                                    ("b", "tool", "host-2: down"), ("b", "assistant", "It is down.")):
+                    f.write(json.dumps({"conversation": conversation, "role": role, "content": content,
+                                        "timestamp": "2024-03-01T10:00:00Z"}) + "\n")
+                f.write("not json\n")
+            with quiet(), contextlib.redirect_stderr(io.StringIO()):
+                import_file(db, export, args, ImportStats())
+            with db._reading() as conn:
+                turns = conn.execute("SELECT turn_id, COUNT(*), MIN(timestamp) FROM conversations GROUP BY turn_id ORDER BY turn_id").fetchall()
+            assert [(count, timestamp[:10]) for _, count, timestamp in turns] == [(2, "2024-03-01"), (3, "2024-03-01")], turns
+            print("  > PASSED: Two conversations became two turns with their timestamps; the bad line was skipped.")
+
+            print("\n4. A failed batch is not written, and a rerun resumes...")
+            notes = os.path.join(tmp, "notes.txt")
+            with open(notes, "w") as f:
+                f.write("\n\n".join(f"Note {i}: host-{i} had its disk replaced." for i in range(10)))
+            args = argparse.Namespace(chunk_tokens=20, batch=4, durability="off")
+            # Only the first batch can be embedded, from the cache, while every request fails (with a 404, not retried).
+            for _, _, content, _ in itertools.islice(read_chunks(notes, args.chunk_tokens), 4):
+                embedding.get_cache().put(db.embedding_model, content, fake_embedding(content, db.embedding_dimension))
+            embedding.OLLAMA_HOST = f"{ollama.url}/offline"
+            with db._reading() as conn:
+                turns_before = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+            try:
+                with quiet(), contextlib.redirect_stderr(io.StringIO()):
+                    import_file(db, notes, args, ImportStats())
+                raise AssertionError("The import should stop at the batch it couldn't embed.")
+            except SystemExit:
+                pass
+            with db._reading() as conn:
+                written = conn.execute("SELECT COUNT(*) FROM conversations WHERE content LIKE 'notes.txt%'").fetchone()[0]
+                turns_after = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+            assert (written, turns_after) == (4, turns_before + 1), f"Only the first batch should be written, got {written} rows."
+            embedding.OLLAMA_HOST = ollama.url
+            with quiet() as output:
+                import_file(db, notes, args, ImportStats())
+                import_file(db, notes, args, ImportStats())
+            assert "resuming after 4 chunks" in output.getvalue() and "already imported" in output.getvalue()
+            with db._reading() as conn:
+                rows = conn.execute("SELECT turn_id, embedding_state FROM conversations WHERE content LIKE 'notes.txt%'").fetchall()
+            assert len(rows) == 10 and {row["turn_id"] for row in rows} == {rows[0]['turn_id']}, "The rerun should finish the same turn."
+            assert all(row['embedding_state'] == 'indexed' for row in rows), "Every chunk should have its vector."
+            print("  > PASSED: The failed batch left no rows or turn behind; the rerun finished the file in the same turn.")
+        finally:
+            db.close()
+    print("\n--- All Tests Complete ---")
+
+
+# --- Self-contained Test Block ---
+# `python import_memory.py --self-test` runs it; any other arguments import as usual.
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--self-test"]:
+        _self_test()
+    else:
+        main()
@@ -0,0 +1,312 @@
+"""
+Retention and space reclamation for bashbot's memory.
+
+Usage:
+    python maintenance.py prune [--days N] [--max-turns N] [--role-days ROLE=DAYS,...] [--dry-run]
+    python maintenance.py vacuum [--pages N] [--repack-above FRACTION] [--full]
+    python maintenance.py stats
+
+prune applies the retention policy (RETENTION_DAYS, RETENTION_MAX_TURNS, RETENTION_ROLE_DAYS).
+Whole turns are deleted with their messages' vectors, keyword index entries and any summary
+left covering nothing; role rules empty the content of older messages instead, e.g. raw tool
+outputs, and drop their vectors. The pseudo-role "thoughts" clears the model's reasoning.
+
+vacuum returns the freed space without stopping bashbot: every step is its own short write
+transaction, so the agent's writes interleave with it. It merges the keyword index's segments,
+repacks vector tables (one shard at a time) whose chunks are mostly deleted slots, returns free
+pages to the filesystem with PRAGMA incremental_vacuum, rewrites a NumPy mirror that is hiding
+deleted rows, and truncates the WAL. A database created before SQLITE_AUTO_VACUUM needs one
+`vacuum --full`, a complete VACUUM that blocks other writers until it finishes.
+
+stats reports file and table sizes, free pages, vector counts and dead space.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from config import (DB_PATH, RETENTION_DAYS, RETENTION_MAX_TURNS, RETENTION_ROLE_DAYS, SQLITE_AUTO_VACUUM,
+                    SQLITE_BATCH_DURABILITY)
+from context import estimate_tokens
+from database import DatabaseManager, count_words
+from vector_index import NumpyIndex
+
+# Turns deleted, or messages emptied, per write transaction.
+BATCH_SIZE = 200
+# Free pages returned per transaction; 1000 pages take a few milliseconds.
+VACUUM_PAGES = 1000
+# Keyword index pages merged per transaction.
+FTS_MERGE_PAGES = 500
+# Repack a vector table once this share of its chunk slots hold deleted rows (and at least a chunk's worth).
+REPACK_ABOVE = 0.25
+
+AUTO_VACUUM_MODES = ("none", "full", "incremental")
+
+# Turns with no message since the cutoff. The newest turn may still be running, so it is never due.
+EXPIRED_TURNS = """
+                SELECT t.id FROM turns t LEFT JOIN conversations c ON c.turn_id = t.id
+                WHERE t.id < (SELECT MAX(id) FROM turns)
+                GROUP BY t.id HAVING COALESCE(MAX(c.timestamp), t.started_at) < ?
+                ORDER BY t.id
+                """
+
+
+def parse_role_days(spec: str) -> dict[str, int]:
+    """ "tool=14,thoughts=30" -> {'tool': 14, 'thoughts': 30}."""
+    rules = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, days = part.partition("=")
+        if not role or not days.strip().isdigit():
+            raise ValueError(f"Expected ROLE=DAYS, got '{part}'.")
+        rules[role.strip()] = int(days)
+    return rules
+
+
+def _cutoff(days: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+def expired_turns(db: DatabaseManager, days: int, max_turns: int) -> list[int]:
+    """Turns older than `days`, plus every turn before the newest `max_turns`; 0 disables either rule."""
+    turn_ids = set()
+    with db._reading() as conn:
+        if days:
+            turn_ids.update(row[0] for row in conn.execute(EXPIRED_TURNS, (_cutoff(days),)))
+        if max_turns:
+            turn_ids.update(row[0] for row in conn.execute("SELECT id FROM turns ORDER BY id DESC LIMIT -1 OFFSET ?", (max_turns,)))
+    return sorted(turn_ids)
+
+
+def _expiring_messages(cursor, role: str, cutoff: str, after: int, limit: int) -> list:
+    if role == "thoughts":
+        return cursor.execute("SELECT id, embedding_state FROM conversations WHERE id > ? AND thoughts IS NOT NULL AND timestamp < ? "
+                              "ORDER BY id LIMIT ?", (after, cutoff, limit)).fetchall()
+    return cursor.execute("SELECT id, embedding_state FROM conversations WHERE id > ? AND role = ? AND content != '' AND timestamp < ? "
+                          "ORDER BY id LIMIT ?", (after, role, cutoff, limit)).fetchall()
+
+
+def expire_role(db: DatabaseManager, role: str, days: int, batch_size: int) -> int:
+    """Empties the content (or, for "thoughts", the reasoning) of the role's messages older than `days`."""
+    cutoff, after, expired = _cutoff(days), 0, 0
+    while True:
+        with db._writing(SQLITE_BATCH_DURABILITY) as conn:
+            cursor = conn.cursor()
+            rows = _expiring_messages(cursor, role, cutoff, after, batch_size)
+            if not rows:
+                return expired
+            row_ids = [row['id'] for row in rows]
+            if role == "thoughts":
+                cursor.executemany("UPDATE conversations SET thoughts = NULL WHERE id = ?", [(row_id,) for row_id in row_ids])
+            else:
+                # Empty content has nothing to embed, so the vectors go and the worker leaves the rows alone.
+                db.vector_index.delete(cursor, [row['id'] for row in rows if row['embedding_state'] == 'indexed'])
+                cursor.executemany("UPDATE conversations SET content = '', embedding_state = NULL WHERE id = ?",
+                                   [(row_id,) for row_id in row_ids])
+            cursor.executemany(
+                    """
+                    UPDATE conversations SET word_count = count_words(content, thoughts, tool_calls),
+                                             token_count = estimate_tokens(content, thoughts, tool_calls)
+                    WHERE id = ?
+                    """,
+                    [(row_id,) for row_id in row_ids]
+                    )
+        after = row_ids[-1]
+        expired += len(row_ids)
+
+
+def prune(db: DatabaseManager, args):
+    try:
+        role_days = parse_role_days(args.role_days)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+    turn_ids = expired_turns(db, args.days, args.max_turns)
+
+    if args.dry_run:
+        with db._reading() as conn:
+            cursor = conn.cursor()
+            messages = sum(cursor.execute(f"SELECT COUNT(*) FROM conversations WHERE turn_id IN ({','.join('?' for _ in chunk)})",
+                                          chunk).fetchone()[0]
+                           for chunk in (turn_ids[start:start + 500] for start in range(0, len(turn_ids), 500)))
+            print(f"Would delete {len(turn_ids)} turns ({messages} messages).")
+            for role, days in role_days.items():
+                count = len(_expiring_messages(cursor, role, _cutoff(days), 0, -1))
+                print(f"Would clear {'thoughts' if role == 'thoughts' else role + ' content'} older than {days} days in {count} messages.")
+        return
+
+    deleted = 0
+    for start in range(0, len(turn_ids), args.batch):
+        deleted += db.delete_turns(turn_ids[start:start + args.batch], SQLITE_BATCH_DURABILITY)
+    print(f"Deleted {len(turn_ids)} turns ({deleted} messages).")
+    # Role rules recount the emptied messages with the same functions add_message uses.
+    db.conn.create_function("count_words", 3, count_words, deterministic=True)
+    db.conn.create_function("estimate_tokens", 3, estimate_tokens, deterministic=True)
+    for role, days in role_days.items():
+        expired = expire_role(db, role, days, args.batch)
+        print(f"Cleared {'thoughts' if role == 'thoughts' else role + ' content'} older than {days} days in {expired} messages.")
+    print("Run `python maintenance.py vacuum` to return the freed space.")
+
+
+def _vec0_tables(db: DatabaseManager, cursor) -> list:
+    """Every vec0 table behind the live message index, one per shard when sharded, and the summary table."""
+    index = db.vector_index.primary if isinstance(db.vector_index, NumpyIndex) else db.vector_index
+    tables = [index.shard(period) for period in index.periods(cursor)] if index.sharding == "monthly" else [index]
+    return tables + [db.summary_index]
+
+
+def _file_sizes(db: DatabaseManager) -> int:
+    paths = [db.db_path, f"{db.db_path}-wal"]
+    if isinstance(db.vector_index, NumpyIndex):
+        paths += [db.vector_index.matrix_path, db.vector_index.ids_path, db.vector_index.deleted_path]
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def _size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def vacuum(db: DatabaseManager, args):
+    before = _file_sizes(db)
+    if args.full:
+        print("Rewriting the whole database; other writers wait until this finishes...")
+        with db._lock:
+            db.conn.execute(f"PRAGMA auto_vacuum = {SQLITE_AUTO_VACUUM}")
+            db.conn.execute("VACUUM")
+    elif AUTO_VACUUM_MODES[db.conn.execute("PRAGMA auto_vacuum").fetchone()[0]] != "incremental":
+        print("Error: this database was created without incremental auto-vacuum. Run `python maintenance.py vacuum --full` "
+              "once to convert it; it blocks other writers while it rewrites the file.", file=sys.stderr)
+        sys.exit(1)
+
+    # Merge first: it frees pages of its own for the steps below to return.
+    merges = 0
+    while True:
+        with db._writing() as conn:
+            changes = conn.total_changes
+            conn.execute("INSERT INTO conversations_fts (conversations_fts, rank) VALUES ('merge', ?)", (FTS_MERGE_PAGES,))
+            # FTS5 signals that no merge work was left by changing fewer than two rows.
+            if conn.total_changes - changes < 2:
+                break
+        merges += 1
+
+    repacked = []
+    for table in _vec0_tables(db, db.conn.cursor()):
+        with db._writing() as conn:
+            vectors, slots, chunk = table.occupancy(conn.cursor())
+            # Slots come a chunk at a time, so repacking only pays once it frees a whole chunk.
+            if slots > vectors and slots - vectors >= max(chunk, args.repack_above * slots):
+                table.rebuild_from(conn, table)
+                repacked.append(f"{table.table} ({slots - vectors} dead slots)")
+
+    freed = 0
+    while True:
+        with db._writing() as conn:
+            step = min(conn.execute("PRAGMA freelist_count").fetchone()[0], args.pages)
+            # Python's sqlite3 steps a PRAGMA only once, and each step of incremental_vacuum returns one page.
+            for _ in range(step):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+        if not step:
+            break
+        freed += step
+
+    hidden = db.vector_index.deleted_rows() if isinstance(db.vector_index, NumpyIndex) else 0
+    if hidden:
+        db.vector_index.reset(db.conn.cursor())
+    with db._lock:
+        busy = db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+
+    print(f"Keyword index merge steps: {merges}. Repacked: {', '.join(repacked) or 'no vector tables'}.")
+    print(f"Returned {freed} free pages{f'; dropped {hidden} deleted rows from the NumPy mirror' if hidden else ''}.")
+    if busy:
+        print("The WAL is still in use by a reader, so it was only partly checkpointed.")
+    print(f"Files: {_size(before)} -> {_size(_file_sizes(db))}.")
+
+
+def stats(db: DatabaseManager, args):
+    with db._reading() as conn:
+        cursor = conn.cursor()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = AUTO_VACUUM_MODES[cursor.execute("PRAGMA auto_vacuum").fetchone()[0]]
+        wal = os.path.getsize(f"{db.db_path}-wal") if os.path.exists(f"{db.db_path}-wal") else 0
+        print(f"{db.db_path}: {_size(page_count * page_size)} ({page_count} pages of {page_size} B) + {_size(wal)} WAL, "
+              f"{free} pages free ({free / max(page_count, 1):.1%}), auto_vacuum {auto_vacuum}.")
+
+        # Indexes and virtual table shadow tables count towards the table they belong to.
+        schema = cursor.execute("SELECT name, tbl_name, sql FROM sqlite_master").fetchall()
+        virtual = [row['name'] for row in schema if (row['sql'] or '').upper().startswith("CREATE VIRTUAL TABLE")]
+        owners = {}
+        for row in schema:
+            owner = row['tbl_name']
+            for name in virtual:
+                if owner.startswith(f"{name}_") and len(name) > len(owners.get(row['name'], '')):
+                    owners[row['name']] = name
+            owners.setdefault(row['name'], owner)
+        sizes = {}
+        try:
+            for name, size, unused in cursor.execute("SELECT name, pgsize, unused FROM dbstat WHERE aggregate = TRUE"):
+                total = sizes.setdefault(owners.get(name, name), [0, 0])
+                total[0] += size
+                total[1] += unused
+        except Exception as e:
+            print(f"Table sizes unavailable: {e}")
+        if sizes:
+            print(f"\n{'table':<28} {'size':>10} {'unused':>7}")
+            for name, (size, unused) in sorted(sizes.items(), key=lambda item: -item[1][0]):
+                print(f"{name:<28} {_size(size):>10} {unused / max(size, 1):>7.0%}")
+
+        states = dict(cursor.execute("SELECT COALESCE(embedding_state, 'none'), COUNT(*) FROM conversations GROUP BY 1").fetchall())
+        print(f"\nmessages: {sum(states.values())} ({', '.join(f'{count} {state}' for state, count in sorted(states.items())) or 'none'})")
+        print(f"{'vector table':<28} {'vectors':>9} {'slots':>9} {'dead':>6} {'orphans':>8}")
+        message_vectors = 0
+        for table in _vec0_tables(db, cursor):
+            vectors, slots, _ = table.occupancy(cursor)
+            source = "summaries" if table is db.summary_index else "conversations"
+            orphans = cursor.execute(f"SELECT COUNT(*) FROM {table.table} WHERE rowid NOT IN (SELECT id FROM {source})").fetchone()[0]
+            if table is not db.summary_index:
+                message_vectors += vectors - orphans
+            print(f"{table.table:<28} {vectors:>9} {slots:>9} {(slots - vectors) / max(slots, 1):>6.0%} {orphans:>8}")
+        missing = states.get('indexed', 0) - message_vectors
+        if missing:
+            print(f"{missing} messages marked indexed have no vector.")
+    if isinstance(db.vector_index, NumpyIndex):
+        index = db.vector_index
+        mirror = sum(os.path.getsize(path) for path in (index.matrix_path, index.ids_path) if os.path.exists(path))
+        print(f"NumPy mirror: {_size(mirror)}, {index.deleted_rows()} deleted rows still in the files.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply retention to bashbot's memory and reclaim its space.")
+    parser.add_argument("--db", default=DB_PATH, help="Database to operate on.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prune_parser = subparsers.add_parser("prune", help="Delete or empty what the retention policy no longer keeps.")
+    prune_parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Delete turns with no message newer than this; 0 keeps them.")
+    prune_parser.add_argument("--max-turns", type=int, default=RETENTION_MAX_TURNS, help="Keep only the newest turns; 0 keeps them all.")
+    prune_parser.add_argument("--role-days", default=RETENTION_ROLE_DAYS, help="Per-role rules such as 'tool=14,thoughts=30'.")
+    prune_parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Turns or messages per write transaction.")
+    prune_parser.add_argument("--dry-run", action="store_true", help="Count what would go, and stop.")
+    prune_parser.set_defaults(func=prune)
+
+    vacuum_parser = subparsers.add_parser("vacuum", help="Return freed space in short steps.")
+    vacuum_parser.add_argument("--pages", type=int, default=VACUUM_PAGES, help="Free pages returned per transaction.")
+    vacuum_parser.add_argument("--repack-above", type=float, default=REPACK_ABOVE,
+                               help="Repack vector tables whose share of dead chunk slots exceeds this.")
+    vacuum_parser.add_argument("--full", action="store_true", help="Run a complete VACUUM first, enabling incremental vacuum.")
+    vacuum_parser.set_defaults(func=vacuum)
+
+    subparsers.add_parser("stats", help="Show sizes, free space and vector counts.").set_defaults(func=stats)
+
+    args = parser.parse_args()
+    db = DatabaseManager(args.db, write_behind=False)
+    try:
+        args.func(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Moves memory search to another embedding model (EMBEDDING_MODEL, EMBEDDING_DIMENSION).
+
+Usage:
+    python reindex.py [--model NAME] [--batch N] [--force]
+    python reindex.py --status
+    python reindex.py --abort
+
+Vectors from two models can't be compared, so switching models means re-embedding every
+message. This builds a second vector table for the new model next to the live one and fills
+it in batches, while bashbot keeps searching the old one with the old model. Progress is
+checkpointed in db_meta after every batch, so an interrupted run picks up where it stopped.
+Once every message is embedded, one transaction points db_meta's vector_table, embedding_model
+and embedding_dimension at the new table and drops the old one; running processes follow the
+switch on their next query or write. Set EMBEDDING_MODEL and EMBEDDING_DIMENSION to match
+afterwards, or bashbot warns on every start.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from config import DB_PATH, EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL, SQLITE_BATCH_DURABILITY
+from database import DatabaseManager
+from embedding import get_embedding, get_embeddings
+from vector_index import VECTOR_TABLE, NumpyIndex, Vec0Index, summary_table
+
+# Messages are read, embedded and committed this many at a time.
+BATCH_SIZE = 256
+
+# Messages vector search covers that the new table doesn't hold yet.
+REMAINING = """
+            SELECT id, content FROM conversations
+            WHERE id > ? AND role IN ('user', 'assistant') AND content != ''
+              AND (embedding_state IS NULL OR embedding_state NOT IN ('dropped', 'compacted'))
+            ORDER BY id
+            """
+
+CHECKPOINT_KEYS = ('reindex_model', 'reindex_dimension', 'reindex_table', 'reindex_after', 'reindex_summaries_after')
+
+
+def _meta(db: DatabaseManager) -> dict:
+    with db._reading() as conn:
+        return dict(conn.execute("SELECT key, value FROM db_meta").fetchall())
+
+
+def _next_table(current: str) -> str:
+    """vec_conversations, then vec_conversations_g2, _g3 and so on."""
+    match = re.fullmatch(rf"{VECTOR_TABLE}_g(\d+)", current)
+    return f"{VECTOR_TABLE}_g{int(match.group(1)) + 1 if match else 2}"
+
+
+def _drop_index(index, cursor):
+    """Drops an index's tables; a NumPy mirror's files are removed after the commit."""
+    (index.primary if isinstance(index, NumpyIndex) else index).drop(cursor)
+
+
+def show_status(db: DatabaseManager):
+    meta = _meta(db)
+    print(f"Live: {meta['embedding_model']} ({meta['embedding_dimension']} dimensions) in {meta['vector_table']}.")
+    if 'reindex_table' not in meta:
+        print("No re-index in progress.")
+        return
+    with db._reading() as conn:
+        remaining = conn.execute(f"SELECT COUNT(*) FROM ({REMAINING})", (int(meta['reindex_after']),)).fetchone()[0]
+    print(f"Re-indexing to {meta['reindex_model']} ({meta['reindex_dimension']} dimensions) in {meta['reindex_table']}: "
+          f"{remaining} messages to go.")
+
+
+def abort(db: DatabaseManager):
+    """Drops a half-built table and its checkpoint; the live index is untouched."""
+    meta = _meta(db)
+    if 'reindex_table' not in meta:
+        print("No re-index in progress.")
+        return
+    index = db._make_vector_index(meta['reindex_table'], int(meta['reindex_dimension']))
+    with db._writing() as conn:
+        cursor = conn.cursor()
+        _drop_index(index, cursor)
+        Vec0Index(table=summary_table(meta['reindex_table'])).drop(cursor)
+        cursor.execute("DROP TABLE IF EXISTS reindex_failed")
+        cursor.executemany("DELETE FROM db_meta WHERE key = ?", [(key,) for key in CHECKPOINT_KEYS])
+    _remove_mirror(db, meta['reindex_table'])
+    print(f"Aborted the re-index to {meta['reindex_model']}.")
+
+
+def _remove_mirror(db: DatabaseManager, table: str):
+    for path in glob.glob(f"{glob.escape(db._mirror_path(table))}.float*"):
+        os.remove(path)
+
+
+def start(db: DatabaseManager, model: str) -> dict:
+    """Creates the new table and the checkpoint, probing the model for its dimension."""
+    vector = get_embedding("dimension probe", model)
+    if not vector:
+        print(f"Error: could not embed with {model}. Is it pulled in Ollama?", file=sys.stderr)
+        sys.exit(1)
+    meta = _meta(db)
+    table = _next_table(meta['vector_table'])
+    index = db._make_vector_index(table, len(vector))
+    with db._writing() as conn:
+        cursor = conn.cursor()
+        index.create(cursor)
+        Vec0Index(dimension=len(vector), table=summary_table(table)).create(cursor)
+        cursor.execute("CREATE TABLE IF NOT EXISTS reindex_failed (id INTEGER PRIMARY KEY)")
+        cursor.executemany("INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)", (
+                ('reindex_model', model),
+                ('reindex_dimension', str(len(vector))),
+                ('reindex_table', table),
+                ('reindex_after', '0'),
+                ('reindex_summaries_after', '0'),
+                ))
+    print(f"Re-indexing to {model} ({len(vector)} dimensions) in {table}.")
+    return _meta(db)
+
+
+def fill(db: DatabaseManager, meta: dict, batch_size: int) -> int:
+    """Embeds every message past the checkpoint into the new table. Returns how many were embedded."""
+    index = db._make_vector_index(meta['reindex_table'], int(meta['reindex_dimension']))
+    model, after = meta['reindex_model'], int(_meta(db)['reindex_after'])
+    done, started = 0, time.perf_counter()
+    while True:
+        with db._reading() as conn:
+            rows = conn.execute(f"{REMAINING} LIMIT ?", (after, batch_size)).fetchall()
+        if not rows:
+            return done
+        # Embed outside the writer, so the agent's own writes aren't held up by the round-trips.
+        matrix = get_embeddings([row['content'] for row in rows], batch_size=EMBEDDING_BATCH_SIZE, model=model)
+        with db._writing(SQLITE_BATCH_DURABILITY) as conn:
+            cursor = conn.cursor()
+            for row, vector in zip(rows, matrix):
+                if np.isnan(vector).any():
+                    cursor.execute("INSERT OR IGNORE INTO reindex_failed (id) VALUES (?)", (row['id'],))
+                else:
+                    index.insert(cursor, row['id'], vector)
+            after = rows[-1]['id']
+            cursor.execute("UPDATE db_meta SET value = ? WHERE key = 'reindex_after'", (str(after),))
+        done += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"  embedded {done} messages, up to id {after} ({done / elapsed:.1f} rows/s)")
+
+
+def fill_summaries(db: DatabaseManager, meta: dict, batch_size: int) -> int:
+    """Embeds every summary past its checkpoint (see compact.py) into the new summary table."""
+    index = Vec0Index(dimension=int(meta['reindex_dimension']), table=summary_table(meta['reindex_table']))
+    after = int(_meta(db).get('reindex_summaries_after', 0))
+    done = 0
+    while True:
+        with db._reading() as conn:
+            rows = conn.execute("SELECT id, summary_content FROM summaries WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size)).fetchall()
+        if not rows:
+            return done
+        matrix = get_embeddings([row['summary_content'] for row in rows], batch_size=EMBEDDING_BATCH_SIZE, model=meta['reindex_model'])
+        if np.isnan(matrix).any():
+            # A summary stands in for whole turns, so it can't be left out; stop and let a rerun retry.
+            print("Error: some summaries could not be embedded; run the same command again to retry.", file=sys.stderr)
+            sys.exit(1)
+        with db._writing(SQLITE_BATCH_DURABILITY) as conn:
+            cursor = conn.cursor()
+            for row, vector in zip(rows, matrix):
+                index.insert(cursor, row['id'], vector)
+            after = rows[-1]['id']
+            cursor.execute("INSERT OR REPLACE INTO db_meta (key, value) VALUES ('reindex_summaries_after', ?)", (str(after),))
+        done += len(rows)
+        print(f"  embedded {done} summaries")
+
+
+def swap(db: DatabaseManager, meta: dict) -> bool:
+    """
+    Makes the new table live in one transaction, unless messages arrived since the last batch.
+    Returns False if there are more to embed first.
+    """
+    with db._writing() as conn:
+        cursor = conn.cursor()
+        old_table, old_index = db.vector_table, db.vector_index
+        after = int(cursor.execute("SELECT value FROM db_meta WHERE key = 'reindex_after'").fetchone()[0])
+        summaries_after = int((cursor.execute("SELECT value FROM db_meta WHERE key = 'reindex_summaries_after'").fetchone() or [0])[0])
+        if (cursor.execute(f"SELECT 1 FROM ({REMAINING}) LIMIT 1", (after,)).fetchone()
+                or cursor.execute("SELECT 1 FROM summaries WHERE id > ?", (summaries_after,)).fetchone()):
+            return False
+        # Rows embedded now; rows the new model failed on are left for a later rebuild, like any unembedded row.
+        cursor.execute(
+                """
+                UPDATE conversations SET embedding_state = CASE WHEN id IN (SELECT id FROM reindex_failed) THEN NULL ELSE 'indexed' END
+                WHERE id <= ? AND role IN ('user', 'assistant') AND content != ''
+                  AND (embedding_state IS NULL OR embedding_state NOT IN ('dropped', 'compacted'))
+                """,
+                (after,)
+                )
+        _drop_index(old_index, cursor)
+        db.summary_index.drop(cursor)
+        cursor.executemany("UPDATE db_meta SET value = ? WHERE key = ?", (
+                (meta['reindex_table'], 'vector_table'),
+                (meta['reindex_model'], 'embedding_model'),
+                (meta['reindex_dimension'], 'embedding_dimension'),
+                ))
+        cursor.executemany("DELETE FROM db_meta WHERE key = ?", [(key,) for key in CHECKPOINT_KEYS])
+        cursor.execute("DROP TABLE reindex_failed")
+    if isinstance(old_index, NumpyIndex):
+        _remove_mirror(db, old_table)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed bashbot's memory with another embedding model.")
+    parser.add_argument("--db", default=DB_PATH, help="Database to re-index.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Embedding model to move to. Defaults to EMBEDDING_MODEL.")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Messages embedded and committed together.")
+    parser.add_argument("--force", action="store_true", help="Re-embed even if the live vectors already come from the model.")
+    parser.add_argument("--status", action="store_true", help="Show the live model and any re-index in progress.")
+    parser.add_argument("--abort", action="store_true", help="Drop a re-index in progress, keeping the live index.")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db, write_behind=False)
+    try:
+        if args.status:
+            return show_status(db)
+        if args.abort:
+            return abort(db)
+
+        meta = _meta(db)
+        if 'reindex_table' in meta:
+            if meta['reindex_model'] != args.model:
+                print(f"Error: a re-index to {meta['reindex_model']} is in progress. Resume it with --model "
+                      f"{meta['reindex_model']}, or drop it with --abort.", file=sys.stderr)
+                sys.exit(1)
+            print(f"Resuming the re-index to {args.model} after message {meta['reindex_after']}.")
+        elif meta['embedding_model'] == args.model and not args.force:
+            print(f"The live vectors already come from {args.model}; pass --force to re-embed them anyway.")
+            return
+        else:
+            meta = start(db, args.model)
+
+        started, embedded = time.perf_counter(), 0
+        try:
+            while True:
+                embedded += fill(db, meta, args.batch)
+                fill_summaries(db, meta, args.batch)
+                if swap(db, meta):
+                    break
+        except KeyboardInterrupt:
+            print("\nInterrupted; run the same command again to resume.", file=sys.stderr)
+            sys.exit(130)
+        print(f"Embedded {embedded} messages in {time.perf_counter() - started:.1f} s. "
+              f"Memory search now uses {meta['reindex_model']} ({meta['reindex_dimension']} dimensions).")
+    finally:
+        db.close()
+
+
+def _self_test():
+    import contextlib
+    import io
+    import tempfile
+
+    import embedding
+    from embedding_cache import EmbeddingCache
+    from stand_ins import StandInOllama
+
+    print("--- Running reindex.py Test Suite ---")
+    with StandInOllama(model_dimensions={"mini": 384}) as ollama, tempfile.TemporaryDirectory() as tmp:
+        # config was read at import, so point the embedder at the stand-in and keep its cache off disk.
+        embedding.OLLAMA_HOST = ollama.url
+        embedding._cache = EmbeddingCache()
+        db = DatabaseManager(os.path.join(tmp, "reindex.db"), write_behind=False)
+        try:
+            turn_id = db.get_new_turn_id()
+            for i in range(10):
+                db.add_message(turn_id, "user", f"Note {i}: the disk on host-{i} was replaced.")
+
+            print("\n1. A message arriving between fill and swap...")
+            with contextlib.redirect_stdout(io.StringIO()):
+                meta = start(db, "mini")
+                assert fill(db, meta, batch_size=4) == 10
+            db.add_message(db.get_new_turn_id(), "user", "Late note: host-3 needs a new fan.")
+            assert not swap(db, meta), "The swap should wait for the late message."
+            # meta still holds the checkpoint from start(); fill must resume from the stored one.
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert fill(db, meta, batch_size=4) == 1, "Only the late message should be embedded."
+            assert swap(db, meta)
+            print("  > PASSED: The late message was embedded on its own, then the swap went through.")
+
+            print("\n2. Searching the new table...")
+            query = np.asarray(get_embedding("Late note: host-3 needs a new fan.", "mini"), dtype=np.float32)
+            hits = db.find_similar_memories(query, top_k=1, mode="vector", model="mini")
+            assert hits and hits[0]['content'].startswith("Late note"), f"Expected the late note first, got {hits}."
+            with db._reading() as conn:
+                indexed = conn.execute(f"SELECT COUNT(*) FROM {db.vector_table}").fetchone()[0]
+                states = conn.execute("SELECT COUNT(*) FROM conversations WHERE embedding_state = 'indexed'").fetchone()[0]
+            assert (db.embedding_model, db.embedding_dimension, indexed, states) == ("mini", 384, 11, 11)
+            print(f"  > PASSED: {indexed} vectors from mini in {db.vector_table}, and the late note is found.")
+        finally:
+            db.close()
+    print("\n--- All Tests Complete ---")
+
+
+# --- Self-contained Test Block ---
+# `python reindex.py --self-test` runs it; any other arguments re-index as usual.
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--self-test"]:
+        _self_test()
+    else:
+        main()
@@ -1,94 +1,318 @@
+import sys
+
+if __name__ == "__main__":
+    # With a daemon running, hand the call over before paying for the imports below.
+    from client import forward
+    status = forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
 import json
 import os
 import argparse
-import requests
-import sys
-import numpy as np
-
-from embedding import get_embedding
-from database import DatabaseManager
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Checking the dependencies here instead of in run.sh saves starting a second interpreter per call.
+try:
+    import requests
+    import numpy as np
+
+    from embedding import get_embedding
+    from http_client import get_client
+    from database import DatabaseManager, EmbeddingMismatchError
+except ImportError as e:
+    print(f"Error: {e}. Install the required packages into bashbot's venv:\n  pip install -r requirements.txt", file=sys.stderr)
+    sys.exit(1)
+from context import build_context
+from turn_state import TurnState
 from config import *
-from tools import AVAILABLE_TOOLS
+
+# Shared pool for tool calls; bounded so a burst of calls can't spawn unbounded threads.
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+
+# Timed-out tool calls still running, as (pool, future); see _abandon_tool_call.
+_stuck_tool_calls = set()
+# Reentrant: a call finishing just as it is abandoned runs its done callback under the lock.
+_stuck_lock = threading.RLock()
+
+# Parsed manifests per tools directory, with the file names and mtimes they were read from.
+_manifest_cache = {}
 
 def load_tool_manifests(tools_dir: str) -> list:
-    """Loads all tool manifest .json files from the specified directory."""
-    manifests = []
+    """
+    Loads all tool manifest .json files from the specified directory.
+    The parsed manifests are cached and reused until a file in the directory changes.
+    """
     if not os.path.isdir(tools_dir):
         print(f"Warning: Tools directory not found at '{tools_dir}'", file=sys.stderr)
-        return manifests
+        return []
+
+    files = sorted((entry.name, entry.stat().st_mtime_ns) for entry in os.scandir(tools_dir) if entry.name.endswith(".json"))
+    cached = _manifest_cache.get(tools_dir)
+    if cached is not None and cached[0] == files:
+        return cached[1]
 
-    for filename in os.listdir(tools_dir):
-        if filename.endswith(".json"):
-            filepath = os.path.join(tools_dir, filename)
-            with open(filepath, 'r') as f:
-                manifests.append(json.load(f))
+    manifests = []
+    for filename, _ in files:
+        with open(os.path.join(tools_dir, filename), 'r') as f:
+            manifests.append(json.load(f))
+    _manifest_cache[tools_dir] = (files, manifests)
     return manifests
 
-# currently borked
-def run_agentic_turn(initial_prompt: str, db: DatabaseManager, tool_manifests: list):
+def available_tools() -> dict:
+    """The tool functions by name, imported on the first tool call so turns without one skip it."""
+    from tools import AVAILABLE_TOOLS
+    return AVAILABLE_TOOLS
+
+def api_tools(tool_manifests: list) -> list:
+    """Strips bashbot's own manifest settings so only the official tool schema is sent to Ollama."""
+    return [{key: value for key, value in manifest.items() if key != 'bashbot'} for manifest in tool_manifests]
+
+def tool_policies(tool_manifests: list) -> dict:
+    """
+    Maps each tool name to its execution policy from the manifest's optional "bashbot" block:
+        parallel_safe: May run alongside other tool calls (default False).
+        timeout: Seconds before the call is abandoned (default TOOL_TIMEOUT).
+    """
+    policies = {}
+    for manifest in tool_manifests:
+        settings = manifest.get('bashbot', {})
+        policies[manifest['function']['name']] = {
+                'parallel_safe': settings.get('parallel_safe', False),
+                'timeout': settings.get('timeout', TOOL_TIMEOUT),
+                }
+    return policies
+
+def keep_alive(value: str = OLLAMA_KEEP_ALIVE):
+    """Parses OLLAMA_KEEP_ALIVE: plain numbers are seconds, anything else ("30m") is a duration string."""
+    if value is None or value == "":
+        return None
+    return int(value) if value.lstrip('-').isdigit() else value
+
+async def _stream_chat(payload: dict):
+    """
+    Yields the NDJSON chunks of a streaming /api/chat call without blocking the event loop.
+    The blocking HTTP read runs on a worker thread that feeds an asyncio queue.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    finished = object()
+
+    def read_stream():
+        try:
+            with get_client().stream("POST", f"{OLLAMA_HOST}/api/chat", json=payload) as response:
+                response.raise_for_status() # Will raise an exception for bad status codes
+                for chunk in response.iter_lines():
+                    if chunk:
+                        loop.call_soon_threadsafe(chunks.put_nowait, json.loads(chunk))
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, finished)
+
+    reader = asyncio.create_task(asyncio.to_thread(read_stream))
+    try:
+        while (item := await chunks.get()) is not finished:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        await reader
+
+def _execute_tool(tool_call: dict, db: DatabaseManager) -> str:
+    """Runs a single tool call and returns its output as a string."""
+    tool_name = tool_call['function']['name']
+    tool_args = tool_call['function']['arguments']
+    tool_function = available_tools()[tool_name]
+    try:
+        func_sig = inspect.signature(tool_function)
+        final_tool_args = dict(tool_args)
+        if 'db' in func_sig.parameters:
+            final_tool_args['db'] = db
+
+        return str(tool_function(**final_tool_args))
+    except Exception as e:
+        return f"[TOOL_ERROR] An unexpected error occurred: {e}"
+
+def stuck_tool_workers() -> int:
+    """How many tool worker threads are still running calls that already timed out."""
+    with _stuck_lock:
+        return len(_stuck_tool_calls)
+
+def _abandon_tool_call(pool: ThreadPoolExecutor, future) -> int:
+    """
+    Gives up on a timed-out call and returns how many workers are stuck on such calls.
+    Threads can't be killed, so a hung tool keeps its worker. Once every worker of the pool
+    is stuck, later calls would only queue until they timed out as well; the pool is then
+    replaced, and the stuck threads finish, or hang, in the old one.
+    """
+    global TOOL_EXECUTOR
+    with _stuck_lock:
+        # A call that never left the queue was cancelled by the timeout and holds no worker.
+        if not future.done():
+            entry = (pool, future)
+            _stuck_tool_calls.add(entry)
+            future.add_done_callback(lambda _: _release_tool_call(entry))
+        stuck_in_pool = sum(1 for stuck_pool, _ in _stuck_tool_calls if stuck_pool is TOOL_EXECUTOR)
+        if stuck_in_pool >= TOOL_MAX_WORKERS:
+            TOOL_EXECUTOR.shutdown(wait=False)
+            TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool")
+        return len(_stuck_tool_calls)
+
+def _release_tool_call(entry: tuple):
+    """Forgets a timed-out call once its thread finally returns."""
+    with _stuck_lock:
+        _stuck_tool_calls.discard(entry)
+
+async def _run_tool_call(tool_call: dict, db: DatabaseManager, policy: dict) -> str:
+    """Runs one tool call on the tool pool, giving up after the tool's timeout."""
+    tool_name = tool_call['function']['name']
+    with _stuck_lock:
+        pool = TOOL_EXECUTOR
+        future = pool.submit(_execute_tool, tool_call, db)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), policy['timeout'])
+    except asyncio.TimeoutError:
+        # The result, if the tool ever returns, is dropped.
+        stuck = _abandon_tool_call(pool, future)
+        return (f"[TOOL_ERROR] Tool '{tool_name}' timed out after {policy['timeout']} seconds "
+                f"({stuck} tool worker{'s' if stuck != 1 else ''} stuck on timed-out calls).")
+
+async def _run_tool_calls(tool_calls: list, db: DatabaseManager, policies: dict, overlap: bool = True, out=None) -> list[str]:
+    """
+    Runs the tool calls of one assistant message and returns their outputs in call order.
+    Consecutive parallel-safe calls run concurrently; any other call runs on its own.
+    """
+    out = out or sys.stdout
+    default_policy = {'parallel_safe': False, 'timeout': TOOL_TIMEOUT}
+
+    # Split the calls into groups that may run together, preserving call order.
+    groups = []
+    for index, tool_call in enumerate(tool_calls):
+        policy = policies.get(tool_call['function']['name'], default_policy)
+        if overlap and policy['parallel_safe'] and groups and groups[-1][1]:
+            groups[-1][0].append(index)
+        else:
+            groups.append(([index], overlap and policy['parallel_safe']))
+
+    results = [None] * len(tool_calls)
+    for indices, _ in groups:
+        pending = {}
+        for index in indices:
+            tool_name = tool_calls[index]['function']['name']
+            tool_args = tool_calls[index]['function']['arguments']
+            print(f"\n{Colors.GREY}<Executing tool: {tool_name}({json.dumps(tool_args)})>{Colors.RESET}", file=out)
+            if tool_name in available_tools():
+                pending[index] = _run_tool_call(tool_calls[index], db, policies.get(tool_name, default_policy))
+
+        outputs = dict(zip(pending, await asyncio.gather(*pending.values())))
+
+        for index in indices:
+            tool_name = tool_calls[index]['function']['name']
+            if index in outputs:
+                results[index] = outputs[index]
+                print(f"{Colors.GREY}<Tool Output>\n{results[index]}\n</Tool Output>{Colors.RESET}", file=out)
+            else:
+                results[index] = f"Tool '{tool_name}' not found."
+                print(f"{Colors.GREY}[TOOL_ERROR] {results[index]}{Colors.RESET}", file=out)
+    return results
+
+async def run_agentic_turn_async(initial_prompt: str, db: DatabaseManager, tool_manifests: list, overlap: bool = True,
+                                 layout: str = PROMPT_LAYOUT, out=None, err=None) -> int:
     """
     Runs the full agentic loop for a single user request.
     This includes reasoning, tool calls, and generating a final response.
+
+    Independent steps overlap: the RAG embedding and KNN search run alongside the history
+    fetch, and the assistant message is embedded and saved while its tool calls execute.
+    Blocking database, embedding and HTTP work runs on worker threads.
+    The turn's messages and memories accumulate in a TurnState, so each iteration only
+    adds what changed instead of re-reading the turn from the database.
+
+    Args:
+        overlap: Set to False to run every step strictly in sequence (used for benchmarking).
+        layout: The prompt layout, "rag_first" or "stable_prefix" (see context.build_context).
+        out, err: Text streams the thinking, response, tool output and errors are written to
+                  as they arrive; sys.stdout and sys.stderr by default. The daemon passes
+                  streams that forward to its client.
+
+    Returns:
+        The id of the turn.
     """
 
-    turn_id = db.get_new_turn_id()
-    db.add_message(turn_id, "user", initial_prompt)
-    history = db.get_long_term_history(current_turn_id=turn_id, limit=64)
+    out = out or sys.stdout
+    err = err or sys.stderr
+
+    async def gather(*steps):
+        if overlap:
+            return await asyncio.gather(*steps)
+        return [await step for step in steps]
+
+    async def retrieve(query_text: str) -> list[dict]:
+        # Get relevent associateve memories using the query text as the source.
+        # Embed with the model behind the stored vectors, which lags EMBEDDING_MODEL until reindex.py runs.
+        model = db.embedding_model
+        query_vector = await asyncio.to_thread(get_embedding, query_text, model)
+        if not query_vector:
+            return []
+        query_np_vector = np.array(query_vector, dtype=np.float32)
+        try:
+            return await asyncio.to_thread(db.find_similar_memories, query_np_vector, top_k=RAG_TOP_K, query_text=query_text, model=model)
+        except EmbeddingMismatchError:
+            # reindex.py swapped models between embedding and searching; the next turn uses the new one.
+            return []
+
+    async def save_prompt_and_retrieve() -> list[dict]:
+        # Retrieval embeds the prompt first, so saving it afterwards is a cache hit.
+        similar_memories = await retrieve(initial_prompt)
+        await asyncio.to_thread(state.add_message, "user", initial_prompt)
+        return similar_memories
+
+    turn_id = await asyncio.to_thread(db.get_new_turn_id)
+    state = TurnState(db, turn_id)
+    policies = tool_policies(tool_manifests)
+    tools = api_tools(tool_manifests)
+    context_usage = {}
+    prompt_evals = []
     final_stats_chunk = {}
+    next_retrieval = None
 
     #---2: The Agentic Loop---
     for i in range(MAX_AGENT_TURNS):
 
         #---3: API Call---
-        messages_for_this_turn = db.get_messages_for_turn(turn_id=turn_id)
-        # Get relevent associateve memories using most recent message as query source.
-        rag_query_text = messages_for_this_turn[-1]['content']
-        # print(f"{Colors.GREY}[CONTEXT] Searching for memories related to: '{rag_query_text[:50]}...'{Colors.RESET}")
-
-        query_vector = get_embedding(rag_query_text)
-        important_memories = []
-        if query_vector:
-            query_np_vector = np.array(query_vector, dtype=np.float32)
-            similar_memories = db.find_similar_memories(query_np_vector, top_k=32)
-
-            turn_content = {msg['content'] for msg in messages_for_this_turn}
-            history_content = {msg['content'] for msg in history}
-            content_to_ignore = turn_content | history_content
-            relevant_memories = [mem for mem in similar_memories if mem['content'] not in content_to_ignore]
-
-            # print(f"[DEBUG] Found {len(turn_content)} messages this turn.")
-            # print(f"[DEBUG] Found {len(history_content)} messages in history.")
-            # print(f"[DEBUG] Found {len(content_to_ignore)} messages in both, less repeats.")
-            # print(f"[DEBUG] Memories in content_to_ignore: {json.dumps(list(content_to_ignore), indent=2)}")
-            # print(f"[DEBUG] Found {len(similar_memories)} similar memories via vector search.")
-            # print(f"[DEBUG] Memories in similar_memories: {json.dumps(similar_memories, indent=2)}")
-
-            if relevant_memories:
-                rag_context_content = "---Relevant Long-Term Memories---\n"
-                for mem in relevant_memories:
-                    rag_context_content += f"Memory from Turn {mem['turn_id']} ({mem['role']}): {mem['content']}\n"
-                # Add the RAG context as the first system message.
-                important_memories = [{"role": "system", "content": rag_context_content.strip()}]
-                # print("\n---Memories:\n")
-                # print(json.dumps(important_memories, indent=2))
-
-        # Assemble the full message history for the API call
-        # print("\n---History:\n")
-        # print(json.dumps(history, indent=2))
-        # print("\n---Messages for Turn:\n")
-        # print(json.dumps(messages_for_this_turn, indent=2))
-        full_message_history = important_memories + history + messages_for_this_turn
-        # print(f"The message being sent to the bot now is {json.dumps(full_message_history, indent=2)}.")
+        if i == 0:
+            similar_memories, state.history = await gather(
+                    save_prompt_and_retrieve(),
+                    asyncio.to_thread(db.get_long_term_history, current_turn_id=turn_id, limit=CONTEXT_HISTORY_MESSAGES)
+                    )
+        else:
+            # The most recent message (the last tool output) is the query source.
+            similar_memories = await next_retrieval
+        state.add_memories(similar_memories)
+
+        # Assemble the messages for the API call within the context window's token budget.
+        full_message_history, context_usage = build_context(state.memories, state.history, state.messages, tools, layout=layout,
+                                                            fixed_history=state.history_fixed)
+        if layout == "stable_prefix":
+            state.fix_history(context_usage['dropped_history'])
 
         payload = {
                 "model": MODEL_NAME,
                 "messages": full_message_history,
-                "tools": tool_manifests,
+                "tools": tools,
                 "stream": True,
                 "think": True
                 }
+        if keep_alive() is not None:
+            payload["keep_alive"] = keep_alive()
 
         #---4: Process---
+        # This iteration's usage and assistant message are committed together before any tool runs.
+        iteration = db.transaction()
         full_content = ""
         full_thoughts = ""
         tool_calls = []
@@ -97,75 +321,76 @@ def run_agentic_turn(initial_prompt: str, db: DatabaseManager, tool_manifests: l
         response_printed = False
 
         try:
-            with requests.post(f"{OLLAMA_HOST}/api/chat", json=payload, stream=True) as response:
-                response.raise_for_status() # Will raise an exception for bad status codes
-                for chunk in response.iter_lines():
-                    if chunk:
-                        chunk_json = json.loads(chunk)
-
-                        thinking_part = chunk_json['message'].get('thinking', '')
-                        if thinking_part:
-                            if not thinking_printed:
-                                print(f"{Colors.GREY}Thinking:{Colors.RESET} ", end='', flush=True)
-                                thinking_printed = True
-                            print(f"{Colors.GREY}{thinking_part}{Colors.RESET}", end='', flush=True) 
-                            full_thoughts += thinking_part
-
-                        content_part = chunk_json['message'].get('content', '')
-                        if content_part:
-                            if not response_printed:
-                                print(f"\nResponse: ", end='', flush=True)
-                                response_printed = True
-                            print(content_part, end='', flush=True)
-                            full_content += content_part
-
-                        if chunk_json['message'].get('tool_calls'):
-                            tool_calls.extend(chunk_json['message']['tool_calls'])
-
-                        if chunk_json.get('done'):
-                            final_stats_chunk = chunk_json
-                            break
+            async for chunk_json in _stream_chat(payload):
+                thinking_part = chunk_json['message'].get('thinking', '')
+                if thinking_part:
+                    if not thinking_printed:
+                        print(f"{Colors.GREY}Thinking:{Colors.RESET} ", end='', flush=True, file=out)
+                        thinking_printed = True
+                    print(f"{Colors.GREY}{thinking_part}{Colors.RESET}", end='', flush=True, file=out) 
+                    full_thoughts += thinking_part
+
+                content_part = chunk_json['message'].get('content', '')
+                if content_part:
+                    if not response_printed:
+                        print(f"\nResponse: ", end='', flush=True, file=out)
+                        response_printed = True
+                    print(content_part, end='', flush=True, file=out)
+                    full_content += content_part
+
+                if chunk_json['message'].get('tool_calls'):
+                    tool_calls.extend(chunk_json['message']['tool_calls'])
+
+                if chunk_json.get('done'):
+                    final_stats_chunk = chunk_json
+                    # Ollama counts only the tokens it had to evaluate, so a reused KV-cache prefix shows up as a drop here.
+                    prompt_evals.append((chunk_json.get('prompt_eval_count', 0), chunk_json.get('prompt_eval_duration', 0)))
+                    iteration.record_turn_usage(turn_id, chunk_json.get('prompt_eval_count', 0), chunk_json.get('eval_count', 0))
 
         except requests.exceptions.RequestException as e:
-            print(f"\nAPI Error: Could not connect to Ollama. Is the server running? Details: {e}", file=sys.stderr)
-            return
+            print(f"\nAPI Error: Could not connect to Ollama. Is the server running? Details: {e}", file=err)
+            # Keep the usage if the stream broke after reporting it.
+            await asyncio.to_thread(iteration.commit)
+            return turn_id
 
-        print() # Final newline after streaming is done.
+        print(file=out) # Final newline after streaming is done.
 
         #---5: Save and Decide---
-        # Save the assistant's complete message (which might be thoughts and a final answer)
-        db.add_message(turn_id, "assistant", full_content, tool_calls, thoughts=full_thoughts)
+        # Stage the assistant's complete message (which might be thoughts and a final answer).
+        state.add_message("assistant", full_content, tool_calls, thoughts=full_thoughts, unit=iteration)
 
         if not tool_calls:
             # IT'S A FINAL ANSWER
-            print(f"\n{Colors.GREY}---Task Complete---{Colors.RESET}")
+            await asyncio.to_thread(iteration.commit)
+            print(f"\n{Colors.GREY}---Task Complete---{Colors.RESET}", file=out)
             break
 
-        for tool_call in tool_calls:
-            tool_name = tool_call['function']['name']
-            tool_args = tool_call['function']['arguments']
-
-            print(f"\n{Colors.GREY}<Executing tool: {tool_name}({json.dumps(tool_args)})>{Colors.RESET}")
-
-            if tool_name in AVAILABLE_TOOLS:
-                tool_function = AVAILABLE_TOOLS[tool_name]
-                try:
-                    import inspect
-                    func_sig = inspect.signature(tool_function)
-                    final_tool_args = tool_args
-                    if 'db' in func_sig.parameters:
-                        final_tool_args['db'] = db
-
-                    result_content = str(tool_function(**final_tool_args))
-                except Exception as e:
-                    result_content = f"[TOOL_ERROR] An unexpected error occurred: {e}"
-
-                db.add_message(turn_id, "tool", result_content)
-                print(f"{Colors.GREY}<Tool Output>\n{result_content}\n</Tool Output>{Colors.RESET}")
-            else:
-                error_message = f"Tool '{tool_name}' not found."
-                print(f"{Colors.GREY}[TOOL_ERROR] {error_message}{Colors.RESET}")
-                db.add_message(turn_id, "tool", error_message)
+        # Commit the tool calls before running them, so a tool that raises or is interrupted can't
+        # lose them or the usage. The embedding round-trip and commit overlap with the tool calls.
+        save_assistant = asyncio.to_thread(iteration.commit)
+        if overlap:
+            save_assistant = asyncio.create_task(save_assistant)
+        else:
+            await save_assistant
+        try:
+            tool_results = await _run_tool_calls(tool_calls, db, policies, overlap, out)
+        finally:
+            if overlap:
+                await save_assistant
+
+        # Start the next iteration's retrieval now, so embedding the last tool output
+        # overlaps with committing the tool results.
+        # The last iteration has no next one to feed.
+        if i < MAX_AGENT_TURNS - 1:
+            next_retrieval = retrieve(tool_results[-1])
+            if overlap:
+                next_retrieval = asyncio.create_task(next_retrieval)
+
+        # Tool rows are committed after the assistant row so the turn replays in order.
+        results = db.transaction()
+        for result_content in tool_results:
+            state.add_message("tool", result_content, unit=results)
+        await asyncio.to_thread(results.commit)
             
     #---6: Print Metrics---
     # This block now runs after the agentic loop (for i in range...) is finished.
@@ -179,11 +404,22 @@ def run_agentic_turn(initial_prompt: str, db: DatabaseManager, tool_manifests: l
 
         total_context = MODEL_CONTEXT_WINDOW
 
-        print(f"\n{Colors.GREY}---Metrics---")
-        print(f"Context: {prompt_tokens} / {total_context} tokens")
-        print(f"Output: {response_tokens} tokens")
-        print(f"Speed: {tokens_per_sec:.2f} tokens/sec")
-        print(f"-------------{Colors.RESET}")
+        print(f"\n{Colors.GREY}---Metrics---", file=out)
+        print(f"Context: {prompt_tokens} / {total_context} tokens", file=out)
+        print(f"Prompt budget: {context_usage['memories'] + context_usage['history'] + context_usage['turn']} / {context_usage['budget']} estimated tokens "
+              f"(memories {context_usage['memories']}, history {context_usage['history']}, turn {context_usage['turn']})", file=out)
+        for step, (eval_count, eval_duration_ns) in enumerate(prompt_evals, 1):
+            print(f"Prompt eval {step}: {eval_count} tokens in {eval_duration_ns / 1_000_000:.1f} ms", file=out)
+        print(f"Output: {response_tokens} tokens", file=out)
+        if stuck_tool_workers():
+            print(f"Stuck tool workers: {stuck_tool_workers()}", file=out)
+        print(f"Speed: {tokens_per_sec:.2f} tokens/sec", file=out)
+        print(f"-------------{Colors.RESET}", file=out)
+    return turn_id
+
+def run_agentic_turn(initial_prompt: str, db: DatabaseManager, tool_manifests: list):
+    """Synchronous entry point for one agentic turn; runs the asyncio loop to completion."""
+    asyncio.run(run_agentic_turn_async(initial_prompt, db, tool_manifests))
 
 def run_interactive_mode(db: DatabaseManager, tool_manifests: list):
     """Starts a continuous chat session that uses the full agentic loop."""
@@ -214,15 +450,17 @@ def main():
     parser.add_argument("--agent", type=str, dest='agent_goal', help="Run in autonomous agent mode with the given high-level goal.")
     args = parser.parse_args()
 
-    db = DatabaseManager(DB_PATH)
-    tool_manifests = load_tool_manifests(TOOLS_DIR)
-
     if args.agent_goal:
         print(f"---Autonomous Agent Mode---")
         print(f"Goal: {args.agent_goal}")
         print("Note: Autonomous mode is not yet implemented")
         # Future: call run_autonomous_mode(args.agent_goal, db, tool_manifests)
-    elif args.prompt:
+        return
+
+    db = DatabaseManager(DB_PATH)
+    tool_manifests = load_tool_manifests(TOOLS_DIR)
+
+    if args.prompt:
         #---One-Shot---
         run_agentic_turn(args.prompt, db, tool_manifests)
     else:
@@ -5,26 +5,19 @@
 SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
 
 # --- Environment Check ---
-if [ -z "$VIRTUAL_ENV" ] || [ ! -d "$VIRTUAL_ENV" ]; then
-    VENV_ACTIVATE="$SCRIPT_DIR/.venv/bin/activate"
-    if [ -f "$VENV_ACTIVATE" ]; then
-        echo "Virtual environment not active. Activating..."
-        source "$VENV_ACTIVATE"
-    else
-        echo "Error: Python virtual environment not found in '$SCRIPT_DIR/venv'."
-        echo "Please run 'python3 -m venv venv' in the project directory."
-        exit 1
-    fi
-fi
-
-# --- Check for Dependencies ---
-if ! python3 -c "import requests; import dotenv" &> /dev/null; then
-    echo "Error: Required Python packages are not installed in this venv."
-    echo "Please activate the venv ('source venv/bin/activate') and run:"
-    echo "  pip install -r requirements.txt"
+# Use the active venv, or else the project's own (init.sh creates ./venv); its python needs no activation.
+if [ -n "$VIRTUAL_ENV" ] && [ -d "$VIRTUAL_ENV" ]; then
+    PYTHON="$VIRTUAL_ENV/bin/python3"
+elif [ -x "$SCRIPT_DIR/venv/bin/python3" ]; then
+    PYTHON="$SCRIPT_DIR/venv/bin/python3"
+elif [ -x "$SCRIPT_DIR/.venv/bin/python3" ]; then
+    PYTHON="$SCRIPT_DIR/.venv/bin/python3"
+else
+    echo "Error: Python virtual environment not found in '$SCRIPT_DIR/venv'." >&2
+    echo "Please run ./init.sh, or 'python3 -m venv venv' in the project directory." >&2
     exit 1
 fi
 
 # --- Execute the Agent ---
-# Run the agent.py script, which is in the same directory as this launcher.
-python3 "$SCRIPT_DIR/run.py" "$@"
+# run.py reports missing packages itself, so no separate dependency check is needed here.
+exec "$PYTHON" "$SCRIPT_DIR/run.py" "$@"
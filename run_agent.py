@@ -44,7 +44,7 @@ def run_agentic_turn(initial_prompt: str, db: DatabaseManager, tool_manifests: l
         rag_query_text = messages_for_this_turn[-1]['content']
         # print(f"{Colors.GREY}[CONTEXT] Searching for memories related to: '{rag_query_text[:50]}...'{Colors.RESET}")
 
-        query_vector = get_embedding(rag_query_text)
+        query_vector = get_embedding(rag_query_text, db.embedding_model)
         important_memories = []
         if query_vector:
             query_np_vector = np.array(query_vector, dtype=np.float32)
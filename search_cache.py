@@ -0,0 +1,263 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from embedding_cache import normalize_text
+
+
+def search_key(query: str) -> str:
+    """Queries differing only in case or whitespace share an entry."""
+    return normalize_text(query).casefold()
+
+
+class SearchCache:
+    """
+    Caches web search results per normalized query: an in-process LRU in front of an on-disk
+    SQLite table, so repeats are free within a turn, across turns and across processes.
+
+    Results younger than `ttl` seconds are served as they are. For `stale` seconds after that they
+    are still served at once, while one background request refreshes them. Concurrent lookups
+    of a query nobody has cached share a single upstream request.
+    """
+
+    def __init__(self, db_path: str = None, ttl: float = 3600.0, stale: float = 86400.0, memory_size: int = 256,
+                 max_rows: int = 5000):
+        """
+        Args:
+            db_path: Path of the on-disk cache. None or "" disables the disk tier.
+            ttl: Seconds results are served without asking upstream again.
+            stale: Further seconds expired results are served while they are refreshed.
+            memory_size: Maximum number of queries kept in the in-process LRU.
+            max_rows: Maximum number of queries kept on disk.
+        """
+        self.ttl = ttl
+        self.stale = stale
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Upstream requests under way, by key; lookups that miss meanwhile wait on them.
+        self._inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+
+        self.conn = None
+        if db_path:
+            # Tools run on worker threads, and the daemon serves several sessions at once.
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self._create_table()
+
+    # Bump this and extend _create_table to change the cache table.
+    SCHEMA_VERSION = 1
+
+    def _create_table(self):
+        """Creates the cache table and its eviction index, then records the schema version."""
+        self.conn.execute("""
+                          CREATE TABLE IF NOT EXISTS search_cache (
+                              key TEXT PRIMARY KEY,
+                              results TEXT NOT NULL,
+                              fetched_at REAL NOT NULL
+                              );
+                          """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_fetched_at ON search_cache(fetched_at)")
+        self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def counters(self) -> dict:
+        """
+        Counts since the cache was opened. `coalesced` are the misses that waited on another
+        caller's request instead of making their own; `refresh_errors` are failed background refreshes.
+        """
+        with self._lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "refresh_errors": self.refresh_errors}
+
+    def lookup(self, query: str, fetch) -> list:
+        """
+        Returns the results for a query, calling `fetch(query)` on a miss.
+        Errors from `fetch` reach every caller waiting on that request and are not cached.
+        """
+        key = search_key(query)
+        with self._lock:
+            entry = self._entry(key)
+            if entry is not None:
+                results, fetched_at = entry
+                age = time.time() - fetched_at
+                if age < self.ttl:
+                    self.hits += 1
+                    return results
+                if age < self.ttl + self.stale:
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        threading.Thread(target=self._refresh, args=(key, query, fetch), daemon=True).start()
+                    return results
+            self.misses += 1
+            future = self._inflight.get(key)
+            if future is None:
+                self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if future is not None:
+            return future.result()
+        return self._fetch(key, query, fetch)
+
+    def _refresh(self, key: str, query: str, fetch):
+        """Refreshes stale results in the background; if that fails they keep being served until they expire."""
+        try:
+            self._fetch(key, query, fetch)
+        except Exception:
+            with self._lock:
+                self.refresh_errors += 1
+
+    def _fetch(self, key: str, query: str, fetch) -> list:
+        """Runs the upstream request registered in _inflight, stores its results and wakes any waiters."""
+        future = self._inflight[key]
+        try:
+            results = fetch(query)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._store(key, results)
+            self._inflight.pop(key, None)
+        future.set_result(results)
+        return results
+
+    def _entry(self, key: str) -> tuple[list, float] | None:
+        """
+        (results, fetched_at) from the LRU, or from the disk tier when the LRU has nothing fresh,
+        since another process may have refreshed it meanwhile. Caller must hold the lock.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if time.time() - entry[1] < self.ttl:
+                return entry
+        if self.conn is not None:
+            row = self.conn.execute("SELECT results, fetched_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and (entry is None or row[1] > entry[1]):
+                entry = (json.loads(row[0]), row[1])
+                self._remember(key, entry)
+        return entry
+
+    def _store(self, key: str, results: list):
+        """Stores fresh results in both tiers. Caller must hold the lock."""
+        entry = (results, time.time())
+        self._remember(key, entry)
+        if self.conn is not None:
+            self.conn.execute("INSERT OR REPLACE INTO search_cache (key, results, fetched_at) VALUES (?, ?, ?)",
+                              (key, json.dumps(results), entry[1]))
+            self._evict_disk()
+            self.conn.commit()
+
+    def _remember(self, key: str, entry: tuple[list, float]):
+        """Adds an entry to the in-process LRU. Caller must hold the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """
+        Drops entries too old to serve even stale, then the oldest beyond max_rows. Caller must hold the lock.
+        Evicts down to 90% of the limit so we don't pay for a DELETE on every insert.
+        """
+        self.conn.execute("DELETE FROM search_cache WHERE fetched_at < ?", (time.time() - self.ttl - self.stale,))
+        count = self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        if count <= self.max_rows:
+            return
+        keep = int(self.max_rows * 0.9)
+        self.conn.execute(
+                "DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache ORDER BY fetched_at ASC LIMIT ?)",
+                (count - keep,)
+                )
+
+    def clear(self):
+        """Empties both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM search_cache")
+                self.conn.commit()
+
+    def close(self):
+        """Closes the disk tier."""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    import os
+
+    TEST_CACHE_PATH = "test_search_cache.db"
+    if os.path.exists(TEST_CACHE_PATH):
+        os.remove(TEST_CACHE_PATH)
+
+    print("--- Running SearchCache Test Suite ---")
+    upstream = []
+    def fetch(query: str) -> list:
+        upstream.append(query)
+        time.sleep(0.05)
+        if query == "fail":
+            raise ConnectionError("search service down")
+        return [{"title": f"{query} #{len(upstream)}"}]
+
+    cache = SearchCache(TEST_CACHE_PATH, ttl=60, stale=60)
+    try:
+        print("\n1. Hits by normalized query...")
+        first = cache.lookup("Linux  kernel", fetch)
+        assert cache.lookup(" linux kernel\n", fetch) == first and len(upstream) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+        print("  > PASSED: Case and whitespace variants were served from the cache.")
+
+        print("\n2. Coalescing concurrent misses...")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.lookup("rust release", fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert upstream.count("rust release") == 1 and len(set(map(str, results))) == 1
+        assert cache.coalesced == 7
+        print("  > PASSED: Eight concurrent lookups made one upstream request.")
+
+        print("\n3. Errors reach the caller and are not cached...")
+        for _ in range(2):
+            try:
+                cache.lookup("fail", fetch)
+                raise AssertionError("The upstream error should propagate.")
+            except ConnectionError:
+                pass
+        assert upstream.count("fail") == 2
+        print("  > PASSED: A failed search was retried on the next lookup.")
+
+        print("\n4. Stale-while-revalidate and the disk tier...")
+        cache.close()
+        cache = SearchCache(TEST_CACHE_PATH, ttl=60, stale=60)
+        assert cache.lookup("linux kernel", fetch) == first and cache.hits == 1, "A new process should find the results on disk."
+        cache.ttl = 0.1
+        time.sleep(0.15)
+        assert cache.lookup("linux kernel", fetch) == first and cache.stale_hits == 1, "Expired results should be served at once."
+        deadline = time.time() + 2
+        while cache._inflight and time.time() < deadline:
+            time.sleep(0.01)
+        refreshed = cache.lookup("linux kernel", fetch)
+        assert refreshed != first and upstream.count("linux kernel") == 1 and cache.hits == 2, "The background refresh should replace them."
+        print(f"  > PASSED: Stale results were served while one request refreshed them. Counters: {cache.counters()}")
+    finally:
+        cache.close()
+        if os.path.exists(TEST_CACHE_PATH):
+            os.remove(TEST_CACHE_PATH)
+        print("\n--- All Tests Complete ---")
@@ -0,0 +1,123 @@
+"""
+Maintenance for the monthly vector shards (VECTOR_SHARDING="monthly").
+
+Usage:
+    python shards.py list
+    python shards.py rebuild [--period YYYY-MM ...]
+    python shards.py drop --before YYYY-MM
+
+Dropping a shard keeps its messages (and their keyword search) but removes them from vector
+search; they are marked 'dropped' so nothing re-embeds them. Rebuilding re-embeds a month's
+messages from their text and replaces its shard, which also brings dropped months back.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from config import DB_PATH, SQLITE_BATCH_DURABILITY
+from database import DatabaseManager
+from embedding import get_embeddings
+from vector_index import NumpyIndex
+
+# Messages in this month that vector search covers; compact.py's retired ones stay out.
+MONTH_MESSAGES = """
+                 SELECT id, content FROM conversations
+                 WHERE substr(timestamp, 1, 7) = ? AND role IN ('user', 'assistant') AND content != ''
+                   AND (embedding_state IS NULL OR embedding_state != 'compacted')
+                 ORDER BY id
+                 """
+
+
+def _sharded_index(db: DatabaseManager):
+    """The ShardedIndex behind this database, or exits if it isn't sharded."""
+    index = db.vector_index.primary if isinstance(db.vector_index, NumpyIndex) else db.vector_index
+    if index.sharding != "monthly":
+        print("Error: this database's vector index isn't sharded. Set VECTOR_SHARDING=monthly first.", file=sys.stderr)
+        sys.exit(1)
+    return index
+
+
+def _mirror_changed(db: DatabaseManager):
+    """Rows left the shards, so a memory-mapped mirror has to be copied again."""
+    if isinstance(db.vector_index, NumpyIndex):
+        with db._reading() as conn:
+            db.vector_index.reset(conn.cursor())
+
+
+def list_shards(db: DatabaseManager, args):
+    index = _sharded_index(db)
+    print(f"{'period':<8} {'vectors':>9} {'messages':>9}  table")
+    with db._reading() as conn:
+        cursor = conn.cursor()
+        for period in index.periods(cursor):
+            vectors = cursor.execute(f"SELECT COUNT(*) FROM {index.shard(period).table}").fetchone()[0]
+            messages = cursor.execute(f"SELECT COUNT(*) FROM ({MONTH_MESSAGES})", (period,)).fetchone()[0]
+            print(f"{period:<8} {vectors:>9} {messages:>9}  {index.shard(period).table}")
+
+
+def rebuild_shards(db: DatabaseManager, args):
+    index = _sharded_index(db)
+    with db._reading() as conn:
+        periods = args.period or [row[0] for row in conn.execute(
+                "SELECT DISTINCT substr(timestamp, 1, 7) FROM conversations ORDER BY 1")]
+    for period in periods:
+        with db._reading() as conn:
+            rows = conn.execute(MONTH_MESSAGES, (period,)).fetchall()
+        # Embed the whole month before touching the shard, so the swap below is one short transaction.
+        matrix = get_embeddings([row['content'] for row in rows], model=db.embedding_model) if rows else np.empty((0, 0))
+        indexed = 0
+        with db._writing(SQLITE_BATCH_DURABILITY) as conn:
+            cursor = conn.cursor()
+            index.drop_shard(cursor, period)
+            for row, vector in zip(rows, matrix):
+                if np.isnan(vector).any():
+                    cursor.execute("UPDATE conversations SET embedding_state = 'pending' WHERE id = ?", (row['id'],))
+                    continue
+                index.insert(cursor, row['id'], vector)
+                cursor.execute("UPDATE conversations SET embedding_state = 'indexed' WHERE id = ?", (row['id'],))
+                indexed += 1
+        print(f"{period}: indexed {indexed} of {len(rows)} messages.")
+    _mirror_changed(db)
+
+
+def drop_shards(db: DatabaseManager, args):
+    index = _sharded_index(db)
+    with db._writing() as conn:
+        cursor = conn.cursor()
+        dropped = [period for period in index.periods(cursor) if period < args.before]
+        for period in dropped:
+            index.drop_shard(cursor, period)
+            cursor.execute(
+                    "UPDATE conversations SET embedding_state = 'dropped' WHERE embedding_state = 'indexed' AND substr(timestamp, 1, 7) = ?",
+                    (period,)
+                    )
+    print(f"Dropped {len(dropped)} shards: {', '.join(sorted(dropped)) or 'none'}.")
+    _mirror_changed(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage bashbot's monthly vector shards.")
+    parser.add_argument("--db", default=DB_PATH, help="Database to operate on.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List shards with their vector and message counts.").set_defaults(func=list_shards)
+
+    rebuild = subparsers.add_parser("rebuild", help="Re-embed months and replace their shards.")
+    rebuild.add_argument("--period", action="append", help="A YYYY-MM month to rebuild; repeatable. Defaults to every month.")
+    rebuild.set_defaults(func=rebuild_shards)
+
+    drop = subparsers.add_parser("drop", help="Drop the shards of every month before the given one.")
+    drop.add_argument("--before", required=True, help="First YYYY-MM month to keep.")
+    drop.set_defaults(func=drop_shards)
+
+    args = parser.parse_args()
+    db = DatabaseManager(args.db, write_behind=False)
+    try:
+        args.func(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Local stand-ins for the HTTP services bashbot talks to, for benchmarks and self-tests.
+They speak just enough of each API for the agent to run end to end, with configurable latency.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+
+class _StandInServer:
+    """Runs a ThreadingHTTPServer on a free localhost port in a background thread."""
+
+    def __init__(self, handler_class):
+        handler_class.server_state = self
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.counters = {}
+        # (endpoint name, time.perf_counter()) per request, in arrival order.
+        self.request_log = []
+        self._counter_lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            self.request_log.append((name, time.perf_counter()))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Without this, Nagle + delayed ACKs add ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, body, status: int = 200, content_type: str = "application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def fake_embedding(text: str, dimension: int) -> list[float]:
+    """A deterministic unit-length vector derived from the text, like /api/embed returns."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimension)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _OllamaHandler(_JsonHandler):
+
+    def do_POST(self):
+        state = self.server_state
+        body = self.read_json()
+
+        if self.path == "/api/embed":
+            state.count("embed")
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            time.sleep(state.embed_latency)
+            dimension = state.model_dimensions.get(body["model"], state.dimension)
+            self.send_json({"model": body["model"], "embeddings": [fake_embedding(t, dimension) for t in inputs]})
+
+        elif self.path == "/api/chat":
+            state.count("chat")
+            messages = body.get("messages", [])
+            wants_tool = state.tool_call is not None and messages and messages[-1]["role"] == "user"
+
+            # Like Ollama's KV cache, only messages after the prefix shared with the previous request are evaluated.
+            with state.cache_lock:
+                cached = 0
+                for previous, message in zip(state.last_messages, messages):
+                    if previous != message:
+                        break
+                    cached += 1
+                state.last_messages = messages
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages[cached:])
+            state.prompt_evals.append(prompt_tokens)
+            time.sleep(state.chat_latency + prompt_tokens * state.prompt_eval_latency)
+
+            # Vary the text per response so embeddings of it aren't cache hits.
+            reply_number = state.counters["chat"]
+            chunks = [{"message": {"role": "assistant", "thinking": "Considering the request."}}]
+            if wants_tool:
+                tool_call = json.loads(json.dumps(state.tool_call).replace("{reply}", str(reply_number)))
+                chunks.append({"message": {"role": "assistant", "content": f"Let me check (reply {reply_number}).", "tool_calls": [tool_call]}})
+            else:
+                chunks.append({"message": {"role": "assistant", "content": f"Here is the answer (reply {reply_number})."}})
+            chunks.append({
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((prompt_tokens * state.prompt_eval_latency) * 1_000_000_000) or 1_000_000,
+                "eval_count": 8,
+                "eval_duration": 1_000_000,
+                })
+            data = b"".join(json.dumps(chunk).encode() + b"\n" for chunk in chunks)
+            self.send_json(data, content_type="application/x-ndjson")
+
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+
+class StandInOllama(_StandInServer):
+    """
+    Serves /api/embed and /api/chat.
+    The first chat response of every turn asks for `tool_call` (if set); later ones answer directly.
+    Any "{reply}" in the tool call is replaced with the response number.
+    Prompt evaluation mimics a KV cache: only words past the prefix shared with the previous
+    request are counted in prompt_eval_count (and recorded in `prompt_evals`) and cost
+    `prompt_eval_latency` seconds each.
+    Embeddings have `dimension` components, or the one `model_dimensions` gives the requested model.
+    """
+
+    def __init__(self, embed_latency: float = 0.0, chat_latency: float = 0.0, dimension: int = 768, tool_call: dict = None,
+                 prompt_eval_latency: float = 0.0, model_dimensions: dict = None):
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.prompt_eval_latency = prompt_eval_latency
+        self.prompt_evals = []
+        self.last_messages = []
+        self.cache_lock = threading.Lock()
+        self.dimension = dimension
+        self.model_dimensions = model_dimensions or {}
+        self.tool_call = tool_call
+        super().__init__(_OllamaHandler)
+
+
+class _SearXNGHandler(_JsonHandler):
+
+    def do_GET(self):
+        state = self.server_state
+        url = urlsplit(self.path)
+        if url.path != "/search":
+            self.send_json({"error": "not found"}, status=404)
+            return
+        state.count("search")
+        query = parse_qs(url.query).get("q", [""])[0]
+        with state.cache_lock:
+            state.queries.append(query)
+        time.sleep(state.latency)
+        if state.status != 200:
+            self.send_json({"error": "unavailable"}, status=state.status)
+            return
+        slug = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        # Number the responses so a refreshed result is distinguishable from a cached one.
+        served = state.counters["search"]
+        results = [{"title": f"{query} - result {i}", "url": f"https://example.com/{slug}/{i}",
+                    "content": f"Snippet {i} about {query} (response {served}).", "engine": "stand-in"}
+                   for i in range(1, state.results + 1)]
+        self.send_json({"query": query, "number_of_results": len(results), "results": results})
+
+
+class StandInSearXNG(_StandInServer):
+    """
+    Serves SearXNG's /search?q=...&format=json with `results` made-up results per query, after
+    `latency` seconds. Every query received is recorded in `queries`. Set `status` to make it fail.
+    """
+
+    def __init__(self, latency: float = 0.0, results: int = 5):
+        self.latency = latency
+        self.results = results
+        self.status = 200
+        self.queries = []
+        self.cache_lock = threading.Lock()
+        super().__init__(_SearXNGHandler)
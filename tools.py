@@ -1,6 +1,9 @@
 from database import DatabaseManager
-from config import SEARXNG_HOST, SEARCH_RESULTS_TO_SHOW
+from config import (SEARXNG_HOST, SEARCH_RESULTS_TO_SHOW, SEARCH_CACHE_PATH, SEARCH_CACHE_TTL, SEARCH_CACHE_STALE,
+                    SEARCH_CACHE_MAX_ROWS)
 from embedding import get_embedding
+from http_client import get_client
+from search_cache import SearchCache
 
 import numpy as np
 import requests
@@ -8,6 +11,15 @@ from urllib.parse import quote
 # from bs4 import BeautifulSoup
 
 
+_search_cache = None
+
+def get_search_cache() -> SearchCache:
+    """Returns the process-wide web search cache, opening it on first use."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(SEARCH_CACHE_PATH, SEARCH_CACHE_TTL, SEARCH_CACHE_STALE, max_rows=SEARCH_CACHE_MAX_ROWS)
+    return _search_cache
+
 #---Tool Functions---
 def memory_query(db: DatabaseManager, query: str) -> str:
     """
@@ -20,14 +32,15 @@ def memory_query(db: DatabaseManager, query: str) -> str:
 
     try:
         # ---1: Get embedding from query.
-        query_vector = get_embedding(query)
+        query_vector = get_embedding(query, db.embedding_model)
         if not query_vector:
             return "[TOOL_ERROR] Could not generate embedding for the query."
 
         query_np_vector = np.array(query_vector, dtype=np.float32)
 
         # ---2: Call the vector search function from the db.
-        similar_memories = db.find_similar_memories(query_np_vector, top_k=3) # Get top 3
+        # Get top 3, with the two best messages under any summary, since the user wants specifics here.
+        similar_memories = db.find_similar_memories(query_np_vector, top_k=3, query_text=query, model=db.embedding_model, drill_down=2)
 
         if not similar_memories:
             return f"No relevant memories found for '{query}'."
@@ -35,7 +48,10 @@ def memory_query(db: DatabaseManager, query: str) -> str:
         # ---3: Format the results into a string.
         output = f"---Relevant Memories Found for '{query}'---\n\n"
         for memory in similar_memories:
-            output += f"Memory (Turn ID: {memory['turn_id']}, Role: {memory['role']}):\n"
+            if memory['role'] == 'summary':
+                output += f"Summary (Turn IDs: {memory['turn_id']}-{memory['last_turn_id']}):\n"
+            else:
+                output += f"Memory (Turn ID: {memory['turn_id']}, Role: {memory['role']}):\n"
             output += f"{memory['content']}\n\n"
 
         return output.strip()
@@ -43,37 +59,41 @@ def memory_query(db: DatabaseManager, query: str) -> str:
     except Exception as e:
         return f"[TOOL_ERROR] An error occurred while searching memory: {e}"
 
+def _searxng(query: str) -> list[dict]:
+    """Asks SearXNG for a query and returns the fields web_search shows of each result."""
+    # URL-encode the query to handle spaces and special characters
+    safe_query = quote(query)
+    search_url = f"{SEARXNG_HOST}/search?q={safe_query}&format=json"
+
+    response = get_client().get(search_url, timeout=10)
+    response.raise_for_status()
+    return [{key: result.get(key, 'N/A') for key in ('title', 'url', 'content')} for result in response.json().get("results", [])]
+
 def web_search(query: str) -> str:
     """
     Performs a web search using the local SearXNG instance and returns a summary.
+    Repeated queries are answered from the search cache; see SEARCH_CACHE_TTL.
     """
     # print(f"[DEBUG_TOOL] Executing web_search with query: '{query}'")
     if not query:
         return "[TOOL_ERROR] No search term provided."
 
     try:
-        # URL-encode the query to handle spaces and special characters
-        safe_query = quote(query)
-        search_url = f"{SEARXNG_HOST}/search?q={safe_query}&format=json"
-
-        response = requests.get(search_url, timeout=10)
-        response.raise_for_status()
-
-        search_results = response.json()
+        search_results = get_search_cache().lookup(query, _searxng)
 
         #---Summarize---
         # Avoid overfilling the context window with raw json.
         output = f"---Web Search Results for '{query}'---\n\n"
-        results_to_show = search_results.get("results", [])[:SEARCH_RESULTS_TO_SHOW]
+        results_to_show = search_results[:SEARCH_RESULTS_TO_SHOW]
 
         if not results_to_show:
             return f"No results found for '{query}'."
 
         for i, result in enumerate(results_to_show, 1):
             output += f"Result {i}:\n"
-            output += f"    Title: {result.get('title', 'N/A')}\n"
-            output += f"    URL: {result.get('url', 'N/A')}\n"
-            output += f"    Content: {result.get('content', 'N/A')}\n\n"
+            output += f"    Title: {result['title']}\n"
+            output += f"    URL: {result['url']}\n"
+            output += f"    Content: {result['content']}\n\n"
         return output
 
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,118 @@
+import json
+
+from config import RAG_TOP_K
+from context import estimate_tokens
+
+
+class TurnState:
+    """
+    The working set of one agentic turn: its messages, the history it builds on, and the
+    memories retrieved so far. Messages are kept in API shape as they are added and written
+    through to SQLite, so the agent loop never re-reads or re-decodes its own turn.
+    """
+
+    def __init__(self, db, turn_id: int, history: list[dict] = None, memory_limit: int = RAG_TOP_K):
+        """
+        Args:
+            db: The DatabaseManager messages are persisted to.
+            turn_id: The turn these messages belong to.
+            history: Messages from earlier turns, as returned by get_long_term_history.
+            memory_limit: The most memories held at once; see add_memories.
+        """
+        self.db = db
+        self.turn_id = turn_id
+        self.history = history or []
+        self.memory_limit = memory_limit
+        self.messages = []
+        self.memories = []
+        self.history_fixed = False
+        self._turn_content = set()
+        self._memory_ids = set()
+
+    def add_message(self, role: str, content: str, tool_calls: list = None, thoughts: str = None, unit=None):
+        """
+        Appends a message to the turn and writes it through to the database, or stages it on
+        `unit` (from db.transaction()) to be written when that commits.
+        """
+        self.record(role, content, tool_calls, thoughts)
+        (unit or self.db).add_message(self.turn_id, role, content, tool_calls, thoughts=thoughts)
+
+    def record(self, role: str, content: str, tool_calls: list = None, thoughts: str = None):
+        """Appends a message in the same shape get_messages_for_turn returns it, without persisting it."""
+        tool_calls_json = json.dumps(tool_calls) if tool_calls else None
+        message = {"role": role, "content": content, "token_count": estimate_tokens(content, thoughts, tool_calls_json)}
+        if thoughts:
+            message['content'] = f"<think>{thoughts}</think>\n{content}"
+        if tool_calls:
+            message['tool_calls'] = tool_calls
+        self.messages.append(message)
+        self._turn_content.add(content)
+
+    def fix_history(self, dropped: int):
+        """
+        Keeps only the history the turn's first request had room for, `dropped` being that request's
+        usage['dropped_history']. Later requests pass fixed_history to build_context so it
+        trims tool outputs before touching it, and every prompt of the turn starts the same way.
+        """
+        self.history = self.history[dropped:]
+        self.history_fixed = True
+
+    def add_memories(self, memories: list[dict]) -> int:
+        """
+        Merges a retrieval, ranked best first, into the memories held. They are re-ranked for the
+        turn's latest step: this retrieval's hits in its order, then earlier ones it didn't return.
+        Past memory_limit the lowest ranked are evicted, so stale hits go before fresh ones and
+        the block stays the size of one retrieval. Anything already said in this turn is skipped.
+        Returns how many were not held before.
+        """
+        latest_ids = {mem['id'] for mem in memories}
+        ranked = list(memories) + [mem for mem in self.memories if mem['id'] not in latest_ids]
+        ranked = [mem for mem in ranked if mem['content'] not in self._turn_content][:self.memory_limit]
+        held_before = self._memory_ids
+        self.memories = ranked
+        self._memory_ids = {mem['id'] for mem in ranked}
+        return len(self._memory_ids - held_before)
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    import os
+    from database import DatabaseManager
+
+    TEST_DB_PATH = "test_turn_state.db"
+    if os.path.exists(TEST_DB_PATH):
+        os.remove(TEST_DB_PATH)
+
+    print("--- Running TurnState Test Suite ---")
+    db = DatabaseManager(db_path=TEST_DB_PATH, write_behind=False)
+    try:
+        print("\n1. Messages match what the database returns...")
+        state = TurnState(db, db.get_new_turn_id())
+        state.add_message("user", "Check the disk usage on bluefin-07.")
+        tool_calls = [{"function": {"name": "web_search", "arguments": {"query": "df -h"}}}]
+        state.add_message("assistant", "Let me look.", tool_calls, thoughts="A tool will help.")
+        state.add_message("tool", "/dev/sda1 42% used")
+        assert state.messages == db.get_messages_for_turn(state.turn_id), "In-memory and stored turns should match."
+        with db.transaction() as unit:
+            state.add_message("assistant", "It is 42% full.", unit=unit)
+            assert len(db.get_messages_for_turn(state.turn_id)) == 3, "Staged messages should wait for the commit."
+        assert state.messages == db.get_messages_for_turn(state.turn_id), "Committed units should match too."
+        print("  > PASSED: The in-memory turn is identical to the stored one.")
+
+        print("\n2. Memories are re-ranked by each retrieval...")
+        state.memory_limit = 3
+        first = [{"id": 1, "content": "bluefin-07 is the backup host."}, {"id": 2, "content": "Check the disk usage on bluefin-07."},
+                 {"id": 4, "content": "Backups run at 02:00."}]
+        second = [{"id": 3, "content": "Disks were replaced in May."}, {"id": 1, "content": "bluefin-07 is the backup host."}]
+        assert state.add_memories(first) == 2, "Memories repeating this turn's messages should be skipped."
+        assert state.add_memories(second) == 1, "Memories already held aren't new."
+        assert [mem['id'] for mem in state.memories] == [3, 1, 4], "The latest retrieval should lead."
+        third = [{"id": 5, "content": "sda1 holds the backups."}, {"id": 6, "content": "The old disks were 2 TB."}]
+        assert state.add_memories(third) == 2
+        assert [mem['id'] for mem in state.memories] == [5, 6, 3], "The lowest ranked should be evicted."
+        assert state.add_memories(first) == 2, "Evicted memories can come back."
+        print("  > PASSED: The latest hits lead, older ones follow, and the lowest ranked were evicted.")
+    finally:
+        db.close()
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
+        print("\n--- All Tests Complete ---")
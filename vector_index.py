@@ -0,0 +1,645 @@
+"""
+Storage layouts for the vec0 table that indexes message embeddings.
+
+"float" keeps the full float32 vector and searches it exactly. The compact modes keep a
+quantized vector for a coarse KNN pass, plus a float16 copy in an auxiliary column, and
+rerank the coarse candidates by exact L2 distance against the query:
+    "int8":   1 byte per dimension, about a quarter of float32.
+    "binary": 1 bit per dimension (the sign), about a thirty-second of float32.
+
+ShardedIndex splits the vectors into one vec0 table per calendar month and searches the
+newest months first. NumpyIndex is an alternative search backend: it mirrors the vec0 table
+into a memory-mapped matrix file next to the database and searches it with NumPy.
+"""
+import fcntl
+import os
+import sqlite3
+import threading
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+
+try:
+    from config import EMBEDDING_DIMENSION, VECTOR_RERANK_FACTOR, VECTOR_SIMILARITY_THRESHOLD
+except ImportError:
+    EMBEDDING_DIMENSION = 768
+    VECTOR_RERANK_FACTOR = 10
+    VECTOR_SIMILARITY_THRESHOLD = 1.0
+
+VECTOR_INDEX_MODES = ("float", "int8", "binary")
+
+# The vector table a new database starts with; a re-index moves to a new name (see reindex.py).
+VECTOR_TABLE = "vec_conversations"
+# Vectors of compacted-turn summaries (see compact.py), named after the vector table they sit beside.
+SUMMARY_TABLE = "vec_summaries"
+
+# Components of a unit-length embedding rarely leave [-0.25, 0.25]; scale that range onto int8.
+INT8_SCALE = 127 / 0.25
+
+
+class Vec0Index:
+    """Creates, fills and searches a vec0 table in one of the VECTOR_INDEX_MODES."""
+
+    def __init__(self, mode: str = "float", dimension: int = EMBEDDING_DIMENSION, rerank_factor: int = VECTOR_RERANK_FACTOR,
+                 table: str = VECTOR_TABLE):
+        """
+        Args:
+            mode: "float", "int8" or "binary".
+            rerank_factor: Compact modes fetch top_k * rerank_factor coarse candidates to rerank.
+            table: Name of the vec0 table.
+        """
+        if mode not in VECTOR_INDEX_MODES:
+            raise ValueError(f"Unknown vector index mode '{mode}'; expected one of {', '.join(VECTOR_INDEX_MODES)}.")
+        self.mode = mode
+        self.sharding = "none"
+        self.dimension = dimension
+        self.rerank_factor = rerank_factor
+        self.table = table
+
+    def create(self, cursor: sqlite3.Cursor):
+        """Creates the vec0 table if it doesn't exist."""
+        if self.mode == "float":
+            columns = f"embedding float[{self.dimension}]"
+        elif self.mode == "int8":
+            columns = f"embedding int8[{self.dimension}], +rerank blob"
+        else:
+            columns = f"embedding bit[{self.dimension}], +rerank blob"
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING vec0({columns})")
+
+    def drop(self, cursor: sqlite3.Cursor):
+        """Drops the vec0 table."""
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def delete(self, cursor: sqlite3.Cursor, row_ids: list[int]):
+        """Removes these rows' vectors."""
+        cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = ?", [(row_id,) for row_id in row_ids])
+
+    def occupancy(self, cursor: sqlite3.Cursor) -> tuple[int, int, int]:
+        """
+        (vectors, chunk slots allocated, slots per chunk). vec0 never reuses the slot of a deleted
+        row, so the difference is dead space until rebuild_from(conn, self) packs the table again.
+        """
+        vectors = cursor.execute(f"SELECT COUNT(*) FROM {self.table}_rowids").fetchone()[0]
+        slots, chunk = cursor.execute(f"SELECT COALESCE(SUM(size), 0), COALESCE(MAX(size), 0) FROM {self.table}_chunks").fetchone()
+        return vectors, slots, chunk
+
+    def _coarse(self, vector: np.ndarray) -> tuple[str, bytes]:
+        """The SQL expression and parameter for a vector in this table's storage type."""
+        if self.mode == "float":
+            return "?", vector.tobytes()
+        if self.mode == "int8":
+            return "vec_int8(?)", np.clip(np.rint(vector * INT8_SCALE), -127, 127).astype(np.int8).tobytes()
+        return "vec_quantize_binary(?)", vector.tobytes()
+
+    def insert(self, cursor: sqlite3.Cursor, row_id: int, vector):
+        """Indexes one float vector under the conversation row id."""
+        vector = np.asarray(vector, dtype=np.float32)
+        expression, coarse = self._coarse(vector)
+        if self.mode == "float":
+            cursor.execute(f"INSERT INTO {self.table}(rowid, embedding) VALUES (?, {expression})", (row_id, coarse))
+        else:
+            cursor.execute(f"INSERT INTO {self.table}(rowid, embedding, rerank) VALUES (?, {expression}, ?)",
+                           (row_id, coarse, vector.astype(np.float16).tobytes()))
+
+    def search(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Returns (rowid, L2 distance) for the top_k nearest vectors, nearest first."""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        expression, coarse = self._coarse(query_vector)
+        # The k constraint is essential for the vec0 virtual table. (A LIMIT only
+        # reaches vec0 on SQLite 3.41+, so we use the portable 'k = ?' form.)
+        if self.mode == "float":
+            cursor.execute(
+                    f"SELECT rowid, distance FROM {self.table} WHERE embedding MATCH {expression} AND k = ? ORDER BY distance",
+                    (coarse, top_k)
+                    )
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+
+        cursor.execute(
+                f"SELECT rowid, rerank FROM {self.table} WHERE embedding MATCH {expression} AND k = ?",
+                (coarse, top_k * self.rerank_factor)
+                )
+        candidates = cursor.fetchall()
+        if not candidates:
+            return []
+        # Rerank the coarse candidates by exact distance to the float query.
+        matrix = np.frombuffer(b"".join(row[1] for row in candidates), dtype=np.float16).reshape(len(candidates), -1)
+        distances = np.linalg.norm(matrix.astype(np.float32) - query_vector, axis=1)
+        order = np.argsort(distances)[:top_k]
+        return [(candidates[i][0], float(distances[i])) for i in order]
+
+    def sync(self, cursor: sqlite3.Cursor):
+        """Nothing to do: the vec0 table is the durable copy. See NumpyIndex.sync."""
+
+    def search_many(self, cursor: sqlite3.Cursor, query_vectors: np.ndarray, top_k: int) -> list[list[tuple[int, float]]]:
+        """Runs search for each row of query_vectors."""
+        return [self.search(cursor, query_vector, top_k) for query_vector in query_vectors]
+
+    def vectors(self, cursor: sqlite3.Cursor, after: int = 0):
+        """Yields (rowid, float32 vector) for every indexed row with a rowid above `after`."""
+        column = "embedding" if self.mode == "float" else "rerank"
+        for row in cursor.execute(f"SELECT rowid, {column} FROM {self.table} WHERE rowid > ? ORDER BY rowid", (after,)):
+            dtype = np.float32 if self.mode == "float" else np.float16
+            yield row[0], np.frombuffer(row[1], dtype=dtype).astype(np.float32)
+
+    def rebuild_from(self, conn: sqlite3.Connection, source):
+        """Replaces the table's contents with the vectors held by `source`, in one transaction."""
+        _restage(conn, self, source)
+
+
+def _restage(conn: sqlite3.Connection, target, source):
+    """
+    Moves every vector from the source index's tables into the target's.
+    vec0 tables can't be renamed, so the vectors are staged in a plain table first.
+    Vectors coming from a compact index carry its float16 precision.
+    """
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMP TABLE vector_rebuild (rowid INTEGER PRIMARY KEY, vector BLOB NOT NULL)")
+    cursor.executemany("INSERT INTO vector_rebuild VALUES (?, ?)",
+                       ((row_id, vector.tobytes()) for row_id, vector in source.vectors(conn.cursor())))
+    source.drop(cursor)
+    target.create(cursor)
+    for row_id, blob in conn.execute("SELECT rowid, vector FROM vector_rebuild"):
+        target.insert(cursor, row_id, np.frombuffer(blob, dtype=np.float32))
+    cursor.execute("DROP TABLE vector_rebuild")
+
+
+class UnitLength:
+    """Presents another index's vectors scaled to unit length, as a source for rebuild_from."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def vectors(self, cursor: sqlite3.Cursor, after: int = 0):
+        """Yields (rowid, float32 vector) from the source, each divided by its norm."""
+        for row_id, vector in self.source.vectors(cursor, after):
+            norm = np.linalg.norm(vector)
+            yield row_id, vector / norm if norm else vector
+
+    def drop(self, cursor: sqlite3.Cursor):
+        """Drops the source's tables."""
+        self.source.drop(cursor)
+
+
+class ShardedIndex:
+    """
+    One Vec0Index per calendar month of the message timestamps, listed in vector_shards.
+
+    Search walks the shards newest first and stops once top_k hits fall under the similarity
+    threshold, so a query usually touches only the last month or two however long the history
+    grows. An older but closer match is only found when the recent shards come up short.
+    """
+
+    def __init__(self, mode: str = "float", dimension: int = EMBEDDING_DIMENSION, rerank_factor: int = VECTOR_RERANK_FACTOR,
+                 threshold: float = VECTOR_SIMILARITY_THRESHOLD, prefix: str = VECTOR_TABLE, registry: str = "vector_shards"):
+        """
+        Args:
+            mode: Storage mode of every shard, as for Vec0Index.
+            threshold: L2 distance under which a hit counts towards filling top_k.
+            prefix: Shard tables are named <prefix>_<YYYYMM>.
+            registry: The table listing the shards, so two sharded indexes can coexist.
+        """
+        self.mode = mode
+        self.sharding = "monthly"
+        self.dimension = dimension
+        self.rerank_factor = rerank_factor
+        self.threshold = threshold
+        self.prefix = prefix
+        self.registry = registry
+
+    def shard(self, period: str) -> Vec0Index:
+        """The shard for a "YYYY-MM" period."""
+        return Vec0Index(self.mode, self.dimension, self.rerank_factor, table=f"{self.prefix}_{period.replace('-', '')}")
+
+    def periods(self, cursor: sqlite3.Cursor) -> list[str]:
+        """Every shard's period, newest first."""
+        return [row[0] for row in cursor.execute(f"SELECT period FROM {self.registry} ORDER BY period DESC").fetchall()]
+
+    def create(self, cursor: sqlite3.Cursor):
+        """Creates the shard registry; shards themselves are created on first insert."""
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.registry} (period TEXT PRIMARY KEY, table_name TEXT NOT NULL)")
+
+    def drop(self, cursor: sqlite3.Cursor):
+        """Drops every shard and the registry."""
+        for period in self.periods(cursor):
+            self.drop_shard(cursor, period)
+        cursor.execute(f"DROP TABLE {self.registry}")
+
+    def drop_shard(self, cursor: sqlite3.Cursor, period: str):
+        """Drops one shard's table and its registry entry."""
+        self.shard(period).drop(cursor)
+        cursor.execute(f"DELETE FROM {self.registry} WHERE period = ?", (period,))
+
+    def delete(self, cursor: sqlite3.Cursor, row_ids: list[int]):
+        """Removes these rows' vectors from the shards of their conversation rows' months."""
+        by_period = {}
+        for start in range(0, len(row_ids), 500):
+            chunk = row_ids[start:start + 500]
+            for row_id, period in cursor.execute(
+                    f"SELECT id, substr(timestamp, 1, 7) FROM conversations WHERE id IN ({','.join('?' for _ in chunk)})", chunk).fetchall():
+                by_period.setdefault(period, []).append(row_id)
+        live = set(self.periods(cursor))
+        for period, ids in by_period.items():
+            if period in live:
+                self.shard(period).delete(cursor, ids)
+
+    def insert(self, cursor: sqlite3.Cursor, row_id: int, vector):
+        """Indexes a vector in the shard for its conversation row's month, creating the shard if needed."""
+        row = cursor.execute("SELECT timestamp FROM conversations WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            return
+        period = row[0][:7]
+        shard = self.shard(period)
+        shard.create(cursor)
+        cursor.execute(f"INSERT OR IGNORE INTO {self.registry} (period, table_name) VALUES (?, ?)", (period, shard.table))
+        shard.insert(cursor, row_id, vector)
+
+    def search(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Returns (rowid, L2 distance) for up to top_k nearest vectors, searching recent shards first."""
+        hits = []
+        for period in self.periods(cursor):
+            hits.extend(self.shard(period).search(cursor, query_vector, top_k))
+            if sum(1 for _, distance in hits if distance < self.threshold) >= top_k:
+                break
+        return sorted(hits, key=lambda hit: hit[1])[:top_k]
+
+    def search_many(self, cursor: sqlite3.Cursor, query_vectors: np.ndarray, top_k: int) -> list[list[tuple[int, float]]]:
+        """Runs search for each row of query_vectors."""
+        return [self.search(cursor, query_vector, top_k) for query_vector in query_vectors]
+
+    def sync(self, cursor: sqlite3.Cursor):
+        """Nothing to do: the shards are the durable copy."""
+
+    def vectors(self, cursor: sqlite3.Cursor, after: int = 0):
+        """Yields (rowid, float32 vector) for every row above `after`, oldest shard first."""
+        for period in reversed(self.periods(cursor)):
+            yield from self.shard(period).vectors(cursor, after)
+
+    def rebuild_from(self, conn: sqlite3.Connection, source):
+        """Replaces the shards' contents with the vectors held by `source`, in one transaction."""
+        _restage(conn, self, source)
+
+
+def summary_table(vector_table: str) -> str:
+    """The summary vector table beside a message vector table: vec_summaries, vec_summaries_g2 and so on."""
+    return SUMMARY_TABLE + vector_table[len(VECTOR_TABLE):]
+
+
+def make_index(mode: str = "float", sharding: str = "none", table: str = VECTOR_TABLE, dimension: int = EMBEDDING_DIMENSION):
+    """
+    Builds the vec0 index for a storage mode and sharding scheme ("none" or "monthly").
+    `table` names the vec0 table, or prefixes the shard tables; the original table keeps
+    the original "vector_shards" registry.
+    """
+    if sharding == "monthly":
+        registry = "vector_shards" if table == VECTOR_TABLE else f"{table}_shards"
+        return ShardedIndex(mode, dimension, prefix=table, registry=registry)
+    if sharding != "none":
+        raise ValueError(f"Unknown vector sharding '{sharding}'; expected 'none' or 'monthly'.")
+    return Vec0Index(mode, dimension, table=table)
+
+
+class NumpyIndex:
+    """
+    Searches a memory-mapped copy of a Vec0Index with NumPy matrix products.
+
+    The vec0 table stays the durable copy; every insert is also appended to two flat files,
+    `<path>.<dtype>` (the vectors) and `<path>.<dtype>.ids` (int64 row ids), and any rows missing from
+    them are copied over on open. Readers map the files read-only, so several bashbot
+    processes share one copy of the matrix through the page cache, and remap when they grow.
+    Deleted rows are appended to `<path>.<dtype>.deleted` and masked out of searches until
+    reset() copies vec0 over again.
+
+    Inserts and deletes reach the files only once their transaction commits: wrap the commit in
+    NumpyIndex.committing(conn), and call NumpyIndex.rolled_back(conn) after a rollback, so the
+    files never hold a vector for a row id SQLite may hand out again.
+    """
+
+    # Rows scored per block; bounds the float32 temporaries when the matrix is float16.
+    BLOCK_ROWS = 65536
+
+    # Mirror changes made in transactions that haven't committed yet, by connection:
+    # (index, row ids, vectors) for inserts and (index, row ids, None) for deletes.
+    _uncommitted = {}
+    _uncommitted_lock = threading.Lock()
+
+    def __init__(self, primary, path: str, dtype: str = "float32"):
+        """
+        Args:
+            primary: The Vec0Index or ShardedIndex that is mirrored.
+            path: Path prefix of the matrix and id files.
+            dtype: "float32", or "float16" for half the size and page-cache footprint.
+        """
+        self.primary = primary
+        self.mode = primary.mode
+        self.sharding = primary.sharding
+        self.dimension = primary.dimension
+        self.dtype = np.dtype(dtype)
+        self.matrix_path = f"{path}.{self.dtype.name}"
+        self.ids_path = f"{self.matrix_path}.ids"
+        self.deleted_path = f"{self.matrix_path}.deleted"
+        self._lock = threading.Lock()
+        self._mapped_rows = -1
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, self.dimension), dtype=self.dtype)
+        # Squared row norms, kept in memory and extended as the files grow.
+        self._norms = np.empty(0, dtype=np.float32)
+        self._inode = None
+        # Row ids deleted since the files were written, and which mapped rows they hide.
+        self._deleted = np.empty(0, dtype=np.int64)
+        self._dead = np.zeros(0, dtype=bool)
+
+    def _rows_on_disk(self) -> int:
+        """Complete rows in both files; a torn append by another process is ignored until finished."""
+        if not os.path.exists(self.ids_path) or not os.path.exists(self.matrix_path):
+            return 0
+        return min(os.path.getsize(self.ids_path) // 8, os.path.getsize(self.matrix_path) // (self.dtype.itemsize * self.dimension))
+
+    def _deleted_on_disk(self) -> int:
+        return os.path.getsize(self.deleted_path) // 8 if os.path.exists(self.deleted_path) else 0
+
+    def _refresh(self):
+        """Maps the files again if they grew, or rows were deleted, since they were last mapped."""
+        with self._lock:
+            self._remap()
+
+    def _remap(self):
+        """Does the work of _refresh. Caller must hold the lock."""
+        inode = os.stat(self.ids_path).st_ino if os.path.exists(self.ids_path) else None
+        if inode != self._inode:
+            # Another process's reset() replaced the files, so nothing mapped so far still applies.
+            self._inode = inode
+            self._mapped_rows = -1
+            self._norms = np.empty(0, dtype=np.float32)
+        rows = self._rows_on_disk()
+        deleted = self._deleted_on_disk()
+        if rows == self._mapped_rows and deleted == len(self._deleted):
+            return
+        if deleted != len(self._deleted):
+            self._deleted = np.fromfile(self.deleted_path, dtype=np.int64, count=deleted) if deleted else np.empty(0, dtype=np.int64)
+        if rows != self._mapped_rows:
+            self._map(rows)
+        self._dead = np.isin(self._ids[:rows], self._deleted) if len(self._deleted) and rows else np.zeros(rows, dtype=bool)
+
+    def _map(self, rows: int):
+        """Maps the first `rows` rows of both files and extends the norms to cover them."""
+        if rows:
+            self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+            self._matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(rows, self.dimension))
+        known = len(self._norms) if len(self._norms) <= rows else 0
+        new_norms = [self._norms[:known]]
+        for start in range(known, rows, self.BLOCK_ROWS):
+            block = np.asarray(self._matrix[start:min(start + self.BLOCK_ROWS, rows)], dtype=np.float32)
+            new_norms.append(np.einsum("ij,ij->i", block, block))
+        self._norms = np.concatenate(new_norms)
+        self._mapped_rows = rows
+
+    def _append(self, row_ids: list[int], vectors: np.ndarray):
+        """Appends rows to both files under the ids file's lock."""
+        if not row_ids:
+            return
+        with self._lock, open(self.ids_path, "ab") as ids_file:
+            fcntl.flock(ids_file, fcntl.LOCK_EX)
+            try:
+                self._write_rows(ids_file, row_ids, vectors)
+            finally:
+                fcntl.flock(ids_file, fcntl.LOCK_UN)
+
+    def _write_rows(self, ids_file, row_ids: list[int], vectors: np.ndarray):
+        """Appends rows to both files; the matrix first, so ids never point past it. Caller must hold the ids file's lock."""
+        with open(self.matrix_path, "ab") as matrix_file:
+            matrix_file.write(np.asarray(vectors, dtype=self.dtype).tobytes())
+        ids_file.write(np.asarray(row_ids, dtype=np.int64).tobytes())
+        ids_file.flush()
+
+    def _write_deleted(self, row_ids: list[int]):
+        """Appends row ids to the deleted file, which hides them from every process's searches."""
+        with self._lock, open(self.deleted_path, "ab") as deleted_file:
+            fcntl.flock(deleted_file, fcntl.LOCK_EX)
+            try:
+                deleted_file.write(np.asarray(row_ids, dtype=np.int64).tobytes())
+            finally:
+                deleted_file.flush()
+                fcntl.flock(deleted_file, fcntl.LOCK_UN)
+
+    def _stage(self, cursor: sqlite3.Cursor, row_ids: list[int], vectors: np.ndarray = None):
+        """Holds a change to the files until the cursor's transaction commits."""
+        with NumpyIndex._uncommitted_lock:
+            NumpyIndex._uncommitted.setdefault(cursor.connection, []).append((self, row_ids, vectors))
+
+    @staticmethod
+    @contextmanager
+    def committing(conn: sqlite3.Connection):
+        """
+        Wraps conn.commit(), then writes the mirror changes staged on conn; if the commit raises,
+        they are dropped. The ids files stay locked across the commit, so transactions reach them
+        in commit order and the last id stays the highest, which sync() relies on.
+        """
+        with NumpyIndex._uncommitted_lock:
+            changes = NumpyIndex._uncommitted.pop(conn, [])
+        inserts = [change for change in changes if change[2] is not None]
+        with ExitStack() as stack:
+            locked = {}
+            # One lock per ids file, taken in path order so two processes can't deadlock.
+            for index in sorted({index.ids_path: index for index, _, _ in inserts}.values(), key=lambda index: index.ids_path):
+                stack.enter_context(index._lock)
+                ids_file = stack.enter_context(open(index.ids_path, "ab"))
+                fcntl.flock(ids_file, fcntl.LOCK_EX)
+                stack.callback(fcntl.flock, ids_file, fcntl.LOCK_UN)
+                locked[index.ids_path] = ids_file
+            yield
+            for index, row_ids, vectors in inserts:
+                index._write_rows(locked[index.ids_path], row_ids, vectors)
+        for index, row_ids, vectors in changes:
+            if vectors is None:
+                index._write_deleted(row_ids)
+
+    @staticmethod
+    def rolled_back(conn: sqlite3.Connection):
+        """Drops the mirror changes staged on conn, after conn.rollback()."""
+        with NumpyIndex._uncommitted_lock:
+            NumpyIndex._uncommitted.pop(conn, None)
+
+    def create(self, cursor: sqlite3.Cursor):
+        """Creates the vec0 table and copies over any rows the files don't have yet."""
+        self.primary.create(cursor)
+        self.sync(cursor)
+
+    def sync(self, cursor: sqlite3.Cursor, batch_size: int = 4096):
+        """Appends vec0 rows newer than the last row id in the files."""
+        self._refresh()
+        last_id = int(self._ids[-1]) if self._mapped_rows > 0 else 0
+        row_ids, vectors = [], []
+        for row_id, vector in self.primary.vectors(cursor, after=last_id):
+            row_ids.append(row_id)
+            vectors.append(vector)
+            if len(row_ids) == batch_size:
+                self._append(row_ids, np.stack(vectors))
+                row_ids, vectors = [], []
+        self._append(row_ids, np.stack(vectors) if vectors else None)
+
+    def delete(self, cursor: sqlite3.Cursor, row_ids: list[int]):
+        """
+        Removes these rows from vec0 and, once that commits, records them in the deleted file.
+        The mapped files keep the vectors until reset() rewrites them.
+        """
+        self.primary.delete(cursor, row_ids)
+        if row_ids:
+            self._stage(cursor, list(row_ids))
+
+    def deleted_rows(self) -> int:
+        """Mapped rows hidden by deletes, which reset() would reclaim."""
+        self._refresh()
+        return int(self._dead.sum())
+
+    def insert(self, cursor: sqlite3.Cursor, row_id: int, vector):
+        """Indexes a vector in vec0, and appends it to the mapped matrix once that commits."""
+        vector = np.asarray(vector, dtype=np.float32)
+        self.primary.insert(cursor, row_id, vector)
+        self._stage(cursor, [row_id], vector[np.newaxis])
+
+    def search(self, cursor: sqlite3.Cursor, query_vector: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Returns (rowid, L2 distance) for the top_k nearest vectors, nearest first."""
+        return self.search_many(cursor, np.asarray(query_vector, dtype=np.float32)[np.newaxis], top_k)[0]
+
+    def search_many(self, cursor: sqlite3.Cursor, query_vectors: np.ndarray, top_k: int) -> list[list[tuple[int, float]]]:
+        """
+        Searches several queries in one pass over the matrix.
+        Squared L2 distance is |x|^2 - 2 x.q + |q|^2, so each block costs one matrix product.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        self._refresh()
+        rows = self._mapped_rows
+        if rows <= 0 or top_k <= 0:
+            return [[] for _ in queries]
+
+        best_distances = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, rows, self.BLOCK_ROWS):
+            block = np.asarray(self._matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            distances = self._norms[np.newaxis, start:start + len(block)] - 2.0 * (queries @ block.T)
+            dead = self._dead[start:start + len(block)]
+            if dead.any():
+                distances[:, dead] = np.inf
+            keep = min(top_k, distances.shape[1])
+            candidates = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+            best_distances = np.concatenate([best_distances, np.take_along_axis(distances, candidates, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, candidates + start], axis=1)
+            if best_distances.shape[1] > top_k:
+                trimmed = np.argpartition(best_distances, top_k - 1, axis=1)[:, :top_k]
+                best_distances = np.take_along_axis(best_distances, trimmed, axis=1)
+                best_rows = np.take_along_axis(best_rows, trimmed, axis=1)
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+        best_distances = np.sqrt(np.maximum(best_distances + query_norms, 0.0))
+        order = np.argsort(best_distances, axis=1)
+        results = []
+        for query_rows, query_distances, query_order in zip(best_rows, best_distances, order):
+            results.append([(int(self._ids[query_rows[i]]), float(query_distances[i]))
+                            for i in query_order if np.isfinite(query_distances[i])])
+        return results
+
+    def vectors(self, cursor: sqlite3.Cursor, after: int = 0):
+        """Yields (rowid, float32 vector) from the durable vec0 copy."""
+        return self.primary.vectors(cursor, after)
+
+    def rebuild_from(self, conn: sqlite3.Connection, source):
+        """Rebuilds the vec0 table, then the mapped files from it."""
+        self.primary.rebuild_from(conn, source)
+        self.reset(conn.cursor())
+
+    def reset(self, cursor: sqlite3.Cursor):
+        """Discards the mapped files and copies the primary index over again, after rows left it."""
+        with self._lock:
+            for path in (self.ids_path, self.matrix_path, self.deleted_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._mapped_rows = -1
+            self._norms = np.empty(0, dtype=np.float32)
+            self._deleted = np.empty(0, dtype=np.int64)
+        self.sync(cursor)
+
+# --- Self-contained Test Block ---
+if __name__ == "__main__":
+    import tempfile
+    import sqlite_vec
+
+    print("--- Running Vector Index Test Suite ---")
+    rng = np.random.default_rng(3)
+    dimension = 64
+    data = rng.standard_normal((3000, dimension)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries = data[:20] + 0.1 * rng.standard_normal((20, dimension)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "vectors.db"))
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        cursor = conn.cursor()
+        vec0 = Vec0Index("float", dimension=dimension)
+        vec0.create(cursor)
+        for row_id, vector in enumerate(data[:2000], 1):
+            vec0.insert(cursor, row_id, vector)
+        conn.commit()
+
+        print("\n1. Parity with vec0...")
+        mirror = NumpyIndex(Vec0Index("float", dimension=dimension), os.path.join(tmp, "vectors"))
+        mirror.create(cursor)
+        for row_id, vector in enumerate(data[2000:], 2001):
+            mirror.insert(cursor, row_id, vector)
+        with NumpyIndex.committing(conn):
+            conn.commit()
+        for query in queries:
+            expected = vec0.search(cursor, query, 10)
+            got = mirror.search(cursor, query, 10)
+            assert [row_id for row_id, _ in got] == [row_id for row_id, _ in expected], "Neighbours should match vec0."
+            assert np.allclose([d for _, d in got], [d for _, d in expected], atol=1e-4), "Distances should match vec0."
+        print("  > PASSED: Ids and distances match vec0 for float32, across the synced and appended rows.")
+
+        print("\n2. Batched search and float16...")
+        batched = mirror.search_many(cursor, queries, 10)
+        for batch_result, query in zip(batched, queries):
+            single = mirror.search(cursor, query, 10)
+            assert [r for r, _ in batch_result] == [r for r, _ in single], "Batched and single searches should agree."
+        half = NumpyIndex(Vec0Index("float", dimension=dimension), os.path.join(tmp, "vectors"), dtype="float16")
+        half.create(cursor)
+        overlap = np.mean([len({r for r, _ in a} & {r for r, _ in b}) / 10
+                           for a, b in zip(half.search_many(cursor, queries, 10), batched)])
+        assert overlap >= 0.95, f"float16 should barely change the neighbours (overlap {overlap:.2f})."
+        print(f"  > PASSED: Batched results equal single queries; float16 overlap is {overlap:.2f}.")
+
+        print("\n3. Another reader sees appended rows...")
+        reader = NumpyIndex(Vec0Index("float", dimension=dimension), os.path.join(tmp, "vectors"))
+        assert reader.search(cursor, data[5], 1)[0][0] == 6
+        mirror.insert(cursor, 5000, -data[5])
+        with NumpyIndex.committing(conn):
+            conn.commit()
+        assert reader.search(cursor, -data[5], 1)[0][0] == 5000, "Readers should remap when the files grow."
+        print("  > PASSED: A second index over the same files picked up the new row.")
+
+        print("\n4. Deleted rows are hidden...")
+        mirror.delete(cursor, [5000, 6])
+        with NumpyIndex.committing(conn):
+            conn.commit()
+        assert 5000 not in [r for r, _ in reader.search(cursor, -data[5], 10)], "Other readers should mask deleted rows."
+        assert 6 not in [r for r, _ in mirror.search(cursor, data[5], 10)]
+        assert reader.deleted_rows() == 2
+        mirror.reset(cursor)
+        assert mirror.deleted_rows() == 0 and reader.search(cursor, data[5], 1)[0][0] != 6
+        assert len(mirror.search(cursor, data[5], 5000)) == 2999, "A large top_k should only return live rows."
+        print("  > PASSED: Deletes are masked in every reader until reset() rewrites the files.")
+
+        print("\n5. Rolled-back inserts never reach the files...")
+        mirror.insert(cursor, 6000, data[9])
+        assert reader.search(cursor, data[9], 1)[0][0] == 10, "Uncommitted rows should stay out of the files."
+        conn.rollback()
+        NumpyIndex.rolled_back(conn)
+        # SQLite may hand the row id out again, for another vector.
+        mirror.insert(cursor, 6000, -data[9])
+        with NumpyIndex.committing(conn):
+            conn.commit()
+        assert reader.search(cursor, data[9], 1)[0][0] == 10 and reader.search(cursor, -data[9], 1)[0][0] == 6000
+        assert list(reader._ids).count(6000) == 1
+        print("  > PASSED: Only the committed vector for a reused row id was appended.")
+        conn.close()
+
+    print("\n--- All Tests Complete ---")